@@ -0,0 +1,199 @@
+import argparse
+import os
+import random
+from pathlib import Path
+
+# Synthetic inputs for the benchmark. Every generated file is different (names,
+# helper functions and statement order vary with the seed) so that the response and
+# lint caches do not hide the cost of a run.
+#
+# - shell cohort: <root>/input/all_submissions/sNNNN/shell/wish.c, laid out like a
+#   real cohort, plus a problem statement and rubric
+# - xv6 cohort: <root>/input/xv6_base (the unmodified tree) and
+#   <root>/input/repos/sNNNN/xv6 (a modified copy per student), with a number of
+#   changed hunks per file like a real repo-mode assignment
+#
+# Usage: python benchmark/make_corpus.py shell bench/ --count 100 --lines 400
+
+PROBLEM_STATEMENT = """Write a simple Unix shell called wish. In interactive mode it prints the prompt
+"wish> " and reads commands; in batch mode it reads commands from a file. Support the
+built-in commands exit, cd and path, output redirection with >, and parallel commands
+separated by &. Print the one and only error message on any error.
+"""
+
+RUBRIC = """code_readability: names, comments and function length
+language_convention: idiomatic C, consistent style, no undefined behaviour
+program_design: decomposition into functions, no duplicated logic
+data_structures: appropriate use of arrays, lists and strings
+pointers_memory: correct allocation, freeing and pointer arithmetic
+"""
+
+XV6_RUBRIC = """code_readability: names, comments and function length
+language_convention: follows xv6 kernel conventions
+program_design: changes are minimal and placed in the right subsystem
+pointers_memory: correct locking and no use of freed memory
+"""
+
+NAMES = ['buf', 'line', 'cmd', 'arg', 'tok', 'path', 'dir', 'out', 'pid', 'status', 'len', 'count', 'idx', 'cur', 'next']
+
+def identifier(rng):
+  return rng.choice(NAMES) + rng.choice(['', '_', '2', 's']) + rng.choice(['', 'x', 'y', 'buf', 'len'])
+
+# A plausible C function body of roughly the given number of lines
+def function(rng, name, lines):
+  variables = [identifier(rng) for _ in range(rng.randint(2, 5))]
+  out = [f"static int {name}(char *{variables[0]}, int n)", "{"]
+  for variable in sorted(set(variables[1:])):
+    out.append(f"  int {variable} = 0;")
+  depth = 1
+  while len(out) < lines - 2:
+    indent = '  ' * depth
+    choice = rng.random()
+    if choice < 0.15 and depth < 3:
+      out.append(f"{indent}for (int i = 0; i < n; i++) {{")
+      depth += 1
+    elif choice < 0.25 and depth < 3:
+      out.append(f"{indent}if ({variables[0]}[{rng.randint(0, 9)}] == '{rng.choice('&>| ')}') {{")
+      depth += 1
+    elif choice < 0.35 and depth > 1:
+      depth -= 1
+      out.append('  ' * depth + "}")
+    elif choice < 0.45:
+      out.append(f"{indent}// {rng.choice(['handle', 'skip', 'check', 'copy'])} the {rng.choice(NAMES)}")
+    elif choice < 0.6:
+      out.append(f"{indent}{rng.choice(NAMES)}_{rng.randint(0, 99)} = strlen({variables[0]}) + {rng.randint(1, 9)};")
+    elif choice < 0.7:
+      out.append(f"{indent}if (write(STDERR_FILENO, error_message, strlen(error_message)) < 0) return -1;")
+    else:
+      out.append(f"{indent}n = n {rng.choice('+-*')} {rng.randint(1, 9)};")
+  while depth > 1:
+    depth -= 1
+    out.append('  ' * depth + "}")
+  out.append("  return n;")
+  out.append("}")
+  return out
+
+def wish_program(seed, lines):
+  rng = random.Random(seed)
+  out = [
+    f"// wish.c - submission {seed}",
+    "#include <stdio.h>",
+    "#include <stdlib.h>",
+    "#include <string.h>",
+    "#include <unistd.h>",
+    "#include <fcntl.h>",
+    "#include <sys/wait.h>",
+    "",
+    'char error_message[30] = "An error has occurred\\n";',
+    "",
+  ]
+  helpers = ['parse_line', 'run_builtin', 'redirect', 'execute', 'search_path', 'split_parallel', 'trim', 'read_batch']
+  rng.shuffle(helpers)
+  count = max(2, min(len(helpers), lines // 60))
+  for index, name in enumerate(helpers[:count]):
+    size = max(8, (lines - 30) // count + rng.randint(-10, 10))
+    out.extend(function(rng, f"{name}_{index}", size))
+    out.append("")
+  out.extend([
+    "int main(int argc, char *argv[])",
+    "{",
+    "  char *line = NULL;",
+    "  size_t len = 0;",
+    "  FILE *in = argc > 1 ? fopen(argv[1], \"r\") : stdin;",
+    "  if (in == NULL) {",
+    "    write(STDERR_FILENO, error_message, strlen(error_message));",
+    "    exit(1);",
+    "  }",
+    "  while (1) {",
+    "    if (argc == 1) printf(\"wish> \");",
+    "    if (getline(&line, &len, in) == -1) break;",
+    f"    {helpers[0]}_0(line, (int) strlen(line));",
+    "  }",
+    "  free(line);",
+    "  return 0;",
+    "}",
+  ])
+  return '\n'.join(out) + '\n'
+
+def write(path, text):
+  os.makedirs(Path(path).parent, exist_ok = True)
+  with open(path, 'w') as f:
+    f.write(text)
+
+def make_shell_cohort(root, count, lines, seed = 0):
+  root = Path(root)
+  write(root / 'input' / 'problem_statement.txt', PROBLEM_STATEMENT)
+  write(root / 'input' / 'rubric.txt', RUBRIC)
+  programs = []
+  for index in range(count):
+    path = root / 'input' / 'all_submissions' / f"s{index:04d}" / 'shell' / 'wish.c'
+    write(path, wish_program(seed * 100003 + index, lines))
+    programs.append(path)
+  return programs
+
+# Base xv6-like tree: files of C functions under kernel/ and user/
+def xv6_base(files, lines, seed):
+  rng = random.Random(seed)
+  tree = {}
+  for index in range(files):
+    directory = 'kernel' if index % 3 else 'user'
+    out = ['#include "types.h"', '#include "param.h"', '#include "defs.h"', '']
+    for number in range(max(1, lines // 40)):
+      out.extend(function(rng, f"f{index}_{number}", 40))
+      out.append("")
+    tree[f"{directory}/file{index:03d}.c"] = out
+  tree['kernel/param.h'] = ['#define NPROC 64', '#define NCPU 8', '#define NOFILE 16']
+  return tree
+
+# Student copy: modified_files files get hunks_per_file inserted blocks of hunk_lines lines
+def xv6_student(base, seed, modified_files, hunks_per_file, hunk_lines):
+  rng = random.Random(seed)
+  tree = {name: list(lines) for name, lines in base.items()}
+  sources = sorted(name for name in tree if name.endswith('.c'))
+  for name in rng.sample(sources, min(modified_files, len(sources))):
+    lines = tree[name]
+    for _ in range(hunks_per_file):
+      at = rng.randint(4, len(lines))
+      block = function(rng, f"added_{rng.randint(0, 99999)}", hunk_lines)
+      lines[at:at] = [""] + block
+  return tree
+
+def write_tree(root, tree):
+  for name, lines in tree.items():
+    write(Path(root) / name, '\n'.join(lines) + '\n')
+
+def make_xv6_cohort(root, count, files, lines, modified_files, hunks_per_file, hunk_lines, seed = 0):
+  root = Path(root)
+  write(root / 'input' / 'problem_statement.txt', "Add a system call to xv6 that reports the number of free pages.\n")
+  write(root / 'input' / 'rubric.txt', XV6_RUBRIC)
+  base = xv6_base(files, lines, seed)
+  write_tree(root / 'input' / 'xv6_base', base)
+  repos = []
+  for index in range(count):
+    repo = root / 'input' / 'repos' / f"s{index:04d}" / 'xv6'
+    write_tree(repo, xv6_student(base, seed * 100003 + index, modified_files, hunks_per_file, hunk_lines))
+    repos.append(repo)
+  return root / 'input' / 'xv6_base', repos
+
+def main():
+  parser = argparse.ArgumentParser(description = "Generate a synthetic cohort for benchmarking")
+  parser.add_argument("kind", choices = ["shell", "xv6"])
+  parser.add_argument("root", help = "Directory to create the cohort in")
+  parser.add_argument("--count", type = int, default = 10, help = "Number of submissions")
+  parser.add_argument("--lines", type = int, default = 400, help = "Lines per wish.c / per xv6 file")
+  parser.add_argument("--files", type = int, default = 30, help = "xv6: C files in the base tree")
+  parser.add_argument("--modified-files", type = int, default = 3, help = "xv6: files changed per student")
+  parser.add_argument("--hunks", type = int, default = 2, help = "xv6: changed hunks per modified file")
+  parser.add_argument("--hunk-lines", type = int, default = 20, help = "xv6: lines per hunk")
+  parser.add_argument("--seed", type = int, default = 0)
+  args = parser.parse_args()
+
+  if args.kind == "shell":
+    programs = make_shell_cohort(args.root, args.count, args.lines, args.seed)
+    print(f"Wrote {len(programs)} submissions under {Path(args.root) / 'input' / 'all_submissions'}")
+  else:
+    base, repos = make_xv6_cohort(args.root, args.count, args.files, args.lines, args.modified_files, args.hunks, args.hunk_lines, args.seed)
+    print(f"Wrote base tree {base} and {len(repos)} student repos")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,287 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Local stand-in for the parts of the OpenAI API used by the pipeline, so that
+# throughput can be measured without spending API money. Point the pipeline at it
+# with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+#
+# - POST /v1/responses answers after a configurable latency with a canned response.
+#   Structured requests get a JSON payload for their schema (FeedbackResponse with
+#   annotations on lines that exist in the submission, or Summary); a configurable share of requests
+#   fails with 500 or with 429 (with a retry-after-ms header). With "stream": true the
+#   text is sent as server-sent output_text.delta events spread over the latency.
+# - /v1/files and /v1/batches implement enough of the Batch API for --batch-api runs;
+#   a batch completes BATCH_DELAY seconds after it was created. Requests whose custom_id
+#   matches --batch-fail end up in the batch's error file.
+#
+# Usage: python benchmark/mock_server.py --port 8765 --latency 2.0 --rate-429 0.05
+
+# Characters per output_text.delta event of a streamed response
+STREAM_DELTA_CHARS = 16
+
+LINE_RE = re.compile(r'^(\d+) \| ', re.M)
+
+COMMENTS = [
+  "Check the return value of this call; it can fail and the error is silently ignored.",
+  "This buffer is never freed on the error path, which leaks memory when the command fails.",
+  "Consider splitting this function; it parses, validates and executes in one place.",
+  "The magic number here would be clearer as a named constant.",
+  "Use strtok_r or a local cursor instead of strtok so the parser is re-entrant.",
+]
+
+class MockState:
+
+  def __init__(self, args):
+    self.args = args
+    self.files = {}
+    self.batches = {}
+    self.lock = threading.Lock()
+    self.requests = 0
+
+def new_id(prefix):
+  return f"{prefix}_{uuid.uuid4().hex[:12]}"
+
+def request_text(body):
+  parts = []
+  for message in body.get('input', []):
+    content = message.get('content', '')
+    if isinstance(content, str):
+      parts.append(content)
+    else:
+      parts.extend(part.get('text', '') for part in content if isinstance(part, dict))
+  return '\n'.join(parts)
+
+# Canned, schema-valid FeedbackResponse. Line numbers are taken from the numbered
+# submission in the prompt so that postprocessing places every annotation.
+def feedback_payload(body, args):
+  text = request_text(body)
+  lines = [int(number) for number in LINE_RE.findall(text)] or [1]
+  rng = random.Random(len(text))
+  annotations = []
+  for line_number in sorted(rng.sample(lines, min(args.annotations, len(lines)))):
+    annotations.append({
+      'line_number': line_number,
+      'category': rng.choice(['code_readability', 'program_design', 'pointers_memory']),
+      'comment': rng.choice(COMMENTS),
+      'severity': rng.choice(['suggestion', 'issue']),
+    })
+  summary = {
+    'strengths': "The shell handles built-in commands and redirection with a clear structure.",
+    'areas_for_improvement': "Error handling after system calls and freeing of allocated memory.",
+    'overall_assessment': "A working solution that would benefit from more defensive error handling.",
+  }
+  schema = body.get('text', {}).get('format', {}).get('schema', {})
+  properties = schema.get('properties', {})
+  # A bare Summary schema (e.g. the summary pass over a chunked submission)
+  if 'annotations' not in properties:
+    return {name: summary.get(name, "Canned text.") for name in properties}
+  payload = {'annotations': annotations}
+  if 'summary' in properties:
+    payload['summary'] = summary
+  return payload
+
+def response_body(body, args):
+  if 'text' in body:
+    text = json.dumps(feedback_payload(body, args))
+  else:
+    text = "/*\n * SUMMARY OF REVIEW\n * A working solution.\n */"
+  input_tokens = max(1, len(json.dumps(body.get('input', []))) // 4)
+  cached_tokens = int(input_tokens * args.cached_ratio)
+  output_tokens = max(1, len(text) // 4)
+  return {
+    'id': new_id('resp'),
+    'object': 'response',
+    'created_at': time.time(),
+    'model': body.get('model', 'mock-model'),
+    'status': 'completed',
+    'output': [{
+      'type': 'message',
+      'id': new_id('msg'),
+      'role': 'assistant',
+      'status': 'completed',
+      'content': [{'type': 'output_text', 'text': text, 'annotations': []}],
+    }],
+    'parallel_tool_calls': True,
+    'tool_choice': 'auto',
+    'tools': [],
+    'usage': {
+      'input_tokens': input_tokens,
+      'input_tokens_details': {'cached_tokens': cached_tokens},
+      'output_tokens': output_tokens,
+      'output_tokens_details': {'reasoning_tokens': 0},
+      'total_tokens': input_tokens + output_tokens,
+    },
+  }
+
+class Handler(BaseHTTPRequestHandler):
+
+  protocol_version = "HTTP/1.1"
+  state = None
+
+  def log_message(self, *args):
+    pass
+
+  def send_json(self, status, obj, headers = None):
+    out = obj if isinstance(obj, bytes) else json.dumps(obj).encode()
+    self.send_response(status)
+    self.send_header('content-type', 'application/json')
+    self.send_header('content-length', str(len(out)))
+    for name, value in (headers or {}).items():
+      self.send_header(name, value)
+    self.end_headers()
+    self.wfile.write(out)
+
+  def send_error_json(self, status, message, code, headers = None):
+    self.send_json(status, {'error': {'message': message, 'type': code, 'code': code}}, headers)
+
+  def batch_object(self, batch):
+    failed = batch.get('failed', 0)
+    completed = batch['total'] - failed if batch['status'] == 'completed' else 0
+    return {
+      'id': batch['id'], 'object': 'batch', 'endpoint': '/v1/responses',
+      'input_file_id': batch['input_file_id'], 'completion_window': '24h',
+      'status': batch['status'], 'created_at': int(batch['created']),
+      'output_file_id': batch.get('output_file_id'), 'error_file_id': batch.get('error_file_id'),
+      'request_counts': {'total': batch['total'], 'completed': completed, 'failed': failed},
+    }
+
+  def complete_batch(self, batch):
+    args = self.state.args
+    lines = []
+    errors = []
+    for line in self.state.files[batch['input_file_id']].decode().splitlines():
+      if not line.strip():
+        continue
+      request = json.loads(line)
+      if args.batch_fail and re.search(args.batch_fail, request['custom_id']):
+        errors.append(json.dumps({
+          'id': new_id('batch_req'),
+          'custom_id': request['custom_id'],
+          'response': {'status_code': 500, 'body': {'error': {'message': "The server had an error", 'type': 'server_error'}}},
+          'error': None,
+        }))
+        continue
+      lines.append(json.dumps({
+        'id': new_id('batch_req'),
+        'custom_id': request['custom_id'],
+        'response': {'status_code': 200, 'body': response_body(request['body'], args)},
+        'error': None,
+      }))
+    for key, out in (('output_file_id', lines), ('error_file_id', errors)):
+      if out:
+        file_id = new_id('file')
+        self.state.files[file_id] = '\n'.join(out).encode()
+        batch[key] = file_id
+    batch['failed'] = len(errors)
+    batch['status'] = 'completed'
+
+  def do_GET(self):
+    match = re.match(r'^/v1/batches/([\w-]+)$', self.path)
+    if match:
+      with self.state.lock:
+        batch = self.state.batches.get(match.group(1))
+        if batch is None:
+          return self.send_error_json(404, "No such batch", 'not_found')
+        if batch['status'] == 'in_progress' and time.time() - batch['created'] >= self.state.args.batch_delay:
+          self.complete_batch(batch)
+        return self.send_json(200, self.batch_object(batch))
+
+    match = re.match(r'^/v1/files/([\w-]+)/content$', self.path)
+    if match and match.group(1) in self.state.files:
+      return self.send_json(200, self.state.files[match.group(1)])
+    self.send_error_json(404, f"Unknown path {self.path}", 'not_found')
+
+  def do_POST(self):
+    raw = self.rfile.read(int(self.headers.get('content-length', 0)))
+
+    if self.path == '/v1/files':
+      boundary = self.headers['content-type'].split('boundary=')[1].encode()
+      part = [part for part in raw.split(b'--' + boundary) if b'filename=' in part][0]
+      content = part.split(b'\r\n\r\n', 1)[1].rsplit(b'\r\n', 1)[0]
+      file_id = new_id('file')
+      with self.state.lock:
+        self.state.files[file_id] = content
+      return self.send_json(200, {'id': file_id, 'object': 'file', 'bytes': len(content), 'created_at': int(time.time()),
+                                  'filename': 'batch.jsonl', 'purpose': 'batch', 'status': 'processed'})
+
+    body = json.loads(raw or b'{}')
+    if self.path == '/v1/batches':
+      batch_id = new_id('batch')
+      with self.state.lock:
+        total = len(self.state.files[body['input_file_id']].splitlines())
+        batch = {'id': batch_id, 'input_file_id': body['input_file_id'], 'status': 'in_progress', 'created': time.time(), 'total': total}
+        self.state.batches[batch_id] = batch
+        return self.send_json(200, self.batch_object(batch))
+
+    if self.path != '/v1/responses':
+      return self.send_error_json(404, f"Unknown path {self.path}", 'not_found')
+
+    args = self.state.args
+    with self.state.lock:
+      self.state.requests += 1
+    roll = random.random()
+    if roll < args.rate_429:
+      return self.send_error_json(429, "Rate limit reached", 'rate_limit_exceeded', {'retry-after-ms': str(args.retry_after_ms)})
+    if roll < args.rate_429 + args.error_rate:
+      return self.send_error_json(500, "The server had an error while processing your request", 'server_error')
+
+    latency = max(0.0, random.uniform(args.latency * (1 - args.jitter), args.latency * (1 + args.jitter)))
+    if body.get('stream'):
+      return self.send_stream(response_body(body, args), latency)
+    time.sleep(latency)
+    self.send_json(200, response_body(body, args))
+
+  # Server-sent events of a streamed response: the text in small deltas, spread evenly
+  # over the latency, then response.completed with the usage
+  def send_stream(self, response, latency):
+    self.send_response(200)
+    self.send_header('content-type', 'text/event-stream')
+    self.send_header('connection', 'close')
+    self.end_headers()
+    self.close_connection = True
+    message = response['output'][0]
+    text = message['content'][0]['text']
+    deltas = [text[i:i + STREAM_DELTA_CHARS] for i in range(0, len(text), STREAM_DELTA_CHARS)]
+    for delta in deltas:
+      time.sleep(latency / len(deltas))
+      self.send_event({'type': 'response.output_text.delta', 'item_id': message['id'], 'output_index': 0, 'content_index': 0, 'delta': delta})
+    self.send_event({'type': 'response.completed', 'response': response})
+
+  def send_event(self, event):
+    self.wfile.write(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode())
+    self.wfile.flush()
+
+def parse_args(argv = None):
+  parser = argparse.ArgumentParser(description = "Local stand-in for the OpenAI responses and batch endpoints")
+  parser.add_argument("--host", default = "127.0.0.1")
+  parser.add_argument("--port", type = int, default = 8765)
+  parser.add_argument("--latency", type = float, default = 1.0, help = "Mean seconds per /v1/responses request")
+  parser.add_argument("--jitter", type = float, default = 0.3, help = "Latency varies uniformly by +/- this fraction")
+  parser.add_argument("--error-rate", type = float, default = 0.0, help = "Share of requests failing with 500")
+  parser.add_argument("--rate-429", type = float, default = 0.0, help = "Share of requests failing with 429")
+  parser.add_argument("--retry-after-ms", type = int, default = 500, help = "retry-after-ms header sent with a 429")
+  parser.add_argument("--cached-ratio", type = float, default = 0.5, help = "Share of input tokens reported as cached")
+  parser.add_argument("--annotations", type = int, default = 5, help = "Annotations per canned FeedbackResponse")
+  parser.add_argument("--batch-delay", type = float, default = 2.0, help = "Seconds until a batch completes")
+  parser.add_argument("--batch-fail", default = None, help = "Batch requests whose custom_id matches this regex fail")
+  return parser.parse_args(argv)
+
+class MockServer(ThreadingHTTPServer):
+  # The default listen backlog of 5 refuses connections under concurrent load
+  request_queue_size = 256
+
+def serve(args):
+  Handler.state = MockState(args)
+  server = MockServer((args.host, args.port), Handler)
+  server.daemon_threads = True
+  print(f"Mock OpenAI server listening on http://{args.host}:{server.server_address[1]}/v1", flush = True)
+  server.serve_forever()
+
+if __name__ == "__main__":
+  serve(parse_args())
@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import make_corpus
+
+# Offline throughput benchmark. Starts the mock OpenAI server (mock_server.py),
+# generates a synthetic cohort per run (make_corpus.py) and drives one of the
+# pipeline entry points over it:
+#
+#   run_tool           python run_tool.py                      (concurrent, one process)
+#   run_tool_batch     python run_tool.py --batch-api
+#   generate_feedback  python scripts/generate_feedback.py     (one process per submission)
+#   repo               python scripts/generate_feedback_repo.py (one process for all student repos)
+#
+# For every target and cohort size it reports submissions per minute, p50/p95 latency
+# of the LLM calls and of whole submissions (from the metrics ledger) and the peak
+# resident memory of the pipeline processes.
+#
+# Usage: python benchmark/run_benchmark.py --targets run_tool,generate_feedback --sizes 10,100,1000
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(REPO_ROOT / 'scripts'))
+import metrics
+
+TARGETS = ('run_tool', 'run_tool_batch', 'generate_feedback', 'repo')
+
+def free_port():
+  with socket.socket() as s:
+    s.bind(('127.0.0.1', 0))
+    return s.getsockname()[1]
+
+def start_mock_server(args):
+  port = free_port()
+  command = [sys.executable, str(BENCH_DIR / 'mock_server.py'), '--port', str(port),
+             '--latency', str(args.latency), '--jitter', str(args.jitter),
+             '--error-rate', str(args.error_rate), '--rate-429', str(args.rate_429),
+             '--batch-delay', str(args.batch_delay)]
+  server = subprocess.Popen(command, stdout = subprocess.DEVNULL)
+  deadline = time.monotonic() + 10
+  while time.monotonic() < deadline:
+    try:
+      socket.create_connection(('127.0.0.1', port), timeout = 0.2).close()
+      return server, f"http://127.0.0.1:{port}/v1"
+    except OSError:
+      time.sleep(0.1)
+  server.kill()
+  raise RuntimeError("Mock server did not start")
+
+def environment(base_url, workers, repo_mode):
+  settings = {
+    'OPENAI_BASE_URL': base_url,
+    'OPENAI_API_KEY': 'benchmark',
+    'PROBLEM_STATEMENT': 'input/problem_statement.txt',
+    'RUBRIC': 'input/rubric.txt',
+    # Repo mode grades the annotated copies it writes under intermediates/
+    'INPUT_DIR': 'intermediates/' if repo_mode else 'input',
+    'OUTPUT_DIR': 'output/',
+    'INTER_DIR': 'intermediates/',
+    'MANIFEST': 'intermediates/manifest.sqlite',
+    'METRICS_FILE': 'intermediates/metrics.jsonl',
+    'PROPOSER_REVIEWER': 'o4-mini-2025-04-16',
+    'SUMMARIZER': 'gpt-4.1-2025-04-14',
+    'SUMMARY_MODE': 'local',
+    'WORKERS': str(workers),
+    'BATCH_POLL_INTERVAL': '1',
+    # Measure the cost of the work itself, not of the caches
+    'CACHE_DIR': '',
+    'RATE_LIMIT_RPM': '0',
+    'RATE_LIMIT_TPM': '0',
+  }
+  return settings
+
+def write_config(workspace, settings):
+  with open(workspace / 'config.env', 'w') as f:
+    for name, value in settings.items():
+      f.write(f'{name}="{value}"\n')
+
+# Run one process to completion; returns (exit code, peak RSS in MB)
+def run_process(command, workspace, env, log):
+  process = subprocess.Popen(command, cwd = workspace, env = env, stdout = log, stderr = subprocess.STDOUT)
+  _, status, usage = os.wait4(process.pid, 0)
+  process.returncode = os.waitstatus_to_exitcode(status)
+  # ru_maxrss is in kilobytes on Linux
+  return process.returncode, usage.ru_maxrss / 1024
+
+def run_target(target, count, args, base_url):
+  workspace = Path(args.workdir) / f"{target}-{count}"
+  if workspace.exists():
+    shutil.rmtree(workspace)
+  workspace.mkdir(parents = True)
+
+  repo_mode = target == 'repo'
+  settings = environment(base_url, args.workers, repo_mode)
+  write_config(workspace, settings)
+  env = dict(os.environ, **settings)
+
+  if repo_mode:
+    base, repos = make_corpus.make_xv6_cohort(workspace, count, args.files, args.lines, args.modified_files, args.hunks, args.hunk_lines)
+    commands = [[sys.executable, str(REPO_ROOT / 'scripts' / 'generate_feedback_repo.py'), str(base.relative_to(workspace))]
+                + [str(repo.relative_to(workspace)) for repo in repos]]
+  else:
+    programs = make_corpus.make_shell_cohort(workspace, count, args.lines)
+    if target == 'generate_feedback':
+      commands = [[sys.executable, str(REPO_ROOT / 'scripts' / 'generate_feedback.py'), str(program.relative_to(workspace))]
+                  for program in programs]
+    else:
+      commands = [[sys.executable, str(REPO_ROOT / 'run_tool.py')] + (['--batch-api'] if target == 'run_tool_batch' else [])]
+
+  failures = 0
+  peak_mb = 0.0
+  start = time.perf_counter()
+  with open(workspace / 'benchmark.log', 'w') as log:
+    for command in commands:
+      code, rss_mb = run_process(command, workspace, env, log)
+      failures += code != 0
+      peak_mb = max(peak_mb, rss_mb)
+  elapsed = time.perf_counter() - start
+
+  return summarize(target, count, elapsed, peak_mb, failures, workspace / settings['METRICS_FILE'])
+
+# Latency of each submission: from the start of its first call to the end of its last
+def submission_latencies(entries):
+  spans = {}
+  for entry in entries:
+    if not entry.get('submission'):
+      continue
+    begin, end = entry['time'] - entry['latency'], entry['time']
+    first, last = spans.get(entry['submission'], (begin, end))
+    spans[entry['submission']] = (min(first, begin), max(last, end))
+  return [end - begin for begin, end in spans.values()]
+
+# Time to first feedback of each submission: from the start of its first call until the
+# first reviewed annotation was available (the end of its last reviewer call, unless the
+# reviewer response was streamed)
+def first_feedback_latencies(entries):
+  begins = {}
+  ready = {}
+  for entry in entries:
+    submission = entry.get('submission')
+    if not submission:
+      continue
+    begin = entry['time'] - entry['latency']
+    begins[submission] = min(begins.get(submission, begin), begin)
+    if entry['stage'] == 'Reviewer':
+      available = begin + entry['first_item'] if entry.get('first_item') is not None else entry['time']
+      ready[submission] = max(ready.get(submission, available), available)
+  return [ready[submission] - begins[submission] for submission in ready]
+
+def summarize(target, count, elapsed, peak_mb, failures, ledger):
+  entries = metrics.load(ledger) if ledger.exists() else []
+  calls = [entry for entry in entries if entry['kind'] == 'llm' and entry.get('status') == 'ok']
+  call_latencies = [entry['latency'] for entry in calls]
+  llm_entries = [entry for entry in entries if entry['kind'] == 'llm']
+  submissions = submission_latencies(llm_entries)
+  first_feedback = first_feedback_latencies(llm_entries)
+  return {
+    'target': target,
+    'submissions': count,
+    'seconds': round(elapsed, 2),
+    'submissions_per_minute': round(count / elapsed * 60, 1) if elapsed else 0.0,
+    'llm_calls': len(calls),
+    'llm_errors': len(llm_entries) - len(calls),
+    'call_p50': round(metrics.percentile(call_latencies, 50), 3),
+    'call_p95': round(metrics.percentile(call_latencies, 95), 3),
+    'submission_p50': round(metrics.percentile(submissions, 50), 3),
+    'submission_p95': round(metrics.percentile(submissions, 95), 3),
+    'first_feedback_p50': round(metrics.percentile(first_feedback, 50), 3),
+    'peak_rss_mb': round(peak_mb, 1),
+    'failed_processes': failures,
+  }
+
+def format_results(results):
+  header = f"{'target':<18} {'N':>5} {'seconds':>8} {'subs/min':>9} {'calls':>6} {'err':>4} {'call p50':>9} {'call p95':>9} {'sub p50':>8} {'sub p95':>8} {'first p50':>9} {'peak MB':>8} {'failed':>6}"
+  lines = [header, '-' * len(header)]
+  for r in results:
+    lines.append(f"{r['target']:<18} {r['submissions']:>5} {r['seconds']:>8.1f} {r['submissions_per_minute']:>9.1f} {r['llm_calls']:>6} {r['llm_errors']:>4} "
+                 f"{r['call_p50']:>9.2f} {r['call_p95']:>9.2f} {r['submission_p50']:>8.2f} {r['submission_p95']:>8.2f} {r['first_feedback_p50']:>9.2f} {r['peak_rss_mb']:>8.1f} {r['failed_processes']:>6}")
+  return '\n'.join(lines)
+
+def main():
+  parser = argparse.ArgumentParser(description = "Measure pipeline throughput against a local mock OpenAI server")
+  parser.add_argument("--targets", default = "run_tool", help = f"Comma-separated subset of {', '.join(TARGETS)}")
+  parser.add_argument("--sizes", default = "10,100", help = "Comma-separated cohort sizes, e.g. 10,100,1000")
+  parser.add_argument("--workdir", default = "bench", help = "Scratch directory for the generated cohorts")
+  parser.add_argument("--output", default = None, help = "Write the results as JSON to this file")
+  parser.add_argument("--workers", type = int, default = 8, help = "WORKERS for run_tool.py")
+  parser.add_argument("--lines", type = int, default = 400, help = "Lines per wish.c / per xv6 file")
+  parser.add_argument("--files", type = int, default = 30, help = "xv6: C files in the base tree")
+  parser.add_argument("--modified-files", type = int, default = 3, help = "xv6: files changed per student")
+  parser.add_argument("--hunks", type = int, default = 2, help = "xv6: changed hunks per modified file")
+  parser.add_argument("--hunk-lines", type = int, default = 20, help = "xv6: lines per hunk")
+  parser.add_argument("--latency", type = float, default = 1.0, help = "Mock server: mean seconds per request")
+  parser.add_argument("--jitter", type = float, default = 0.3, help = "Mock server: latency varies by +/- this fraction")
+  parser.add_argument("--error-rate", type = float, default = 0.0, help = "Mock server: share of requests failing with 500")
+  parser.add_argument("--rate-429", type = float, default = 0.0, help = "Mock server: share of requests failing with 429")
+  parser.add_argument("--batch-delay", type = float, default = 2.0, help = "Mock server: seconds until a batch completes")
+  args = parser.parse_args()
+
+  targets = [target.strip() for target in args.targets.split(',') if target.strip()]
+  unknown = [target for target in targets if target not in TARGETS]
+  if unknown:
+    parser.error(f"Unknown targets {unknown}; choose from {', '.join(TARGETS)}")
+  sizes = [int(size) for size in args.sizes.split(',')]
+
+  server, base_url = start_mock_server(args)
+  results = []
+  try:
+    for target in targets:
+      for count in sizes:
+        print(f"Running {target} on {count} submissions...", flush = True)
+        results.append(run_target(target, count, args, base_url))
+        print(format_results(results[-1:]).splitlines()[-1], flush = True)
+  finally:
+    server.terminate()
+    server.wait()
+
+  print()
+  print(format_results(results))
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(results, f, indent = 2)
+
+if __name__ == "__main__":
+  main()
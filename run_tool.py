@@ -1,5 +1,11 @@
 import os
-import subprocess
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 from pathlib import Path
 import shutil
@@ -19,22 +25,390 @@ INPUT_DIR = os.getenv('INPUT_DIR')
 # MODIFY: based on your input directory structure
 INPUT_DIR = Path(INPUT_DIR) / 'all_submissions'
 
-def main():
-    # Process each folder in submissions directory
-    for folder_name in os.listdir(INPUT_DIR):
-        folder_path = os.path.join(INPUT_DIR, folder_name)
-    
-        if os.path.isdir(folder_path):
-            # MODIFY: based on your input directory structure
-            program_path = os.path.join(folder_path, 'shell', 'wish.c')
-    
+# Number of submissions processed concurrently; the work is dominated by
+# waiting on the API, so this can be much larger than the number of cores
+WORKERS = int(os.getenv('WORKERS', '8'))
+
+# Cross-submission de-duplication (see scripts/dedup.py): identical submissions share one
+# review, and functions found unchanged in at least SHARED_FUNCTION_MIN submissions are
+# reviewed once (0 disables this part)
+DEDUP = os.getenv('DEDUP', '1') != '0'
+SHARED_FUNCTION_MIN = int(os.getenv('SHARED_FUNCTION_MIN', '3'))
+
+# Ledger of completed stages per submission, used to skip or resume work on reruns
+MANIFEST = os.getenv('MANIFEST', str(Path(os.getenv('INTER_DIR', 'intermediates')) / 'manifest.sqlite'))
+
+# Worker mode (--serve): job queue shared with --submit, status file rewritten every
+# WORKER_POLL seconds, and how often --watch rescans the submissions directory
+JOB_QUEUE = os.getenv('JOB_QUEUE', str(Path(os.getenv('INTER_DIR', 'intermediates')) / 'jobs.sqlite'))
+WORKER_STATUS = os.getenv('WORKER_STATUS', str(Path(os.getenv('INTER_DIR', 'intermediates')) / 'worker_status.json'))
+WORKER_POLL = float(os.getenv('WORKER_POLL', '1'))
+
+# Where a sharded run (--shard i/N) records its share of the cohort for `sharding.py merge`
+INTER_DIR = os.getenv('INTER_DIR', 'intermediates')
+
+# Timeline written by --profile without a path (see scripts/tracing.py)
+PROFILE = str(Path(INTER_DIR) / 'trace.json')
+
+# The pipeline is imported once so that every submission shares the same
+# OpenAI client (and its connection pool) instead of starting a new process
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'scripts'))
+import generate_feedback
+import batch_api
+import dedup
+import linter
+import llm
+import job_queue
+import manifest
+import metrics
+import pipeline
+import preflight
+import sharding
+import tracing
+
+def collect_submissions(submissions_dir, quiet = False):
+    programs = []
+    for folder_name in sorted(os.listdir(submissions_dir)):
+        folder_path = os.path.join(submissions_dir, folder_name)
+        if not os.path.isdir(folder_path):
+            continue
+
+        # MODIFY: based on your input directory structure
+        program_path = os.path.join(folder_path, 'shell', 'wish.c')
         if os.path.isfile(program_path):
-            print(f"Processing: {program_path}")
-            subprocess.run(['python3', 'scripts/generate_feedback.py', program_path])
-        else:
+            programs.append(Path(program_path))
+        elif not quiet:
             print(f"Skipping {folder_path}: program file not found")
-    
-    print("Processing complete!")
+    return programs
+
+# Returns the elapsed time, the time until the first reviewed annotation arrived (only
+# known with STREAM=1) and the final feedback
+def process_submission(program_path, problem_statement, rubric, checkpoint, elided = (), shared_annotations = ()):
+    start = time.perf_counter()
+    first = []
+
+    def on_annotation(stage, annotation):
+        if stage == "Reviewer" and not first:
+            first.append(time.perf_counter() - start)
+
+    with tracing.span('submission', submission = program_path):
+        feedback = generate_feedback.generate_feedback(program_path, problem_statement, rubric, checkpoint, elided, shared_annotations, on_annotation)
+    return time.perf_counter() - start, first[0] if first else None, feedback
+
+def reuse_submission(program_path, feedback, checkpoint):
+    start = time.perf_counter()
+    with tracing.span('reuse', submission = program_path):
+        generate_feedback.reuse_feedback(program_path, feedback, checkpoint)
+    return time.perf_counter() - start, None, feedback
+
+# Run submissions through the synchronous pipeline; returns those that failed
+def process_chunked(programs, problem_statement, rubric, checkpoints, workers):
+    failures = []
+    with ThreadPoolExecutor(max_workers = workers, thread_name_prefix = "worker") as executor:
+        futures = {executor.submit(process_submission, program_path, problem_statement, rubric, checkpoints[program_path]): program_path
+                   for program_path in programs}
+        for future in as_completed(futures):
+            program_path = futures[future]
+            try:
+                elapsed, _, _ = future.result()
+                print(f"Done: {program_path} ({elapsed:.1f}s)")
+            except Exception as e:
+                failures.append(program_path)
+                print(f"Failed: {program_path}: {e}")
+    return failures
+
+# Analyze the cohort for duplicates and review the shared functions once. Returns the
+# cohort and, per submission, the shared functions to leave out of its prompt and their
+# annotations remapped to its lines.
+def prepare_dedup(programs, problem_statement, rubric, workers):
+    cohort = dedup.analyze(programs, SHARED_FUNCTION_MIN)
+    shared_work = {}
+    if cohort.shared:
+        print(f"Reviewing {len(cohort.shared)} functions shared by at least {SHARED_FUNCTION_MIN} submissions once")
+        reviews = generate_feedback.review_shared_functions(cohort, problem_statement, rubric, workers)
+        for program_path in programs:
+            if program_path in cohort.leader:
+                continue
+            elided, annotations = [], []
+            for shared, function in cohort.shared_in(program_path):
+                if shared.key in reviews:
+                    elided.append(function)
+                    annotations.extend(shared.remap_to(function, reviews[shared.key]))
+            shared_work[program_path] = (elided, annotations)
+    if cohort.leader:
+        print(f"{len(cohort.leader)} submissions are duplicates of another submission and reuse its feedback")
+    return cohort, shared_work
+
+# Returns the checkpoint of every submission and the submissions that still need work
+def load_checkpoints(programs, problem_statement, rubric, force):
+    run_manifest = manifest.RunManifest(MANIFEST)
+    fingerprint = generate_feedback.config_fingerprint(problem_statement, rubric)
+    checkpoints = {program_path: run_manifest.checkpoint(program_path, fingerprint) for program_path in programs}
+    if force:
+        for checkpoint in checkpoints.values():
+            checkpoint.restart()
+        return checkpoints, programs
+
+    pending = []
+    for program_path in programs:
+        stage = checkpoints[program_path].next_stage(generate_feedback.stage_artifacts(program_path))
+        if stage == manifest.DONE:
+            continue
+        if stage != manifest.STAGES[0]:
+            print(f"Resuming {program_path} from {stage}")
+        pending.append(program_path)
+    if len(pending) < len(programs):
+        print(f"Skipping {len(programs) - len(pending)} submissions that are up to date")
+    return checkpoints, pending
+
+# Estimate every submission's calls before any is made (see scripts/preflight.py).
+# Submissions with a prompt too large to send fail here; the others are returned
+# longest-first, and the predicted cost and duration of the run are printed.
+def run_preflight(programs, problem_statement, rubric, checkpoints, workers, batch):
+    history = preflight.History.from_ledger()
+    estimates = [generate_feedback.estimate_calls(program_path, problem_statement, rubric) for program_path in programs]
+    oversize = []
+    for estimate in estimates:
+        if estimate.oversize:
+            print(f"Too large to send: {estimate.submission}: {estimate.oversize}")
+            checkpoints[estimate.submission].failed(estimate.oversize)
+            oversize.append(estimate.submission)
+    estimates = preflight.longest_first([estimate for estimate in estimates if not estimate.oversize], history)
+    preflight.report(preflight.predict(estimates, history, workers, llm.EXPECTED_OUTPUT_TOKENS, batch), workers, batch)
+    return [estimate.submission for estimate in estimates], oversize
+
+# Problem statement and rubric for the worker, re-read when either file changes
+class SharedInputs:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.mtimes = None
+        self.inputs = None
+
+    def get(self):
+        paths = (generate_feedback.PROBLEM_STATEMENT, generate_feedback.RUBRIC)
+        mtimes = tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in paths)
+        with self.lock:
+            if mtimes != self.mtimes:
+                self.inputs = generate_feedback.load_shared_inputs()
+                self.mtimes = mtimes
+            return self.inputs
+
+# Grade one queued submission. A resubmission whose content was already graded with the
+# same configuration is skipped by its manifest checkpoint.
+def run_job(job, inputs, run_manifest):
+    problem_statement, rubric = inputs.get()
+    checkpoint = run_manifest.checkpoint(job.path, generate_feedback.config_fingerprint(problem_statement, rubric))
+    return process_submission(job.path, problem_statement, rubric, checkpoint)
+
+def write_status(queue, workers, started):
+    status = dict(queue.status(), workers = workers, pid = os.getpid(), started = started,
+                  updated = time.strftime('%Y-%m-%dT%H:%M:%S'))
+    tmp = f"{WORKER_STATUS}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(status, f, indent = 2)
+    os.replace(tmp, WORKER_STATUS)
+
+# Push submissions whose program file is new or modified since the last scan
+def watch_submissions(queue, submissions_dir, seen):
+    for program_path in collect_submissions(submissions_dir, quiet = True):
+        mtime = os.path.getmtime(program_path)
+        if seen.get(program_path) != mtime:
+            seen[program_path] = mtime
+            queue.push(program_path)
+
+# Long-running worker: grade submissions as they are pushed onto the job queue (with
+# --submit, or found new or changed under --watch), up to `workers` at a time. The API
+# client, response and lint caches, problem statement and rubric stay loaded between
+# jobs. The queue depth, running jobs and per-job latency are written to WORKER_STATUS.
+# SIGINT/SIGTERM stop taking jobs and wait for the running ones.
+def serve(args):
+    queue = job_queue.JobQueue(JOB_QUEUE)
+    recovered = queue.recover()
+    if recovered:
+        print(f"Re-queued {recovered} jobs left running by an earlier worker")
+    run_manifest = manifest.RunManifest(MANIFEST)
+    inputs = SharedInputs()
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+    started = time.strftime('%Y-%m-%dT%H:%M:%S')
+    seen = {}
+    running = {}
+    print(f"Worker serving {JOB_QUEUE} with {args.workers} workers (status in {WORKER_STATUS})", flush = True)
+    with ThreadPoolExecutor(max_workers = args.workers, thread_name_prefix = "worker") as executor:
+        while running or not stop.is_set():
+            if args.watch and not stop.is_set():
+                watch_submissions(queue, args.submissions_dir, seen)
+            while not stop.is_set() and len(running) < args.workers:
+                job = queue.claim()
+                if job is None:
+                    break
+                running[executor.submit(run_job, job, inputs, run_manifest)] = job
+
+            if running:
+                finished, _ = wait(running, timeout = WORKER_POLL, return_when = FIRST_COMPLETED)
+            else:
+                finished = set()
+                stop.wait(WORKER_POLL)
+            for future in finished:
+                job = running.pop(future)
+                try:
+                    elapsed, first, feedback = future.result()
+                    queue.finish(job)
+                    result = "Up to date" if feedback is None else "Done"
+                    print(f"{result}: {job.path} ({time.time() - job.submitted:.1f}s since submitted, {elapsed:.1f}s grading)", flush = True)
+                except Exception as e:
+                    queue.finish(job, e)
+                    print(f"Failed: {job.path}: {e}", flush = True)
+            write_status(queue, args.workers, started)
+
+    pipeline.audit.flush()
+    if args.profile:
+        tracing.write(args.profile)
+    print("Worker stopped")
+
+# Push submissions (program files or submission folders) onto the worker's queue
+def submit(paths):
+    queue = job_queue.JobQueue(JOB_QUEUE)
+    programs = []
+    # Paths are kept relative to the working directory, like those of a cohort run
+    for path in (Path(os.path.relpath(path)) for path in paths):
+        # MODIFY: based on your input directory structure
+        if (path / 'shell' / 'wish.c').is_file():
+            programs.append(path / 'shell' / 'wish.c')
+        elif path.is_dir():
+            programs.extend(collect_submissions(path))
+        else:
+            programs.append(path)
+    queued = 0
+    for program_path in programs:
+        job_id, new = queue.push(program_path)
+        queued += new
+        print(f"{'Queued' if new else 'Already queued or graded'}: {program_path} (job {job_id})")
+    print(f"{queued} new jobs; queue depth {queue.status()['queue_depth']}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--submissions-dir", default = INPUT_DIR, help = "Directory with one folder per submission")
+    parser.add_argument("--workers", type = int, default = WORKERS, help = "Number of submissions processed concurrently")
+    parser.add_argument("--batch-api", action = "store_true", help = "Submit each stage for the whole cohort through the OpenAI Batch API")
+    parser.add_argument("--force", action = "store_true", help = "Reprocess every submission, ignoring the run manifest")
+    parser.add_argument("--serve", action = "store_true", help = "Run as a long-lived worker that grades submissions pushed onto the job queue")
+    parser.add_argument("--watch", action = "store_true", help = "With --serve, queue submissions under --submissions-dir that are new or modified")
+    parser.add_argument("--submit", nargs = "+", metavar = "PATH", help = "Push program files or submission folders onto the worker's job queue")
+    parser.add_argument("--status", action = "store_true", help = "Print the worker's queue depth, running jobs and latencies")
+    parser.add_argument("--shard", type = sharding.parse_shard, metavar = "i/N", help = "Grade only the i-th of N balanced shards of the submissions")
+    parser.add_argument("--profile", nargs = "?", const = PROFILE, metavar = "PATH", help = f"Write a Chrome/Perfetto timeline of the run (default: {PROFILE})")
+    args = parser.parse_args()
+    if args.shard and args.serve:
+        parser.error("--shard cannot be used with --serve")
+
+    if args.submit:
+        submit(args.submit)
+        return
+    if args.status:
+        print(json.dumps(job_queue.JobQueue(JOB_QUEUE).status(), indent = 2))
+        return
+
+    if args.profile:
+        tracing.enable()
+    # Calls in the metrics ledger are grouped by the cohort they were made for
+    metrics.set_cohort(os.getenv('COHORT') or args.submissions_dir)
+    if args.serve:
+        serve(args)
+        return
+    programs = collect_submissions(args.submissions_dir)
+    if args.shard:
+        programs = sharding.select(programs, args.shard, sharding.file_tokens, INTER_DIR,
+                                   name = lambda program_path: os.path.relpath(program_path, args.submissions_dir))
+    problem_statement, rubric = generate_feedback.load_shared_inputs()
+    checkpoints, programs = load_checkpoints(programs, problem_statement, rubric, args.force)
+
+    # clang-tidy is CPU-bound and only depends on the source files, so the whole
+    # cohort is linted up front on a process pool, off the per-submission critical path
+    linter.lint_cohort(programs)
+    with tracing.span('preflight'):
+        programs, oversize = run_preflight(programs, problem_statement, rubric, checkpoints, args.workers, args.batch_api)
+
+    if args.batch_api:
+        # A batch request carries the whole submission; submissions large enough to be
+        # chunked go through the pipeline instead, so that they get the same prompts
+        chunked = [program_path for program_path in programs if generate_feedback.split_input(program_path)]
+        batched = [program_path for program_path in programs if program_path not in chunked]
+        print(f"Processing {len(batched)} submissions through the Batch API")
+        failures = oversize + list(batch_api.run_batch(batched, problem_statement, rubric, checkpoints))
+        if chunked:
+            print(f"The Batch API cannot chunk submissions over CHUNK_MAX_TOKENS ({generate_feedback.CHUNK_MAX_TOKENS}); "
+                  f"processing {len(chunked)} of them with {args.workers} workers")
+            failures.extend(process_chunked(chunked, problem_statement, rubric, checkpoints, args.workers))
+        finish_run(args, failures)
+        report(len(programs) + len(oversize), sorted(failures))
+        return
+
+    start = time.perf_counter()
+    with tracing.span('dedup'):
+        cohort, shared_work = prepare_dedup(programs, problem_statement, rubric, args.workers) if DEDUP else (None, {})
+
+    print(f"Processing {len(programs)} submissions with {args.workers} workers, longest first")
+    failures = list(oversize)
+    done = 0
+    with ThreadPoolExecutor(max_workers = args.workers, thread_name_prefix = "worker") as executor:
+        # Duplicates are started once the submission they copy has its feedback
+        futures = {executor.submit(process_submission, program_path, problem_statement, rubric, checkpoints[program_path],
+                                   *shared_work.get(program_path, ((), ()))): program_path
+                   for program_path in programs if not (cohort and program_path in cohort.leader)}
+        while futures:
+            finished, _ = wait(futures, return_when = FIRST_COMPLETED)
+            for future in finished:
+                program_path = futures.pop(future)
+                done += 1
+                followers = cohort.followers(program_path) if cohort else []
+                try:
+                    elapsed, first, feedback = future.result()
+                    first = f", first feedback after {first:.1f}s" if first is not None else ""
+                    print(f"[{done}/{len(programs)}] Done: {program_path} ({elapsed:.1f}s{first})")
+                except Exception as e:
+                    failures.append(program_path)
+                    print(f"[{done}/{len(programs)}] Failed: {program_path}: {e}")
+                    feedback = None
+                for follower in followers:
+                    if feedback is not None:
+                        remapped = feedback.model_copy(update = {'annotations':
+                            cohort.submissions[follower].remap_from(cohort.submissions[program_path], feedback.annotations)})
+                        futures[executor.submit(reuse_submission, follower, remapped, checkpoints[follower])] = follower
+                    else:
+                        futures[executor.submit(process_submission, follower, problem_statement, rubric, checkpoints[follower])] = follower
+
+    elapsed = time.perf_counter() - start
+    finish_run(args, failures)
+    report(len(programs) + len(oversize), failures, elapsed)
+
+# Record the shard's result and write the timeline, once every file is on disk
+def finish_run(args, failures):
+    pipeline.audit.flush()
+    if args.shard:
+        sharding.record_result(INTER_DIR, [os.path.relpath(program_path, args.submissions_dir) for program_path in failures])
+    if args.profile:
+        tracing.write(args.profile)
+
+def report(total, failures, elapsed = None):
+    # Intermediate files are written in the background; make sure they are on disk
+    pipeline.audit.flush()
+    timing = f" in {elapsed:.1f}s" if elapsed is not None else ""
+    print(f"Processing complete! {total - len(failures)} succeeded, {len(failures)} failed{timing}")
+    print(llm.usage_report())
+    print(llm.get_scheduler().stats())
+    cache = llm.get_cache()
+    if cache:
+        print(cache.stats())
+    if metrics.ledger_path():
+        print(f"Per-call metrics appended to {metrics.ledger_path()} (summarize with: python scripts/metrics.py report)")
+    for program_path in failures:
+        print(f"  failed: {program_path}")
+    if failures:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -2,15 +2,6 @@
 
 source config.env
 
-for folder in "$SUBMISSIONS_DIR"/*; do
-    if [ -d "$folder" ]; then
-        if [ -f "$folder/shell/wish.c" ]; then
-            echo "Processing: $folder/shell/wish.c"
-            python3 scripts/generate_feedback.py "$folder/shell/wish.c"
-        else
-            echo "Skipping $folder: shell/wish.c not found"
-        fi
-    fi
-done
-
-echo "Processing complete!"
\ No newline at end of file
+# All submissions are processed in a single process with a pool of workers;
+# set WORKERS in config.env (or pass --workers N) to control concurrency
+python3 run_tool.py --submissions-dir "$SUBMISSIONS_DIR" "$@"
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from openai.types.responses import Response
+
+import generate_feedback as gf
+import linter
+import llm
+import manifest
+import metrics
+from llm_cache import CachedResponse
+
+# Offline grading through the OpenAI Batch API. Each stage (proposer, reviewer and,
+# with SUMMARY_MODE=llm, summarizer) writes one request per submission to a JSONL file, submits it as a
+# single batch, polls until the batch finishes and then fans the responses back
+# out to the same per-submission files the synchronous pipeline writes. Batches
+# are billed at roughly half the synchronous price and are not subject to the
+# per-minute rate limits. Requests already in the response cache are answered
+# locally and left out of the batch. Set OPENAI_BASE_URL to point at a local stand-in
+# server for testing.
+#
+# A request carries the whole numbered submission: there is no function-level chunking
+# (chunking.py) here, so run_tool.py sends submissions over CHUNK_MAX_TOKENS through the
+# synchronous pipeline instead of the batch.
+
+BATCH_DIR = Path(gf.INTER_DIR) / 'batches'
+POLL_INTERVAL = int(os.getenv('BATCH_POLL_INTERVAL', '60'))
+COMPLETION_WINDOW = "24h"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# ===================== BATCH FILES ================================
+
+# Returns the batch request line together with its response cache key
+def batch_request(custom_id, model, input, text_format = None):
+  body = {"model": model, "input": input}
+  if text_format is not None:
+    body["text"] = llm.text_format_param(text_format)
+  request = {"custom_id": custom_id, "method": "POST", "url": "/v1/responses", "body": body}
+  return request, llm.cache_key(model, input, text_format)
+
+# Written to a tmp file and renamed, so that a killed run never leaves a truncated file
+# for the resume to trust
+def write_json_atomic(path, obj):
+  tmp = Path(f"{path}.{os.getpid()}.tmp")
+  with open(tmp, 'w') as f:
+    json.dump(obj, f, indent = 4, ensure_ascii=False)
+  os.replace(tmp, path)
+
+def write_batch_file(stage, requests):
+  os.makedirs(BATCH_DIR, exist_ok = True)
+  batch_file = BATCH_DIR / f"{stage}.jsonl"
+  with open(batch_file, 'w') as f:
+    for request in requests:
+      f.write(json.dumps(request, ensure_ascii=False) + "\n")
+  return batch_file
+
+def file_digest(path):
+  with open(path, 'rb') as f:
+    return hashlib.sha256(f.read()).hexdigest()
+
+# Upload the batch file and create the batch. The batch id is saved next to the
+# batch file, with a digest of the requests it holds, so that a crashed or interrupted
+# run resumes polling the same batch instead of paying for it twice. A saved batch for
+# other requests (submissions added or edited since) is not resumed.
+def submit_batch(stage, batch_file):
+  state_file = BATCH_DIR / f"{stage}_batch.json"
+  digest = file_digest(batch_file)
+  if state_file.exists():
+    with open(state_file, 'r') as f:
+      state = json.load(f)
+    if state.get('requests') == digest:
+      print(f"Resuming {stage} batch {state['id']}")
+      return state['id']
+    print(f"Not resuming {stage} batch {state['id']}: it was submitted for other requests")
+
+  with open(batch_file, 'rb') as f:
+    uploaded = llm.get_client().files.create(file = f, purpose = "batch")
+  batch = llm.get_client().batches.create(
+    input_file_id = uploaded.id,
+    endpoint = "/v1/responses",
+    completion_window = COMPLETION_WINDOW,
+  )
+  write_json_atomic(state_file, {"id": batch.id, "input_file_id": uploaded.id, "requests": digest})
+  print(f"Submitted {stage} batch {batch.id}")
+  return batch.id
+
+def wait_for_batch(batch_id):
+  while True:
+    batch = llm.get_client().batches.retrieve(batch_id)
+    counts = batch.request_counts
+    if counts is not None:
+      print(f"Batch {batch_id}: {batch.status} ({counts.completed}/{counts.total} completed, {counts.failed} failed)")
+    if batch.status in TERMINAL_STATUSES:
+      return batch
+    time.sleep(POLL_INTERVAL)
+
+# Map custom_id to the Response of each successful request, or to an error string
+def batch_results(batch):
+  results = {}
+  for file_id in (batch.output_file_id, batch.error_file_id):
+    if not file_id:
+      continue
+    for line in llm.get_client().files.content(file_id).text.splitlines():
+      if not line.strip():
+        continue
+      record = json.loads(line)
+      response = record.get("response") or {}
+      if response.get("status_code") == 200:
+        results[record["custom_id"]] = Response.model_validate(response["body"])
+      else:
+        results[record["custom_id"]] = f"Batch request error: {record.get('error') or response.get('body')}"
+  return results
+
+# Run one stage as a batch. handle(input_filename, response) writes the outputs of a
+# successful request; the set of submissions that failed in this stage is returned.
+# Each request is recorded in the metrics ledger with the batch turnaround as its latency.
+def run_stage(stage, requests, handle):
+  cache = llm.get_cache()
+  failed = set()
+
+  pending = {}
+  for custom_id, (request, key) in requests.items():
+    entry = cache.get(key) if cache else None
+    if entry is not None:
+      fan_out(stage, custom_id, CachedResponse(entry), handle, failed, 0.0)
+    else:
+      pending[custom_id] = (request, key)
+
+  if not pending:
+    return failed
+
+  start = time.perf_counter()
+  batch_file = write_batch_file(stage, [request for request, key in pending.values()])
+  batch = wait_for_batch(submit_batch(stage, batch_file))
+  results = batch_results(batch)
+  latency = time.perf_counter() - start
+
+  for custom_id, (request, key) in pending.items():
+    result = results.get(custom_id, f"No result for {custom_id} in {stage} batch ({batch.status})")
+    if fan_out(stage, custom_id, result, handle, failed, latency, request["body"]["model"]) and cache:
+      cache.put(key, request["body"]["model"], result.output_text)
+
+  # The stage has been fanned out; a later run should submit a fresh batch
+  (BATCH_DIR / f"{stage}_batch.json").unlink()
+  return failed
+
+def fan_out(stage, custom_id, result, handle, failed, latency, model = None):
+  input_filename = Path(custom_id)
+  label = stage.capitalize()
+  try:
+    if isinstance(result, str):
+      raise RuntimeError(result)
+    handle(input_filename, result)
+    llm.record_usage(label, result)
+    metrics.record_llm(label, model or result.model, result, latency, submission = input_filename, batch = True)
+    return True
+  except Exception as e:
+    metrics.record_llm(label, model, None, latency, submission = input_filename, batch = True, error = e)
+    failed.add(input_filename)
+    print(f"{stage} failed for {input_filename}: {e}")
+    return False
+
+# ===================== STAGES ====================================
+
+def write_feedback_json(input_filename, response, suffix):
+  feedback = gf.FeedbackResponse.model_validate_json(response.output_text)
+  write_json_atomic(gf.intermediate_file(input_filename, suffix), feedback.model_dump())
+
+def handle_proposer(input_filename, response):
+  write_feedback_json(input_filename, response, "_intermediate.json")
+
+def handle_reviewer(input_filename, response):
+  write_feedback_json(input_filename, response, "_final.json")
+
+def handle_summarizer(input_filename, response):
+  with open(gf.intermediate_file(input_filename, "_final.json"), 'r') as f:
+    x = json.load(f)
+  gf.write_feedback_file(input_filename, x['annotations'], response.output_text)
+
+# Grade all programs stage by stage; returns the programs that failed in any stage.
+# With manifest checkpoints, each program joins at the stage it has to resume from
+# and every completed stage is recorded.
+def run_batch(programs, problem_statement, rubric, checkpoints = None):
+  failed = set()
+  submissions = {}
+  start = {}
+  for input_filename in programs:
+    gf.make_output_dirs(input_filename)
+    submissions[str(input_filename)] = gf.preprocess_input(input_filename)
+    start[input_filename] = checkpoints[input_filename].next_stage(gf.stage_artifacts(input_filename)) if checkpoints else manifest.STAGES[0]
+
+  # Programs that take part in the given stage and have not failed in an earlier one
+  def stage_programs(stage):
+    index = manifest.STAGES.index(stage)
+    return [Path(custom_id) for custom_id in submissions
+            if Path(custom_id) not in failed and manifest.STAGES.index(start[Path(custom_id)]) <= index]
+
+  def record(stage, stage_failed, programs):
+    failed.update(stage_failed)
+    if not checkpoints:
+      return
+    for input_filename in programs:
+      if input_filename in stage_failed:
+        checkpoints[input_filename].failed(f"{stage} failed in batch mode")
+      else:
+        checkpoints[input_filename].done(stage)
+
+  programs = stage_programs('proposer')
+  requests = {}
+  for input_filename in programs:
+    custom_id = str(input_filename)
+    model = gf.POLICY.proposer_model(gf.PROPOSER_REVIEWER, gf.count_lines(input_filename), submission = input_filename)
+    requests[custom_id] = batch_request(custom_id, model,
+      gf.proposer_messages(problem_statement, rubric, submissions[custom_id]), gf.FeedbackResponse)
+  record('proposer', run_stage("proposer", requests, handle_proposer), programs)
+
+  # Proposals that the review policy accepts as they are become the final feedback
+  programs = stage_programs('reviewer')
+  requests = {}
+  for input_filename in programs:
+    custom_id = str(input_filename)
+    with open(gf.intermediate_file(input_filename, "_intermediate.json"), 'r') as f:
+      proposal = json.load(f)
+    diagnostics, error = linter.diagnostics(input_filename)
+    annotations = gf.FeedbackResponse.model_validate(proposal).annotations
+    if not gf.POLICY.review(annotations, gf.count_lines(input_filename), None if error else len(diagnostics),
+                            submission = input_filename, lint_error = error):
+      shutil.copyfile(gf.intermediate_file(input_filename, "_intermediate.json"), gf.intermediate_file(input_filename, "_final.json"))
+      continue
+    proposal_json = json.dumps(proposal)
+    linter_summary = gf.run_linter(input_filename)
+    requests[custom_id] = batch_request(custom_id, gf.PROPOSER_REVIEWER,
+      gf.reviewer_messages(problem_statement, rubric, submissions[custom_id], proposal_json, linter_summary), gf.FeedbackResponse)
+  record('reviewer', run_stage("reviewer", requests, handle_reviewer), programs)
+
+  # The summary block is rendered locally unless the LLM rewrite was asked for
+  programs = stage_programs('postprocess')
+  if gf.SUMMARY_MODE != 'llm':
+    stage_failed = set()
+    for input_filename in programs:
+      try:
+        gf.postprocess(input_filename)
+      except Exception as e:
+        stage_failed.add(input_filename)
+        print(f"postprocess failed for {input_filename}: {e}")
+    record('postprocess', stage_failed, programs)
+    return failed
+
+  requests = {}
+  for input_filename in programs:
+    custom_id = str(input_filename)
+    with open(gf.intermediate_file(input_filename, "_final.json"), 'r') as f:
+      summary = json.dumps(json.load(f)['summary'])
+    requests[custom_id] = batch_request(custom_id, gf.SUMMARIZER, gf.summarizer_messages(summary))
+  record('postprocess', run_stage("summarizer", requests, handle_summarizer), programs)
+
+  return failed
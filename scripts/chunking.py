@@ -0,0 +1,98 @@
+import excerpt
+
+# Function-level chunking of very large submissions. A submission whose numbered text
+# exceeds the token budget is split along top-level C function boundaries into chunks
+# that each fit the budget. Every chunk also shows the shared header (includes, globals
+# and prototypes before the first function), so the proposer and reviewer can run on
+# all chunks concurrently; their annotations are merged and de-duplicated afterwards.
+# Bodies of shared functions left out of the prompt (see dedup.py) are left out of the
+# chunks as well, and do not count against the budget.
+
+# Same rough measure as llm.estimate_tokens: about four characters per token
+CHARS_PER_TOKEN = 4
+
+SEVERITY_RANK = {'critical': 0, 'issue': 1, 'suggestion': 2}
+
+class Chunk:
+  """Part of a submission: its own line range (1-based, inclusive) and its prompt text."""
+
+  def __init__(self, index, count, start, end, text):
+    self.index = index
+    self.count = count
+    self.start = start
+    self.end = end
+    self.text = text
+
+  # Annotations on this chunk's lines; those on the shared header go to the first chunk
+  def owns(self, line_number):
+    return self.start <= line_number <= self.end or (self.index == 0 and line_number < self.start)
+
+# Characters of each line in the prompt: none for the lines of elided bodies
+def line_sizes(lines, bodies):
+  sizes = [len(line) + 8 for line in lines]
+  for first, (last, _) in bodies.items():
+    sizes[first - 1:last] = [0] * (last - first + 1)
+  return sizes
+
+# Split lines (as read from the file) into chunks of at most max_tokens each, not
+# counting the shared header. bodies are the shared function bodies left out (see
+# dedup.bodies). Returns None when the submission fits in one prompt or has no
+# recognizable functions to split on. A single function larger than the budget
+# becomes a chunk of its own.
+def split(lines, max_tokens, bodies = None):
+  bodies = bodies or {}
+  sizes = line_sizes(lines, bodies)
+  if not max_tokens or sum(sizes) // CHARS_PER_TOKEN <= max_tokens:
+    return None
+  functions = excerpt.functions(lines)
+  if len(functions) < 2:
+    return None
+
+  # Each unit runs from the end of the previous function to the end of this one, so
+  # comments and declarations above a function travel with it
+  header_end = functions[0][0]
+  units = []
+  start = header_end
+  for _, _, end in functions:
+    units.append((start, end + 1))
+    start = end + 1
+  units[-1] = (units[-1][0], len(lines))
+
+  ranges = []
+  for unit_start, unit_end in units:
+    if ranges and sum(sizes[ranges[-1][0]:unit_end]) // CHARS_PER_TOKEN <= max_tokens:
+      ranges[-1] = (ranges[-1][0], unit_end)
+    else:
+      ranges.append((unit_start, unit_end))
+  if len(ranges) < 2:
+    return None
+
+  header = list(range(1, header_end + 1))
+  chunks = []
+  for index, (start, end) in enumerate(ranges):
+    shown = header + list(range(start + 1, end + 1))
+    note = (f"(Part {index + 1} of {len(ranges)} of a large submission: lines {start + 1}-{end} and the "
+            f"declarations at the top of the file. Give feedback on this part only. Line numbers are those of the full file.)\n")
+    chunks.append(Chunk(index, len(ranges), start + 1, end, note + excerpt.number(lines, shown, bodies)))
+  return chunks
+
+# One list of annotations from the per-chunk lists: sorted by line, and of several
+# annotations with the same line and category (or the same comment) only the most
+# severe is kept (the first one of equal severity)
+def merge_annotations(annotation_lists):
+  kept = []
+  # (line, category) and (line, normalized comment) -> index in kept
+  slots = {}
+  for annotations in annotation_lists:
+    for annotation in annotations:
+      comment = ' '.join(annotation.comment.lower().split())
+      keys = [(annotation.line_number, 'category', annotation.category), (annotation.line_number, 'comment', comment)]
+      index = next((slots[key] for key in keys if key in slots), None)
+      if index is None:
+        index = len(kept)
+        kept.append(annotation)
+      elif SEVERITY_RANK.get(annotation.severity, 3) < SEVERITY_RANK.get(kept[index].severity, 3):
+        kept[index] = annotation
+      for key in keys:
+        slots.setdefault(key, index)
+  return sorted(kept, key = lambda annotation: annotation.line_number)
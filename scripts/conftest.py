@@ -0,0 +1,12 @@
+import os
+
+# The pipeline modules read their configuration from the environment when imported;
+# tests run them on relative paths inside a temporary directory (see workspace in the
+# tests) with an API key for the local stand-in server and no metrics ledger
+os.environ.setdefault('INPUT_DIR', 'input')
+os.environ.setdefault('OUTPUT_DIR', 'output')
+os.environ.setdefault('INTER_DIR', 'intermediates')
+os.environ.setdefault('PROPOSER_REVIEWER', 'mock-model')
+os.environ.setdefault('SUMMARIZER', 'mock-model')
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+os.environ.setdefault('METRICS_FILE', '')
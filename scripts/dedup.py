@@ -0,0 +1,156 @@
+import bisect
+import hashlib
+import re
+
+import excerpt
+
+# Cohort-level de-duplication, run before the LLM stages.
+#
+# Exact duplicates: every submission is normalized (comments removed, whitespace
+# collapsed, blank lines dropped) and hashed. Of a group of identical submissions only
+# the first (the leader) goes through the proposer and reviewer; the others reuse its
+# feedback with the line numbers remapped.
+#
+# Shared functions: every top-level function is hashed after the same normalization.
+# A function found unchanged in at least min_shared distinct submissions (typically
+# starter code) is reviewed once on its own. In each submission that contains it, its
+# body is left out of the prompt and the annotations of the shared review are added
+# back, remapped to that file's lines.
+#
+# Line numbers are remapped through the normalized lines: the k-th non-blank
+# normalized line of one copy corresponds to the k-th of another.
+
+TOKEN_RE = re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|//[^\n]*|/\*.*?\*/', re.S)
+
+# Comments are dropped but their newlines kept, so line numbers are preserved
+def strip_comments(text):
+  def replace(match):
+    token = match.group(0)
+    if token.startswith('/'):
+      return '\n' * token.count('\n')
+    return token
+  return TOKEN_RE.sub(replace, text)
+
+# Line numbers (1-based) and normalized text of the non-blank lines of lines
+def normalize(lines):
+  normalized = []
+  for i, line in enumerate(strip_comments(''.join(lines)).split('\n')):
+    text = ' '.join(line.split())
+    if text:
+      normalized.append((i + 1, text))
+  return normalized
+
+def digest(texts):
+  return hashlib.sha256('\n'.join(texts).encode('utf-8', errors = 'replace')).hexdigest()
+
+# Line in the target copy that corresponds to line_number in the source copy; both are
+# lists of the line numbers of the copies' normalized lines
+def remap_line(line_number, source_lines, target_lines):
+  if not source_lines or not target_lines:
+    return line_number
+  index = min(bisect.bisect_left(source_lines, line_number), len(source_lines) - 1)
+  return target_lines[index]
+
+class Function:
+  """A top-level function of one submission."""
+
+  def __init__(self, name, key, start, body, end, lines):
+    self.name = name
+    self.key = key
+    # 1-based: signature start, opening brace and closing brace
+    self.start = start
+    self.body = body
+    self.end = end
+    # Line numbers of the function's normalized lines
+    self.lines = lines
+
+class Submission:
+
+  def __init__(self, path, lines):
+    self.path = path
+    self.lines = lines
+    normalized = normalize(lines)
+    self.key = digest(text for _, text in normalized)
+    self.normalized_lines = [line_number for line_number, _ in normalized]
+    self.functions = []
+    for start, body, end in excerpt.functions(lines):
+      inside = [(line_number, text) for line_number, text in normalized if start + 1 <= line_number <= end + 1]
+      name = re.search(r'(\w+)\s*\(', ''.join(lines[start:body + 1]))
+      self.functions.append(Function(name.group(1) if name else f"line {start + 1}",
+        digest(text for _, text in inside), start + 1, body + 1, end + 1, [line_number for line_number, _ in inside]))
+
+  # Annotations of a copy of this submission (another Submission with the same key)
+  # moved to this submission's lines
+  def remap_from(self, other, annotations):
+    return [annotation.model_copy(update = {'line_number': remap_line(annotation.line_number, other.normalized_lines, self.normalized_lines)})
+            for annotation in annotations]
+
+class SharedFunction:
+  """A function found unchanged in several submissions, reviewed once on its representative copy."""
+
+  def __init__(self, key, submission, function):
+    self.key = key
+    self.submission = submission
+    self.function = function
+    self.count = 0
+
+  # Prompt text of the function: its lines, numbered as in the representative file
+  def text(self):
+    return ''.join(f"{line_number} | {self.submission.lines[line_number - 1]}"
+                   for line_number in range(self.function.start, self.function.end + 1))
+
+  # Annotations of the shared review moved to the copy of the function in function
+  def remap_to(self, function, annotations):
+    return [annotation.model_copy(update = {'line_number': remap_line(annotation.line_number, self.function.lines, function.lines)})
+            for annotation in annotations]
+
+class Cohort:
+
+  def __init__(self, submissions, min_shared = 3, min_lines = 5):
+    self.submissions = {submission.path: submission for submission in submissions}
+    # path -> path of the identical submission whose results it reuses
+    self.leader = {}
+    leaders = {}
+    for submission in submissions:
+      if submission.key in leaders:
+        self.leader[submission.path] = leaders[submission.key].path
+      else:
+        leaders[submission.key] = submission
+
+    self.shared = {}
+    if min_shared:
+      for submission in leaders.values():
+        for function in {function.key: function for function in submission.functions}.values():
+          if len(function.lines) < min_lines:
+            continue
+          shared = self.shared.setdefault(function.key, SharedFunction(function.key, submission, function))
+          shared.count += 1
+      self.shared = {key: shared for key, shared in self.shared.items() if shared.count >= min_shared}
+
+  def followers(self, path):
+    return [follower for follower, leader in self.leader.items() if leader == path]
+
+  # Shared functions in a submission, as (SharedFunction, the submission's copy)
+  def shared_in(self, path):
+    return [(self.shared[function.key], function) for function in self.submissions[path].functions if function.key in self.shared]
+
+def analyze(paths, min_shared = 3, min_lines = 5):
+  submissions = []
+  for path in paths:
+    with open(path, 'r', errors = 'replace') as f:
+      submissions.append(Submission(path, f.readlines()))
+  return Cohort(submissions, min_shared, min_lines)
+
+# Bodies of the given functions to leave out of a prompt: first body line -> (last
+# body line, function name)
+def bodies(functions):
+  skipped = {}
+  for function in functions:
+    if function.end - function.body > 1:
+      skipped[function.body + 1] = (function.end - 1, function.name)
+  return skipped
+
+# Numbered submission with the bodies of the given functions replaced by a marker; the
+# signature and closing brace stay visible
+def elide(lines, functions):
+  return excerpt.number(lines, range(1, len(lines) + 1), bodies(functions))
@@ -0,0 +1,108 @@
+import bisect
+import re
+
+# Hunk-window excerpts of a changed file for the repo-mode prompts. Instead of the whole
+# file (e.g. all of kernel/proc.c), only the modified lines plus `context` lines around
+# them and the signatures of the enclosing functions are sent. Lines keep their real
+# line numbers ("123 | ...") and omitted regions are replaced by a marker, so the model
+# reports real line numbers; annotations that still land on an omitted line are moved
+# to the nearest line that was shown (Excerpt.remap) before postprocessing.
+
+# A function header that opens its body on the same line, e.g. `int fork(void) {`
+HEADER_RE = re.compile(r'^[A-Za-z_][^;=]*\)\s*\{\s*$')
+
+# How many lines above a lone `{` may belong to the signature (xv6 puts the return type
+# on its own line: "int\nfork(void)\n{")
+MAX_SIGNATURE_LINES = 3
+
+class Excerpt:
+  """Prompt text of a file and the sorted line numbers it shows (empty when it shows the whole file)."""
+
+  def __init__(self, text, shown):
+    self.text = text
+    self.shown = shown
+
+  # Move annotations on lines that were not shown to the nearest shown line
+  def remap(self, feedback):
+    if not self.shown:
+      return feedback
+    for annotation in feedback.annotations:
+      line_number = annotation.line_number
+      index = bisect.bisect_left(self.shown, line_number)
+      if index < len(self.shown) and self.shown[index] == line_number:
+        continue
+      candidates = self.shown[max(0, index - 1):index + 1]
+      annotation.line_number = min(candidates, key = lambda shown: abs(shown - line_number))
+    return feedback
+
+# (signature start, body start, end) of every top-level function, 0-based
+def functions(lines):
+  found = []
+  current = None
+  for i, line in enumerate(lines):
+    text = line.rstrip()
+    if current is None:
+      if text == '{':
+        start = i
+        while i - start < MAX_SIGNATURE_LINES and start > 0:
+          previous = lines[start - 1].rstrip()
+          if not previous or previous.startswith('#') or previous.endswith((';', '}', '*/')):
+            break
+          start -= 1
+        current = (start, i)
+      elif HEADER_RE.match(text):
+        current = (i, i)
+    elif text.startswith('}'):
+      found.append((current[0], current[1], i))
+      current = None
+  return found
+
+# "123 | ..." text of the shown line numbers, with a marker for every omitted region.
+# bodies maps the first line of a shared function body left out of the prompt (see
+# dedup.bodies) to its last line and the function's name.
+def number(lines, shown, bodies = None):
+  bodies = bodies or {}
+  out = []
+  previous = 0
+  for line_number in shown:
+    if line_number <= previous:
+      continue
+    if line_number > previous + 1:
+      out.append(f"... (lines {previous + 1}-{line_number - 1} omitted)\n")
+    if line_number in bodies:
+      last, name = bodies[line_number]
+      out.append(f"... (lines {line_number}-{last}: body of {name}, shared starter code reviewed separately)\n")
+      previous = last
+      continue
+    line = lines[line_number - 1]
+    if not line.endswith('\n'):
+      line += '\n'
+    out.append(f"{line_number} | {line}")
+    previous = line_number
+  if previous < len(lines):
+    out.append(f"... (lines {previous + 1}-{len(lines)} omitted)\n")
+  return ''.join(out)
+
+# Excerpt of lines (as read from the file) around the 1-based changed line numbers.
+# lines are matched against C syntax with marker_prefix (the "+ " that marks changed
+# lines) removed. With context None the whole file is shown.
+def excerpt(lines, changed, context, marker_prefix = '+ '):
+  if context is None or not changed:
+    shown = list(range(1, len(lines) + 1))
+    return Excerpt(number(lines, shown), shown)
+
+  source = [line[len(marker_prefix):] if i + 1 in changed and line.startswith(marker_prefix) else line
+            for i, line in enumerate(lines)]
+  shown = set()
+  for line_number in changed:
+    shown.update(range(max(1, line_number - context), min(len(lines), line_number + context) + 1))
+
+  # Signature of every function that contains a shown line
+  for start, body, end in functions(source):
+    if any(start + 1 <= line_number <= end + 1 for line_number in shown):
+      shown.update(range(start + 1, body + 2))
+
+  shown = sorted(shown)
+  header = (f"(Excerpt: only the modified lines, {context} lines of context around them and the "
+            f"signatures of the enclosing functions are shown. Line numbers are those of the full file.)\n")
+  return Excerpt(header + number(lines, shown), shown)
@@ -1,14 +1,24 @@
 import sys
-import subprocess
-from openai import OpenAI
 from pydantic import BaseModel, Field
 from pathlib import Path
 import json
 import textwrap
+import functools
 from dotenv import load_dotenv
 import os
-import datetime
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import chunking
+import dedup
+import linter
+import llm
+import manifest
+import pipeline
+import policy
+import preflight
+import prompts
+import tracing
 
 # ===================== LOAD CONFIG ================================
 
@@ -26,11 +36,27 @@ INTER_DIR = os.getenv('INTER_DIR')
 PROPOSER_REVIEWER = os.getenv('PROPOSER_REVIEWER')
 SUMMARIZER = os.getenv('SUMMARIZER')
 
+# How the summary block is produced: 'local' renders it from the reviewer's Summary,
+# 'llm' asks the SUMMARIZER model to rewrite it
+SUMMARY_MODE = os.getenv('SUMMARY_MODE', 'local')
+
+# Submissions above this many (estimated) tokens are split along function boundaries
+# and reviewed in parallel chunks (see chunking.py); 0 disables chunking
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', '12000'))
+
+# Stream the proposer and reviewer responses and hand on each annotation as soon as it
+# has been generated (see streaming.py)
+STREAM = os.getenv('STREAM', '0') != '0'
+
+# When the reviewer pass is skipped and which submissions are proposed on CASCADE_MODEL
+# (see policy.py)
+POLICY = policy.Policy.from_env()
 
 # ===================== UTILS ====================================
 
 # This function inserts line numbers in the original submission (like 1 | #include <stdio>)
 # This makes it easier for the LLM to tell us where the annotations will be placed
+@tracing.traced
 def preprocess_input(input_filename):
   i = 0
   submission_program = [] 
@@ -45,51 +71,21 @@ def preprocess_input(input_filename):
   submission_program = ''.join(submission_program)
   return submission_program 
 
-# This function calls the clang-tidy linter on the C program file and makes LLM call
-# to summarize the linter output in a more readable format.
+# This function calls the clang-tidy linter on the C program file and turns its output into
+# a compact, ranked list of diagnostics for the reviewer prompt (see linter.py). The
+# clang-tidy run itself is usually served from the cohort-wide lint cache.
+@tracing.traced
 def run_linter(input_filename):
 
-  try:
-    process = subprocess.Popen(['clang-tidy', input_filename, '--', '-Wall','-std=c11'], stdout = subprocess.PIPE, stderr = subprocess.PIPE, text = True)
-    linter_output, error_output = process.communicate()
-    if error_output.returncode != 0:
-      return f"clang-tidy exited with code {error_output.returncode}: {error_output}"
+  diagnostics, error = linter.diagnostics(input_filename)
+  if error:
+    return error
+  return linter.render_diagnostics(diagnostics)
 
-    try:
-      response = client.responses.create(
-          model="gpt-4.1-nano",
-          input = [
-              {"role": "user", "content": "The following is output from a linter. Please retain the essential points only. These will be used to guide an LLM-based automated programming feedback tool"},
-              {"role": "user",
-               "content": linter_output} 
-          ]
-      )
-      return response.output_text
-    except Exception as api_error:
-      return f"API call error for linter output: {str(api_error)}"
+# Path of a per-submission file in intermediates/, e.g. wish_intermediate.json
+def intermediate_file(input_filename, suffix):
+  return Path(INTER_DIR) / input_filename.relative_to(INPUT_DIR).parent / f"{input_filename.stem}{suffix}"
 
-  except FileNotFoundError:
-    return "Error: clang-tidy not found. Please ensure it is installed and in path"
-  except subprocess.SubprocessError as e:
-    return f"Subprocess error: {str(e)}"
-  except Exception as e:
-    return f"Unexpected error: {str(e)}"
-
-# Write number of input/cached/output tokens per API call
-def write_log(response, id_str, input_filename):
-  log_file = Path(INTER_DIR) / input_filename.relative_to(INPUT_DIR).parent / f"{input_filename.stem}_log.txt"
-
-  # If file exists before first log write during this call, overwrite it
-  permission = 'w' if id_str == "Proposer" else 'a'
-
-  with open(log_file, permission) as f:
-    response_dict = response.model_dump()
-    cached_tokens = response_dict['usage']['input_tokens_details']['cached_tokens']
-    prompt_tokens = response_dict['usage']['input_tokens']
-    output_tokens = response_dict['usage']['output_tokens']
-    timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    f.write(f"{timestamp} : {id_str} Input / Cached / Output tokens: {prompt_tokens} / {cached_tokens} / {output_tokens}\n")
- 
 # ========================= STUCTURED OUTPUT SCHEMA ================
 # Structured output template
 class Annotation(BaseModel):
@@ -109,151 +105,249 @@ class FeedbackResponse(BaseModel):
   
 # ======================================================================
 
-client = OpenAI()
-
-# Proposer generates a first draft of annotations 
-def call_proposer(problem_statement, rubric, submission_program, input_filename):
+SYSTEM_PROMPT = "Your role is to act as an OS course TA who provides qualitative feedback on student C programming assignment. Feedback is good when it is relevant for education of undergraduate computer science students, and it is not overwhelming in quantity. Please stick to the rubric."
+
+# The *_messages functions build the model input for each stage. They are shared by the
+# synchronous calls below and by the Batch API mode in batch_api.py. The cohort-invariant
+# part of each prompt comes first so that it is served from the provider's prompt cache.
+INTRO = "See the following problem statement of OS assignment and the rubric for code quality feedback. One C program submission is given in the next message."
+
+PROPOSER_INSTRUCTIONS = "Suggest a list of annotations (comments) of feedback on the submission based on the rubric. Also give a summary. Adhere to the structured output schema."
+
+REVIEWER_INSTRUCTIONS = """The next message also contains the diagnostics reported by the clang-tidy linter for the submission, and a list of annotations and a summary of feedback proposed for it. Do the following:
+1. For each annotation, check if line number is correct and if annotation is useful to give and valid
+2. Incorporate the linter output in annotations and summary, if needed.
+3. Discard annotations which are not very helpful and may clutter."""
+
+CHUNK_SUMMARY_INSTRUCTIONS = "The submission was too large to review at once and was reviewed in parts. The next message contains the summary of each part and the final annotations for the whole submission. Write one summary for the whole submission from them. Adhere to the structured output schema."
+
+def proposer_messages(problem_statement, rubric, submission_program):
+  prefix = prompts.shared_prefix(INTRO, problem_statement, rubric, PROPOSER_INSTRUCTIONS)
+  return prompts.assemble(SYSTEM_PROMPT, prefix,
+    prompts.section("submission", submission_program))
+
+def reviewer_messages(problem_statement, rubric, submission_program, proposal_json, linter_summary):
+  prefix = prompts.shared_prefix(INTRO, problem_statement, rubric, REVIEWER_INSTRUCTIONS)
+  return prompts.assemble(SYSTEM_PROMPT, prefix,
+    prompts.section("submission", submission_program),
+    prompts.section("linter", linter_summary),
+    prompts.section("feedback", proposal_json))
+
+def chunk_summary_messages(problem_statement, rubric, feedback_json):
+  prefix = prompts.shared_prefix(INTRO, problem_statement, rubric, CHUNK_SUMMARY_INSTRUCTIONS)
+  return prompts.assemble(SYSTEM_PROMPT, prefix,
+    prompts.section("feedback", feedback_json))
+
+def summarizer_messages(summary):
+  return [
+      {"role": "user", "content": "The following is summary of feedback on a C program from an automated tool. First, summarize it nicely so I can append it at the bottom of submission. Then format it properly as a C comment block; try to respect 80 character line limit convention. Do not add any suggestions of your own; give the comment block output so I can insert it as it is.\n<summary>\n" + summary + "\n</summary>"}
+  ]
+
+# Proposer or reviewer call. With STREAM=1 and a listener, each annotation is passed to
+# on_annotation(stage, annotation) as soon as it is complete; the full response is still
+# validated at the end, so an element that does not validate on its own is just not passed on.
+def feedback_call(input, stage, input_filename, on_annotation = None, model = None):
+
+  model = model or PROPOSER_REVIEWER
+  if not (STREAM and on_annotation):
+    return llm.parse_response(
+      model = model,
+      input = input,
+      text_format=FeedbackResponse, 
+      stage = stage,
+      submission = input_filename,
+    )
 
-  prompt = f"""See the following problem statement of OS assignment, the rubric for code quality feedback, and one C program submission.
-  <problem_statement>
-  {problem_statement}
-  </problem_statement>
-  
-  <submission>
-  {submission_program}
-  </submission>
+  def on_item(item):
+    try:
+      annotation = Annotation.model_validate(item)
+    except ValueError:
+      return
+    on_annotation(stage, annotation)
 
-  <rubric>
-  {rubric}
-  </rubric>
-  
-  Suggest a list of annotations (comments) of feedback based on the rubric. Also give a summary. Adhere to the structured output schema.
-  """
+  return llm.stream_response(model, input, FeedbackResponse, on_item, stage = stage, submission = input_filename)
 
+def propose(problem_statement, rubric, submission_program, input_filename, on_annotation = None, model = None):
   try:
-    proposer_response = client.responses.parse(
-      model = PROPOSER_REVIEWER,
-      input=[
-        {"role": "system", "content": "Your role is to act as an OS course TA who provides qualitative feedback on student C programming assignment. Feedback is good when it is relevant for education of undergraduate computer science students, and it is not overwhelming in quantity. Please stick to the rubric."},
-        {
-          "role": "user",
-          "content": prompt,
-        },
-      ],
-      text_format=FeedbackResponse, 
-    )
+    proposer_response, initial_feedback = feedback_call(
+      proposer_messages(problem_statement, rubric, submission_program), "Proposer", input_filename, on_annotation, model)
   except Exception as api_error:
-    return f"API call error for proposer: {str(api_error)}"
-
-  initial_feedback = proposer_response.output_parsed
-  
-  json_file = Path(INTER_DIR) / input_filename.relative_to(INPUT_DIR).parent / f"{input_filename.stem}_intermediate.json"
-
-  with open(json_file, 'w') as f:
-    json.dump(initial_feedback.model_dump(), f, indent = 4, ensure_ascii=False)
+    raise RuntimeError(f"API call error for proposer: {str(api_error)}")
+  return initial_feedback
+
+# Proposer generates a first draft of annotations. A chunked submission is proposed on
+# all chunks concurrently and the drafts are merged into one proposal.
+@tracing.traced
+def call_proposer(problem_statement, rubric, submission_program, input_filename, chunks = None, on_annotation = None, model = None):
+
+  if chunks:
+    track = tracing.current_track()
+    with ThreadPoolExecutor(max_workers = len(chunks), thread_name_prefix = "chunk") as executor:
+      drafts = list(executor.map(lambda chunk: tracing.on_track(track, propose, problem_statement, rubric, chunk.text, input_filename, on_annotation), chunks))
+    initial_feedback = FeedbackResponse(
+      annotations = chunking.merge_annotations([draft.annotations for draft in drafts]),
+      summary = Summary(**{field: "\n".join(getattr(draft.summary, field) for draft in drafts) for field in Summary.model_fields}),
+    )
+  else:
+    initial_feedback = propose(problem_statement, rubric, submission_program, input_filename, on_annotation, model)
   
-  write_log(proposer_response, "Proposer", input_filename)
+  pipeline.audit.write_json(intermediate_file(input_filename, "_intermediate.json"), initial_feedback.model_dump())
+  return initial_feedback
 
-# Reviewer reviews the feedback generated by Proposer and integrates output from clang-tidy linter
-def call_reviewer(problem_statement, rubric, submission_program, input_filename):
+def review(problem_statement, rubric, submission_program, input_filename, proposal, linter_summary, on_annotation = None):
 
-  json_file = Path(INTER_DIR) / input_filename.relative_to(INPUT_DIR).parent / f"{input_filename.stem}_intermediate.json"
+  proposal_json = json.dumps(proposal.model_dump())
 
   try:
-    with open(json_file, 'r') as f:
-      proposer_output_data = json.load(f)
-  except FileNotFoundError:
-    print(f"Error: {json_file} not found")
-    
-  proposal_json = json.dumps(proposer_output_data)
-
-  linter_summary = run_linter(input_filename)  
-  prompt = f"""See the following problem statement of OS assignment, the rubric for code quality feedback, and one C program submission.
-  <problem_statement>
-  {problem_statement}
-  </problem_statement>
-  
-  <submission>
-  {submission_program}
-  </submission>
-
-  <rubric>
-  {rubric}
-  </rubric>
-  
-  Clang-tidy linter gave the following output (summary) for the submission.
-  
-  <linter>
-  {linter_summary}
-  </linter>
-  
-  Look at the following list of annotations and the summary of feedback. Do the following:
-  1. For each annotation, check if line number is correct and if annotation is useful to give and valid
-  2. Incorporate the linter output in annotations and summary, if needed.
-  3. Discard annotations which are not very helpful and may clutter.
-  
-  <feedback>
-  {proposal_json}
-  </feedback>
-  """
+    reviewer_response, refined_feedback = feedback_call(
+      reviewer_messages(problem_statement, rubric, submission_program, proposal_json, linter_summary), "Reviewer", input_filename, on_annotation)
+  except Exception as api_error:
+    raise RuntimeError(f"API call error for reviewer: {str(api_error)}")
+  return refined_feedback
+
+# Each chunk is reviewed with the proposed annotations and linter diagnostics on its own
+# lines; the reviewed annotations are merged and one summary is written for the whole
+# submission from the per-chunk summaries
+def review_chunks(problem_statement, rubric, input_filename, proposal, chunks, on_annotation = None):
+  diagnostics, error = linter.diagnostics(input_filename)
+
+  def review_chunk(chunk):
+    chunk_proposal = FeedbackResponse(
+      annotations = [annotation for annotation in proposal.annotations if chunk.owns(annotation.line_number)],
+      summary = proposal.summary,
+    )
+    linter_summary = error or linter.render_diagnostics([d for d in diagnostics if chunk.owns(d.line)])
+    return review(problem_statement, rubric, chunk.text, input_filename, chunk_proposal, linter_summary, on_annotation)
+
+  track = tracing.current_track()
+  with ThreadPoolExecutor(max_workers = len(chunks), thread_name_prefix = "chunk") as executor:
+    reviews = list(executor.map(lambda chunk: tracing.on_track(track, review_chunk, chunk), chunks))
+
+  annotations = chunking.merge_annotations([reviewed.annotations for reviewed in reviews])
+  feedback_json = json.dumps({
+    'part_summaries': [reviewed.summary.model_dump() for reviewed in reviews],
+    'annotations': [annotation.model_dump() for annotation in annotations],
+  })
   try:
-    reviewer_response = client.responses.parse(
+    _, summary = llm.parse_response(
       model = PROPOSER_REVIEWER,
-      input=[
-        {"role": "system", "content": "Your role is to act as an OS course TA who provides qualitative feedback on student C programming assignment. Feedback is good when it is relevant for education of undergraduate computer science students, and it is not overwhelming in quantity. Please stick to the rubric."},
-        {
-          "role": "user",
-          "content": prompt,
-        },
-      ],
-      text_format=FeedbackResponse, 
+      input = chunk_summary_messages(problem_statement, rubric, feedback_json),
+      text_format = Summary,
+      stage = "ChunkSummary",
+      submission = input_filename,
     )
   except Exception as api_error:
-    return f"API call error for proposer: {str(api_error)}"
-
-  refined_feedback = reviewer_response.output_parsed
-  
-  json_file = Path(INTER_DIR) / input_filename.relative_to(INPUT_DIR).parent / f"{input_filename.stem}_final.json"
+    raise RuntimeError(f"API call error for chunk summary: {str(api_error)}")
+  return FeedbackResponse(annotations = annotations, summary = summary)
+
+# Review each function shared by several submissions once (see dedup.py), on its own,
+# with the linter diagnostics of its representative copy. Returns function key ->
+# annotations in the representative's line numbers; failed reviews are left out, and
+# those functions are then reviewed as part of each submission.
+def review_shared_functions(cohort, problem_statement, rubric, workers):
+
+  def review_function(shared):
+    path = shared.submission.path
+    function = shared.function
+    text = shared.text()
+    diagnostics, error = linter.diagnostics(path)
+    linter_summary = error or linter.render_diagnostics([d for d in diagnostics if function.start <= d.line <= function.end])
+    proposal = propose(problem_statement, rubric, text, path)
+    return review(problem_statement, rubric, text, path, proposal, linter_summary).annotations
+
+  reviews = {}
+  with ThreadPoolExecutor(max_workers = workers, thread_name_prefix = "shared") as executor:
+    futures = {executor.submit(review_function, shared): shared for shared in cohort.shared.values()}
+    for future, shared in futures.items():
+      try:
+        reviews[shared.key] = future.result()
+      except Exception as e:
+        print(f"Review of shared function {shared.function.name} failed: {e}")
+  return reviews
 
-  with open(json_file, 'w') as f:
-    json.dump(refined_feedback.model_dump(), f, indent = 4, ensure_ascii=False)
+# Reviewer reviews the feedback generated by Proposer and integrates output from clang-tidy linter
+@tracing.traced
+def call_reviewer(problem_statement, rubric, submission_program, input_filename, proposal, linter_summary, chunks = None, on_annotation = None):
 
-  write_log(reviewer_response, "Reviewer", input_filename)
+  if chunks:
+    refined_feedback = review_chunks(problem_statement, rubric, input_filename, proposal, chunks, on_annotation)
+  else:
+    refined_feedback = review(problem_statement, rubric, submission_program, input_filename, proposal, linter_summary, on_annotation)
+  
+  pipeline.audit.write_json(intermediate_file(input_filename, "_final.json"), refined_feedback.model_dump())
+  return refined_feedback
  
-# This function inserts the feedback comments at the correct point in original code and appends a summary at the end
-def postprocess(input_filename):
+# This function inserts the feedback comments at the correct point in original code and appends a summary at the end.
+# Without feedback, the reviewer output is read back from _final.json (used by the batch mode).
+@tracing.traced
+def postprocess(input_filename, feedback = None):
 
-  json_file = Path(INTER_DIR) / input_filename.relative_to(INPUT_DIR).parent / f"{input_filename.stem}_final.json"
+  if feedback is None:
+    feedback = load_feedback(intermediate_file(input_filename, "_final.json"))
+  x = feedback.model_dump()
+
+  if SUMMARY_MODE != 'llm':
+    write_feedback_file(input_filename, x['annotations'], format_summary(x['summary']))
+    return
 
-  f = open(json_file, 'r')
-  x = json.load(f)
   summary = json.dumps(x['summary'])
   
   try:
-    response = client.responses.create(
+    response = llm.create_response(
       model = SUMMARIZER,
-      input = [
-          {"role": "user", "content": "The following is summary of feedback on a C program from an automated tool. First, summarize it nicely so I can append it at the bottom of submission. Then format it properly as a C comment block; try to respect 80 character line limit convention. Do not add any suggestions of your own; give the comment block output so I can insert it as it is.\n<summary>\n" + summary + "\n</summary>"}
-      ]
+      input = summarizer_messages(summary),
+      stage = "Summarizer",
+      submission = input_filename,
     )
   except Exception as api_error:
-    return f"API call error for proposer: {str(api_error)}"
-
-  write_log(response, "Summarizer", input_filename)
-  
-  summary = response.output_text
+    raise RuntimeError(f"API call error for summarizer: {str(api_error)}")
   
+  write_feedback_file(input_filename, x['annotations'], response.output_text)
+
+def load_feedback(json_file):
+  with open(json_file, 'r') as f:
+    return FeedbackResponse.model_validate_json(f.read())
+
+# Render the reviewer's Summary as a C comment block that respects the 80 column limit
+def format_summary(summary):
+  sections = [
+    ("Strengths", summary['strengths']),
+    ("Areas for improvement", summary['areas_for_improvement']),
+    ("Overall assessment", summary['overall_assessment']),
+  ]
+
+  lines = ['/*', ' * SUMMARY OF REVIEW', ' *']
+  for title, text in sections:
+    lines.append(f' * {title}:')
+    # A '*/' in the text would end the comment early
+    text = text.replace('*/', '* /')
+    for paragraph in text.splitlines():
+      for line in textwrap.wrap(paragraph, width = 75):
+        lines.append(' *   ' + line)
+    lines.append(' *')
+  lines[-1] = ' */'
+  return '\n'.join(lines)
+
+def feedback_file(input_filename):
+  return Path(OUTPUT_DIR) / input_filename.parent.relative_to('input') / Path(input_filename.stem + '_feedback' + input_filename.suffix)
+
+# The C comment block of one annotation. Cached, so that with STREAM=1 the blocks of the
+# reviewer's annotations are formatted while the rest of the response is generated.
+@functools.lru_cache(maxsize = 4096)
+def comment_block(comment):
+  p = textwrap.wrap(comment, width = 80)
+  return '/* \n * REVIEW: ' +  ' \n * '.join(p) + '\n */'
+
+# Write the submission with the annotation comment blocks inserted and the summary appended
+def write_feedback_file(input_filename, annotations, summary):
+
   annotation_dict = {}
-  for annotation in x['annotations']:
-      line_number = annotation['line_number']
-      comment = annotation['comment']
-      p = textwrap.wrap(comment, width = 80)
-      formatted_comment = '/* \n * REVIEW: ' +  ' \n * '.join(p) + '\n */'
-      annotation_dict[int(line_number)] = formatted_comment 
+  for annotation in annotations:
+      annotation_dict[int(annotation['line_number'])] = comment_block(annotation['comment'])
   
   f_input = open(input_filename, 'r')
   
-  output_filename = Path(OUTPUT_DIR) / input_filename.parent.relative_to('input') / Path(input_filename.stem + '_feedback' + input_filename.suffix)
+  output_filename = feedback_file(input_filename)
 
   f_output = open(output_filename, 'w')
   i = 0
@@ -269,13 +363,9 @@ def postprocess(input_filename):
   f_input.close()
   f_output.close()
 
-def main():
-
-  parser = argparse.ArgumentParser()
-  parser.add_argument("input_program_filepath", help = "Path of C program to be evaluated")
-  args = parser.parse_args()
-  input_filename = Path(args.input_program_filepath)
-
+# Read the problem statement and rubric shared by every submission in a run
+def load_shared_inputs():
+  problem_statement, rubric = None, None
   try:
     with open(PROBLEM_STATEMENT, 'r') as f:
       problem_statement = f.read()
@@ -287,18 +377,217 @@ def main():
       rubric = f.read()
   except FileNotFoundError:
     print(f"Error: {RUBRIC} not found")
-  
-  # Create intermediate directories in ouput/ and intermediates/ if needed
+
+  return problem_statement, rubric
+
+# Create intermediate directories in ouput/ and intermediates/ if needed
+def make_output_dirs(input_filename):
   output_path = Path(OUTPUT_DIR) / input_filename.parent.relative_to('input')
   intermediates_path = Path(INTER_DIR) / input_filename.parent.relative_to('input')
   os.makedirs(output_path, exist_ok = True)
   os.makedirs(intermediates_path, exist_ok = True)
 
-  submission_program = preprocess_input(input_filename) 
-  call_proposer(problem_statement, rubric, submission_program, input_filename)
-  call_reviewer(problem_statement, rubric, submission_program, input_filename)
-  
-  postprocess(input_filename)
+# Fingerprint of everything besides the source file that determines the feedback;
+# a change invalidates the checkpoints in the run manifest
+def config_fingerprint(problem_statement, rubric):
+  return manifest.fingerprint(problem_statement, rubric, PROPOSER_REVIEWER, SUMMARIZER, SUMMARY_MODE,
+    SYSTEM_PROMPT, INTRO, PROPOSER_INSTRUCTIONS, REVIEWER_INSTRUCTIONS, linter.CLANG_TIDY_FLAGS,
+    CHUNK_MAX_TOKENS, CHUNK_SUMMARY_INSTRUCTIONS, sorted(vars(POLICY).items()))
+
+# File written by each pipeline stage, used to validate manifest checkpoints
+def stage_artifacts(input_filename):
+  return {
+    'proposer': intermediate_file(input_filename, "_intermediate.json"),
+    'reviewer': intermediate_file(input_filename, "_final.json"),
+    'postprocess': feedback_file(input_filename),
+  }
+
+# ========================= PIPELINE ===============================
+# Stages of the per-submission pipeline (see pipeline.py). Linting has no dependency
+# on the proposer, so the two run concurrently; the reviewer waits for both.
+
+# The numbered submission; bodies of shared functions reviewed separately are left out
+def preprocess_stage(job):
+  if not job.elided:
+    return preprocess_input(job.input_filename)
+  with open(job.input_filename, 'r') as f:
+    return dedup.elide(f.readlines(), job.elided)
+
+def lint_stage(job):
+  return run_linter(job.input_filename)
+
+# Chunks of a submission too large for one prompt, or None. They are cut from the same
+# text as the unchunked prompt: the bodies of the elided shared functions are left out.
+def split_input(input_filename, elided = ()):
+  with open(input_filename, 'r') as f:
+    return chunking.split(f.readlines(), CHUNK_MAX_TOKENS, dedup.bodies(elided))
+
+def chunk_stage(job):
+  return split_input(job.input_filename, job.elided)
+
+def count_lines(input_filename):
+  with open(input_filename, 'r') as f:
+    return sum(1 for _ in f)
+
+# The LLM calls the pipeline will make for a submission, for the preflight (see
+# preflight.py): the same prompts, with a proposal of EXPECTED_OUTPUT_TOKENS for the
+# reviewer. Returns a preflight.Estimate.
+def estimate_calls(input_filename, problem_statement, rubric):
+  with open(input_filename, 'r') as f:
+    lines = f.readlines()
+  chunks = chunking.split(lines, CHUNK_MAX_TOKENS)
+  proposal = "x" * (llm.EXPECTED_OUTPUT_TOKENS * chunking.CHARS_PER_TOKEN)
+  linter_summary = run_linter(input_filename)
+  texts = [chunk.text for chunk in chunks] if chunks else [preprocess_input(input_filename)]
+  proposer_model = PROPOSER_REVIEWER if chunks or not POLICY.cascades(len(lines)) else POLICY.cascade_model
+
+  calls = []
+  for text in texts:
+    calls.append(preflight.Call(0, "Proposer", proposer_model, llm.prompt_tokens(proposer_messages(problem_statement, rubric, text))))
+    calls.append(preflight.Call(1, "Reviewer", PROPOSER_REVIEWER,
+      llm.prompt_tokens(reviewer_messages(problem_statement, rubric, text, proposal, linter_summary))))
+  if chunks:
+    calls.append(preflight.Call(2, "ChunkSummary", PROPOSER_REVIEWER,
+      llm.prompt_tokens(chunk_summary_messages(problem_statement, rubric, proposal * len(chunks)))))
+  if SUMMARY_MODE == 'llm':
+    calls.append(preflight.Call(3, "Summarizer", SUMMARIZER, llm.prompt_tokens(summarizer_messages(proposal))))
+  return preflight.Estimate(input_filename, calls, len(chunks) if chunks else 0)
+
+# Model for the proposer; chunked submissions always use the full model
+def route_stage(job, chunks):
+  if chunks:
+    return PROPOSER_REVIEWER
+  return POLICY.proposer_model(PROPOSER_REVIEWER, count_lines(job.input_filename), submission = job.input_filename)
+
+# A proposal from the cascade model that fails is retried on the full model
+def propose_stage(job, submission_program, chunks, proposer_model):
+  try:
+    return call_proposer(job.problem_statement, job.rubric, submission_program, job.input_filename, chunks, job.on_annotation, proposer_model)
+  except RuntimeError as e:
+    if proposer_model == PROPOSER_REVIEWER:
+      raise
+    policy.record('escalate', job.input_filename, proposer_model = PROPOSER_REVIEWER, reason = str(e))
+    return call_proposer(job.problem_statement, job.rubric, submission_program, job.input_filename, chunks, job.on_annotation)
+
+# Whether the proposal needs the reviewer pass (see policy.py)
+def decide_stage(job, proposal, linter_summary, chunks):
+  if chunks:
+    return True
+  diagnostics, error = linter.diagnostics(job.input_filename)
+  return POLICY.review(proposal.annotations, count_lines(job.input_filename), None if error else len(diagnostics),
+                       submission = job.input_filename, lint_error = error)
+
+# A skipped review keeps the proposal as the final feedback
+def review_stage(job, submission_program, proposal, linter_summary, chunks, review_needed):
+  if not review_needed:
+    pipeline.audit.write_json(intermediate_file(job.input_filename, "_final.json"), proposal.model_dump())
+    return proposal
+  return call_reviewer(job.problem_statement, job.rubric, submission_program, job.input_filename, proposal, linter_summary, chunks, job.on_annotation)
+
+# Add the annotations of the shared functions, reviewed once for the cohort
+def merge_stage(job, feedback):
+  if not job.shared_annotations:
+    return feedback
+  annotations = chunking.merge_annotations([feedback.annotations, job.shared_annotations])
+  return FeedbackResponse(annotations = annotations, summary = feedback.summary)
+
+def render_stage(job, final):
+  postprocess(job.input_filename, final)
+  return feedback_file(job.input_filename)
+
+# Stage names of the LLM stages match the checkpoints in manifest.STAGES
+PIPELINE = pipeline.Pipeline([
+  pipeline.Stage('preprocess', preprocess_stage, produces = 'submission_program'),
+  pipeline.Stage('lint', lint_stage, produces = 'linter_summary'),
+  pipeline.Stage('chunk', chunk_stage, produces = 'chunks'),
+  pipeline.Stage('route', route_stage, requires = ['chunks'], produces = 'proposer_model'),
+  pipeline.Stage('proposer', propose_stage, requires = ['submission_program', 'chunks', 'proposer_model'], produces = 'proposal'),
+  pipeline.Stage('policy', decide_stage, requires = ['proposal', 'linter_summary', 'chunks'], produces = 'review_needed'),
+  pipeline.Stage('reviewer', review_stage, requires = ['submission_program', 'proposal', 'linter_summary', 'chunks', 'review_needed'], produces = 'feedback'),
+  pipeline.Stage('merge', merge_stage, requires = ['feedback'], produces = 'final'),
+  pipeline.Stage('postprocess', render_stage, requires = ['final'], produces = 'output'),
+])
+
+# Artifacts of the stages completed in an earlier run, read back from their audit files.
+# A file that cannot be read back (e.g. left truncated by an older run) restarts the
+# submission from the proposer.
+def resume_artifacts(input_filename, start):
+  try:
+    if start == 'reviewer':
+      return {'proposal': load_feedback(intermediate_file(input_filename, "_intermediate.json"))}
+    if start == 'postprocess':
+      return {'feedback': load_feedback(intermediate_file(input_filename, "_final.json"))}
+  except (OSError, ValueError) as e:
+    print(f"Restarting {input_filename}: cannot resume from {start}: {e}")
+  return {}
+
+# Run the full (proposer | linter) -> reviewer -> postprocess pipeline for one submission.
+# A failing stage raises pipeline.StageError. With a manifest checkpoint, stages that
+# already completed are skipped and each completed stage is recorded. elided are the
+# shared functions (dedup.Function) left out of the prompt and shared_annotations
+# their annotations. With STREAM=1, on_annotation(stage, annotation) is called with each
+# proposer and reviewer annotation as it arrives. Returns the final feedback, or None if
+# the submission was done.
+def generate_feedback(input_filename, problem_statement, rubric, checkpoint = None, elided = (), shared_annotations = (), on_annotation = None):
+
+  start = checkpoint.next_stage(stage_artifacts(input_filename)) if checkpoint else manifest.STAGES[0]
+  if start == manifest.DONE:
+    return None
+
+  def on_done(stage):
+    if checkpoint and stage in manifest.STAGES:
+      checkpoint.done(stage)
+
+  # Reviewed annotations are rendered as they arrive
+  def listen(stage, annotation):
+    if stage == "Reviewer":
+      comment_block(annotation.comment)
+    if on_annotation:
+      on_annotation(stage, annotation)
+
+  make_output_dirs(input_filename)
+  job = pipeline.Job(input_filename, problem_statement = problem_statement, rubric = rubric,
+    elided = list(elided), shared_annotations = list(shared_annotations), on_annotation = listen)
+  try:
+    return PIPELINE.run(job, resume_artifacts(input_filename, start), on_done)['final']
+  except Exception as e:
+    if checkpoint:
+      checkpoint.failed(e)
+    raise
+
+# Give an exact duplicate of another submission that submission's feedback (already
+# remapped to its lines) without any LLM call
+def reuse_feedback(input_filename, feedback, checkpoint = None):
+  make_output_dirs(input_filename)
+  try:
+    pipeline.audit.write_json(intermediate_file(input_filename, "_final.json"), feedback.model_dump())
+    postprocess(input_filename, feedback)
+  except Exception as e:
+    if checkpoint:
+      checkpoint.failed(e)
+    raise
+  if checkpoint:
+    for stage in manifest.STAGES:
+      checkpoint.done(stage)
+
+def main():
+
+  parser = argparse.ArgumentParser()
+  parser.add_argument("input_program_filepath", help = "Path of C program to be evaluated")
+  parser.add_argument("--profile", metavar = "PATH", help = "Write a Chrome/Perfetto timeline of the run to PATH")
+  args = parser.parse_args()
+  input_filename = Path(args.input_program_filepath)
+  if args.profile:
+    tracing.enable()
+
+  def show(stage, annotation):
+    print(f"[{stage}] line {annotation.line_number} ({annotation.severity}): {annotation.comment}", flush = True)
+
+  problem_statement, rubric = load_shared_inputs()
+  generate_feedback(input_filename, problem_statement, rubric, on_annotation = show)
+  pipeline.audit.flush()
+  if args.profile:
+    tracing.write(args.profile)
 
   print(f"Feedback generation complete for {input_filename}. Output saved.")
 
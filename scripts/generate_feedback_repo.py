@@ -1,15 +1,24 @@
-import subprocess
 from pathlib import Path
-from unidiff import PatchSet
 import os
 import sys
-from openai import OpenAI
+import time
 from pydantic import BaseModel, Field
 import json
 import textwrap
 from dotenv import load_dotenv
-import datetime
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import excerpt
+import linter
+import llm
+import metrics
+import pipeline
+import policy
+import prompts
+import repo_diff
+import sharding
+import tracing
 
 THRESHOLD = 10
 
@@ -26,10 +35,22 @@ INTER_DIR = os.getenv('INTER_DIR')
 # LLM Models
 PROPOSER_REVIEWER = os.getenv('PROPOSER_REVIEWER')
 
+# Lines of context sent around each modified hunk (see excerpt.py); 'all' sends whole files
+REPO_CONTEXT_LINES = os.getenv('REPO_CONTEXT_LINES', '10')
+CONTEXT_LINES = None if REPO_CONTEXT_LINES == 'all' else int(REPO_CONTEXT_LINES)
+
+# Files graded concurrently across all student repos of a run
+WORKERS = int(os.getenv('WORKERS', '8'))
+
+# When the reviewer pass is skipped and which files are proposed on CASCADE_MODEL (see
+# policy.py); the size signals are the lines sent and the modified hunk lines
+POLICY = policy.Policy.from_env()
+
 # ===================== UTILS ====================================
 
 # This function inserts line numbers in the original submission (like 1 | #include <stdio>)
 # This makes it easier for the LLM to tell us where the annotations will be placed
+@tracing.traced
 def preprocess_input(input_filename):
   i = 0
   submission_program = [] 
@@ -44,51 +65,21 @@ def preprocess_input(input_filename):
   submission_program = ''.join(submission_program)
   return submission_program 
 
-# This function calls the clang-tidy linter on the C program file and makes LLM call
-# to summarize the linter output in a more readable format.
+# This function calls the clang-tidy linter on the C program file and turns its output into
+# a compact, ranked list of diagnostics for the reviewer prompt (see linter.py). The
+# clang-tidy run itself is usually served from the cohort-wide lint cache.
+@tracing.traced
 def run_linter(input_filename):
 
-  try:
-    process = subprocess.Popen(['clang-tidy', input_filename, '--', '-Wall','-std=c11'], stdout = subprocess.PIPE, stderr = subprocess.PIPE, text = True)
-    linter_output, error_output = process.communicate()
-    if error_output.returncode != 0:
-      return f"clang-tidy exited with code {error_output.returncode}: {error_output}"
-
-    try:
-      response = client.responses.create(
-          model="gpt-4.1-nano",
-          input = [
-              {"role": "user", "content": "The following is output from a linter. Please retain the essential points only. These will be used to guide an LLM-based automated programming feedback tool"},
-              {"role": "user",
-               "content": linter_output} 
-          ]
-      )
-      return response.output_text
-    except Exception as api_error:
-      return f"API call error for linter output: {str(api_error)}"
+  diagnostics, error = linter.diagnostics(input_filename)
+  if error:
+    return error
+  return linter.render_diagnostics(diagnostics)
+
+# Path of a per-file file in intermediates/, e.g. proc.c_intermediate.json
+def intermediate_file(input_filename, suffix):
+  return Path(INTER_DIR) / input_filename.relative_to(INPUT_DIR).parent / f"{input_filename.stem}{suffix}"
 
-  except FileNotFoundError:
-    return "Error: clang-tidy not found. Please ensure it is installed and in path"
-  except subprocess.SubprocessError as e:
-    return f"Subprocess error: {str(e)}"
-  except Exception as e:
-    return f"Unexpected error: {str(e)}"
-
-# Write number of input/cached/output tokens per API call
-def write_log(response, id_str, input_filename):
-  log_file = Path(INTER_DIR) / input_filename.relative_to(INPUT_DIR).parent / f"{input_filename.stem}_log.txt"
-
-  # If file exists before first log write during this call, overwrite it
-  permission = 'w' if id_str == "Proposer" else 'a'
-
-  with open(log_file, permission) as f:
-    response_dict = response.model_dump()
-    cached_tokens = response_dict['usage']['input_tokens_details']['cached_tokens']
-    prompt_tokens = response_dict['usage']['input_tokens']
-    output_tokens = response_dict['usage']['output_tokens']
-    timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    f.write(f"{timestamp} : {id_str} Input / Cached / Output tokens: {prompt_tokens} / {cached_tokens} / {output_tokens}\n")
- 
 # ========================= STUCTURED OUTPUT SCHEMA ================
 # Structured output template
 class Annotation(BaseModel):
@@ -101,123 +92,78 @@ class FeedbackResponse(BaseModel):
   annotations: list[Annotation] = Field(description="List of line-specific code feedback")
 
 # ======================================================================
-client = OpenAI()
 
+# The cohort-invariant part of each prompt comes first so that it is served from the
+# provider's prompt cache across files and students (see prompts.py)
+SYSTEM_PROMPT = "Your role is to act as an OS course TA who provides qualitative feedback on student C programming assignment. Feedback is good when it is relevant for education of undergraduate computer science students, and it is not overwhelming in quantity. Please stick to the rubric."
 
-# Proposer generates a first draft of annotations 
-def call_proposer(problem_statement, rubric, submission_program, input_filename):
+REVIEWER_SYSTEM_PROMPT = SYSTEM_PROMPT + " Specifically, your role is to act as a reviewer of feedback comments proposed by a Proposer LLM."
 
-  prompt = f"""For an OS assignment on xv6 OS, the student has made modifications to the xv6 repo in repose to following problem statement. Here is one file from the repo that has been modified with the added lines prepended by + symbol. Note that this is only a part of the solution of the assignment. 
+INTRO = "For an OS assignment on xv6 OS, the student has made modifications to the xv6 repo in repose to following problem statement. One file from the repo that has been modified, with the added lines prepended by + symbol, is given in the next message. Note that this is only a part of the solution of the assignment."
 
-  <problem_statement>
-  {problem_statement}
-  </problem_statement>
-  
-  <submission>
-  {submission_program}
-  </submission>
+PROPOSER_INSTRUCTIONS = "Suggest a list of annotations (comments) of feedback based on the rubric. Adhere to the structured output schema. Give feedback on the modified lines. It's okay to not give any feedback if there's is not a strong need for one."
 
-  <rubric>
-  {rubric}
-  </rubric>
-  
-  Suggest a list of annotations (comments) of feedback based on the rubric. Adhere to the structured output schema. Give feedback on the modified lines. It's okay to not give any feedback if there's is not a strong need for one.
-  """
+REVIEWER_INSTRUCTIONS = """The next message also contains a list of proposed annotations. Look at them and do the following:
+1. For each annotation, check if line number is correct and if annotation is useful to give and valid
+2. Discard annotations which are not very helpful and may clutter."""
+
+# Proposer generates a first draft of annotations 
+@tracing.traced
+def call_proposer(problem_statement, rubric, submission_program, input_filename, model = None):
 
   try:
-    proposer_response = client.responses.parse(
-      model = PROPOSER_REVIEWER,
-      input=[
-        {"role": "system", "content": "Your role is to act as an OS course TA who provides qualitative feedback on student C programming assignment. Feedback is good when it is relevant for education of undergraduate computer science students, and it is not overwhelming in quantity. Please stick to the rubric."},
-        {
-          "role": "user",
-          "content": prompt,
-        },
-      ],
+    proposer_response, initial_feedback = llm.parse_response(
+      model = model or PROPOSER_REVIEWER,
+      input = prompts.assemble(SYSTEM_PROMPT,
+        prompts.shared_prefix(INTRO, problem_statement, rubric, PROPOSER_INSTRUCTIONS),
+        prompts.section("submission", submission_program)),
       text_format=FeedbackResponse, 
+      stage = "Proposer",
+      submission = input_filename,
     )
   except Exception as api_error:
-    return f"API call error for proposer: {str(api_error)}"
-
-  initial_feedback = proposer_response.output_parsed
+    raise RuntimeError(f"API call error for proposer: {str(api_error)}")
 
-  json_file = Path(INTER_DIR) / input_filename.relative_to(INPUT_DIR).parent / f"{input_filename.stem}_intermediate.json"
-
-  with open(json_file, 'w') as f:
-    json.dump(initial_feedback.model_dump(), f, indent = 4, ensure_ascii=False)
-  
-  write_log(proposer_response, "Proposer", input_filename)
+  pipeline.audit.write_json(intermediate_file(input_filename, "_intermediate.json"), initial_feedback.model_dump())
+  return initial_feedback
 
 # Reviewer reviews the feedback generated by Proposer and integrates output from clang-tidy linter
-def call_reviewer(problem_statement, rubric, submission_program, input_filename):
-
-  json_file = Path(INTER_DIR) / input_filename.relative_to(INPUT_DIR).parent / f"{input_filename.stem}_intermediate.json"
+@tracing.traced
+def call_reviewer(problem_statement, rubric, submission_program, input_filename, proposal):
 
-  try:
-    with open(json_file, 'r') as f:
-      proposer_output_data = json.load(f)
-  except FileNotFoundError:
-    print(f"Error: {json_file} not found")
-    
-  proposal_json = json.dumps(proposer_output_data)
+  proposal_json = json.dumps(proposal.model_dump())
 
-  prompt = f"""For an OS assignment on xv6 OS, the student has made modifications to the xv6 repo in repose to following problem statement. Here is one file from the repo that has been modified with the added lines prepended by + symbol. Note that this is only a part of the solution of the assignment. 
-
-  <problem_statement>
-  {problem_statement}
-  </problem_statement>
-  
-  <submission>
-  {submission_program}
-  </submission>
-
-  <rubric>
-  {rubric}
-  </rubric>
- 
-  Look at the following list of annotations and the summary of feedback. Do the following:
-  1. For each annotation, check if line number is correct and if annotation is useful to give and valid
-  2. Discard annotations which are not very helpful and may clutter.
-  
-  <feedback>
-  {proposal_json}
-  </feedback>
-  """
   try:
-    reviewer_response = client.responses.parse(
+    reviewer_response, refined_feedback = llm.parse_response(
       model = PROPOSER_REVIEWER,
-      input=[
-        {"role": "system", "content": "Your role is to act as an OS course TA who provides qualitative feedback on student C programming assignment. Feedback is good when it is relevant for education of undergraduate computer science students, and it is not overwhelming in quantity. Please stick to the rubric. Specifically, your role is to act as a reviewer of feedback comments proposed by a Proposer LLM."},
-        {
-          "role": "user",
-          "content": prompt,
-        },
-      ],
+      input = prompts.assemble(REVIEWER_SYSTEM_PROMPT,
+        prompts.shared_prefix(INTRO, problem_statement, rubric, REVIEWER_INSTRUCTIONS),
+        prompts.section("submission", submission_program),
+        prompts.section("feedback", proposal_json)),
       text_format=FeedbackResponse, 
+      stage = "Reviewer",
+      submission = input_filename,
     )
   except Exception as api_error:
-    return f"API call error for proposer: {str(api_error)}"
-
-  refined_feedback = reviewer_response.output_parsed
+    raise RuntimeError(f"API call error for reviewer: {str(api_error)}")
   
-  json_file = Path(INTER_DIR) / input_filename.relative_to(INPUT_DIR).parent / f"{input_filename.stem}_final.json"
-
-  with open(json_file, 'w') as f:
-    json.dump(refined_feedback.model_dump(), f, indent = 4, ensure_ascii=False)
-
-  write_log(reviewer_response, "Reviewer", input_filename)
+  pipeline.audit.write_json(intermediate_file(input_filename, "_final.json"), refined_feedback.model_dump())
+  return refined_feedback
 
+# The feedback.c of the directory of a graded file
+def feedback_path(input_filename):
+  return Path(OUTPUT_DIR) / input_filename.parent.relative_to(INPUT_DIR) / Path('feedback.c')
 
-def postprocess(input_filename):
+# The section of feedback.c for one file: its header and each annotated line with the
+# annotation's comment block. Empty when there are no annotations.
+@tracing.traced
+def postprocess(input_filename, feedback):
 
-  json_file = Path(INTER_DIR) / input_filename.relative_to(INPUT_DIR).parent / f"{input_filename.stem}_final.json"
-
-  f = open(json_file, 'r')
-  x = json.load(f)
+  x = feedback.model_dump()
   
   # If there are no annotations, skip writing to output file
   if len(x['annotations']) == 0:
-     return
+     return ''
 
   annotation_dict = {}
   for annotation in x['annotations']:
@@ -228,25 +174,39 @@ def postprocess(input_filename):
       annotation_dict[int(line_number)] = formatted_comment 
   
   f_input = open(input_filename, 'r')
-  
-  output_filename = Path(OUTPUT_DIR) / input_filename.parent.relative_to(INPUT_DIR) / Path('feedback.c')
 
-  f_output = open(output_filename, 'a')
+  out = []
   i = 0
-  f_output.write(f'\n/*============================{input_filename.name}=========================================/*\n')
+  out.append(f'\n/*============================{input_filename.name}=========================================/*\n')
   for line in f_input:
       i += 1
       if i in annotation_dict.keys():
           comment = annotation_dict[i]
           comment = "\n" + comment + "\n"
-          f_output.write(comment)
-          f_output.write(f"line {i}: {line[2:]}") 
+          out.append(comment)
+          out.append(f"line {i}: {line[2:]}") 
       
   f_input.close()
-  f_output.close()
-
-def generate_file_feedback(input_filename):
-
+  return ''.join(out)
+
+# Write the feedback.c of each directory of a repo from the sections of its graded files,
+# in file order. Files are replaced as a whole, so a re-run does not append duplicates.
+@tracing.traced
+def write_repo_feedback(sections):
+  by_path = {}
+  for input_filename, text in sections:
+    if text:
+      by_path.setdefault(feedback_path(input_filename), []).append(text)
+  for output_filename, texts in by_path.items():
+    os.makedirs(output_filename.parent, exist_ok = True)
+    tmp = output_filename.with_name(f"{output_filename.name}.{os.getpid()}.tmp")
+    with open(tmp, 'w') as f:
+      f.write(''.join(texts))
+    os.replace(tmp, output_filename)
+
+# Read the problem statement and rubric shared by every file in a run
+def load_shared_inputs():
+  problem_statement, rubric = None, None
   try:
     with open(PROBLEM_STATEMENT, 'r') as f:
       problem_statement = f.read()
@@ -258,35 +218,86 @@ def generate_file_feedback(input_filename):
       rubric = f.read()
   except FileNotFoundError:
     print(f"Error: {RUBRIC} not found")
-  
+
+  return problem_statement, rubric
+
+# ========================= PIPELINE ===============================
+# Stages of the per-file pipeline (see pipeline.py); artifacts are passed in memory
+
+# The numbered file, or only its modified hunks when the changed lines are known
+def preprocess_stage(job):
+  if job.hunk_lines is None or CONTEXT_LINES is None:
+    submission_program = preprocess_input(job.input_filename)
+    return excerpt.Excerpt(submission_program, shown = [])
+  with open(job.input_filename, 'r') as f:
+    lines = f.readlines()
+  return excerpt.excerpt(lines, job.hunk_lines, CONTEXT_LINES)
+
+# Lines of the file sent to the model and modified hunk lines (None when unknown)
+def size_signals(job, submission):
+  if submission.shown:
+    lines = len(submission.shown)
+  else:
+    lines = submission.text.count('\n')
+  return lines, len(job.hunk_lines) if job.hunk_lines is not None else None
+
+# A proposal from the cascade model that fails is retried on the full model
+def propose_stage(job, submission):
+  lines, changed_lines = size_signals(job, submission)
+  model = POLICY.proposer_model(PROPOSER_REVIEWER, lines, changed_lines, submission = job.input_filename)
+  try:
+    return call_proposer(job.problem_statement, job.rubric, submission.text, job.input_filename, model)
+  except RuntimeError as e:
+    if model == PROPOSER_REVIEWER:
+      raise
+    policy.record('escalate', job.input_filename, proposer_model = PROPOSER_REVIEWER, reason = str(e))
+    return call_proposer(job.problem_statement, job.rubric, submission.text, job.input_filename)
+
+# A proposal the review policy accepts as it is becomes the final feedback
+def review_stage(job, submission, proposal):
+  lines, changed_lines = size_signals(job, submission)
+  if not POLICY.review(proposal.annotations, lines, changed_lines = changed_lines, submission = job.input_filename):
+    pipeline.audit.write_json(intermediate_file(job.input_filename, "_final.json"), proposal.model_dump())
+    return proposal
+  return call_reviewer(job.problem_statement, job.rubric, submission.text, job.input_filename, proposal)
+
+# Annotations on lines left out of the excerpt are moved to the nearest shown line
+def render_stage(job, submission, feedback):
+  return postprocess(job.input_filename, submission.remap(feedback))
+
+PIPELINE = pipeline.Pipeline([
+  pipeline.Stage('preprocess', preprocess_stage, produces = 'submission'),
+  pipeline.Stage('proposer', propose_stage, requires = ['submission'], produces = 'proposal'),
+  pipeline.Stage('reviewer', review_stage, requires = ['submission', 'proposal'], produces = 'feedback'),
+  pipeline.Stage('postprocess', render_stage, requires = ['submission', 'feedback'], produces = 'output'),
+])
+
+# hunk_lines: the 1-based line numbers covered by the file's diff hunks. Returns the
+# file's section of feedback.c, or None if grading failed.
+@tracing.traced
+def generate_file_feedback(input_filename, problem_statement, rubric, hunk_lines = None):
+
   # Create intermediate directories in output/ and intermediates/ if needed
   output_path = Path(OUTPUT_DIR) / input_filename.parent.relative_to(INTER_DIR)
   os.makedirs(output_path, exist_ok = True)
 
-  submission_program = preprocess_input(input_filename) 
-  call_proposer(problem_statement, rubric, submission_program, input_filename)
-  call_reviewer(problem_statement, rubric, submission_program, input_filename)
-  
-  postprocess(input_filename)
-
-  print(f"Feedback generation complete for {input_filename}. Output saved.")
-
-def main():
-
-    print(INTER_DIR)
-    parser = argparse.ArgumentParser()
-    parser.add_argument("source_repo_path", help = "Path of original repo (source)")
-    parser.add_argument("target_repo_path", help = "Path of modified repo (target)")
-    args = parser.parse_args()
-    source_repo = Path(args.source_repo_path)
-    target_repo = Path(args.target_repo_path)
-
-    process = subprocess.Popen(['diff', '-r', '-u', source_repo, target_repo], stdout = subprocess.PIPE, stderr = subprocess.PIPE, text = True)
-    diff_out, diff_err = process.communicate()
-    os.makedirs(Path(INTER_DIR) / target_repo.parent.relative_to('input'), exist_ok=True)
+  job = pipeline.Job(input_filename, problem_statement = problem_statement, rubric = rubric, hunk_lines = hunk_lines)
+  try:
+    return PIPELINE.run(job)['output']
+  except pipeline.StageError as e:
+    print(f"Feedback generation failed for {input_filename}: {e}")
+    return None
+
+# Diff a student repo against the base index and write the copies of its modified files
+# with the changed lines marked; returns [(marked copy, hunk lines)] in file order
+@tracing.traced
+def prepare_repo(index, target_repo):
+    with metrics.timed('local', 'diff', submission = target_repo), tracing.span('diff', repo = target_repo):
+      file_diffs = repo_diff.diff_repo(index, target_repo)
     diff_filename = Path(INTER_DIR) / target_repo.relative_to('input') / 'repo.diff'
+    os.makedirs(diff_filename.parent, exist_ok=True)
     with open(diff_filename, 'w') as f:
-        f.write(diff_out)
+        f.write(''.join(file_diff.text for file_diff in file_diffs))
 
     """
     # Generate feedback for new files (files only in target_repo) 
@@ -308,36 +319,109 @@ def main():
             f_input.close()
             f_output.close() 
 
-            generate_file_feedback(output_filename)
+            generate_file_feedback(output_filename, problem_statement, rubric)
     """
-      # Generate feedback for modified files
-    patch = PatchSet.from_filename(diff_filename)
-    for p in patch:
-        if Path(p.source_file).suffix == '.c':
-            input_filename = Path(p.target_file)
-            hunk_set = set() 
-
-            for hunk in p:
-                for i in range(hunk.target_length):
-                    hunk_set.add(hunk.target_start + i)
+    files = []
+    for file_diff in file_diffs:
+            input_filename = target_repo / file_diff.name
+            hunk_set = file_diff.hunk_lines
 
             if len(hunk_set) < THRESHOLD:
                 continue
-            f_input = open(input_filename, 'r')
             output_filename = Path(INTER_DIR) / input_filename.parent.relative_to('input') / f"{input_filename.name}"
+            os.makedirs(output_filename.parent, exist_ok=True)
 
             f_output = open(output_filename, 'w')
             i = 0
-            for line in f_input:
+            for line in file_diff.lines:
                 i += 1
                 if i in hunk_set: 
                     f_output.write('+ ' + line)
                 else:
                     f_output.write(line) 
             
-            f_input.close()
             f_output.close()
-            generate_file_feedback(output_filename)
+            files.append((output_filename, hunk_set))
+    return files
+
+# Grade the modified files of all student repos on one pool of WORKERS threads, so that
+# files of different repos are graded concurrently. A repo's feedback.c files are
+# written as soon as all of its files are done. Returns the repos with a failed file.
+def grade_repos(source_repo, target_repos, problem_statement, rubric, workers):
+    # The base tree is indexed once per assignment; only files whose hash differs
+    # from the base are diffed (see repo_diff.py)
+    index = repo_diff.load_index(source_repo, INTER_DIR)
+    repo_files = {target_repo: prepare_repo(index, target_repo) for target_repo in target_repos}
+    total = sum(len(files) for files in repo_files.values())
+    print(f"Grading {total} modified files of {len(target_repos)} repos with {workers} workers")
+
+    sections = {target_repo: [None] * len(files) for target_repo, files in repo_files.items()}
+    remaining = {target_repo: len(files) for target_repo, files in repo_files.items()}
+    failed = set()
+    start = time.perf_counter()
+    for target_repo in target_repos:
+        if not remaining[target_repo]:
+            print(f"No modified files to grade in {target_repo}")
+
+    with ThreadPoolExecutor(max_workers = workers, thread_name_prefix = "worker") as executor:
+        futures = {}
+        for target_repo, files in repo_files.items():
+            for position, (input_filename, hunk_set) in enumerate(files):
+                future = executor.submit(generate_file_feedback, input_filename, problem_statement, rubric, hunk_set)
+                futures[future] = (target_repo, position, input_filename)
+
+        for done, future in enumerate(as_completed(futures), start = 1):
+            target_repo, position, input_filename = futures[future]
+            try:
+                text = future.result()
+            except Exception as e:
+                print(f"Feedback generation failed for {input_filename}: {e}")
+                text = None
+            if text is None:
+                failed.add(target_repo)
+            sections[target_repo][position] = (input_filename, text)
+            remaining[target_repo] -= 1
+            if not remaining[target_repo]:
+                write_repo_feedback(sections[target_repo])
+                status = "Done with failures" if target_repo in failed else "Done"
+                print(f"[{done}/{total}] {status}: {target_repo} ({len(repo_files[target_repo])} files, {time.perf_counter() - start:.1f}s)")
+    return failed
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source_repo_path", help = "Path of original repo (source)")
+    parser.add_argument("target_repo_path", nargs = "+", help = "Path of one or more modified repos (targets)")
+    parser.add_argument("--workers", type = int, default = WORKERS, help = f"Files graded concurrently across all repos (default: {WORKERS})")
+    parser.add_argument("--shard", type = sharding.parse_shard, metavar = "i/N", help = "Grade only the i-th of N balanced shards of the repos")
+    parser.add_argument("--profile", nargs = "?", const = str(Path(INTER_DIR or 'intermediates') / 'trace.json'), metavar = "PATH",
+                        help = "Write a Chrome/Perfetto timeline of the run (default: INTER_DIR/trace.json)")
+    args = parser.parse_args()
+    if args.profile:
+        tracing.enable()
+    source_repo = Path(args.source_repo_path)
+    target_repos = [Path(path) for path in args.target_repo_path]
+    problem_statement, rubric = load_shared_inputs()
+    metrics.set_cohort(os.getenv('COHORT') or target_repos[0].parent)
+    if args.shard:
+        # Repos are weighed by the size of their modified files and named by their path
+        # relative to the working directory (often all end in the same folder name)
+        index = repo_diff.load_index(source_repo, INTER_DIR)
+        sizes = {target_repo: repo_diff.changed_bytes(index, target_repo) // 4 + 1 for target_repo in target_repos}
+        target_repos = sharding.select(target_repos, args.shard, sizes.get, INTER_DIR, name = os.path.relpath)
+
+    start = time.perf_counter()
+    failed = grade_repos(source_repo, target_repos, problem_statement, rubric, args.workers)
+    pipeline.audit.flush()
+    if args.shard:
+        sharding.record_result(INTER_DIR, [os.path.relpath(target_repo) for target_repo in failed])
+    if args.profile:
+        tracing.write(args.profile)
+    print(f"Processing complete! {len(target_repos) - len(failed)} repos succeeded, {len(failed)} with failures in {time.perf_counter() - start:.1f}s")
+    print(llm.usage_report())
+    print(llm.get_scheduler().stats())
+    if failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
    main()
\ No newline at end of file
@@ -0,0 +1,129 @@
+import datetime
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import manifest
+import metrics
+
+# Local job queue of the feedback worker (run_tool.py --serve): a SQLite table of
+# submissions to grade, shared by the worker and any number of `run_tool.py --submit`
+# processes. A submission pushed again while it is still queued is not queued twice,
+# and one pushed again with unchanged content while it is running or already done is
+# not queued at all; changed content queues a new job.
+
+# Job states in order
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+def now():
+  return datetime.datetime.now().isoformat(timespec = 'seconds')
+
+class Job:
+  """A claimed job: the submission to grade and when it was pushed."""
+
+  def __init__(self, id, path, input_hash, submitted):
+    self.id = id
+    self.path = Path(path)
+    self.input_hash = input_hash
+    self.submitted = submitted
+
+class JobQueue:
+
+  def __init__(self, path):
+    Path(path).parent.mkdir(parents = True, exist_ok = True)
+    self._lock = threading.Lock()
+    # Several processes use the queue; wait for each other's writes instead of failing
+    self._db = sqlite3.connect(str(path), check_same_thread = False, timeout = 30, isolation_level = None)
+    self._db.execute("PRAGMA journal_mode = WAL")
+    with self._lock:
+      self._db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        path TEXT NOT NULL,
+        input_hash TEXT NOT NULL,
+        status TEXT NOT NULL,
+        submitted REAL NOT NULL,
+        started REAL,
+        finished REAL,
+        error TEXT,
+        updated TEXT NOT NULL)""")
+      self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+      self._db.execute("CREATE INDEX IF NOT EXISTS jobs_path ON jobs (path, id)")
+
+  # Run fn(cursor) in one write transaction
+  def _write(self, fn):
+    with self._lock:
+      cursor = self._db.cursor()
+      cursor.execute("BEGIN IMMEDIATE")
+      try:
+        result = fn(cursor)
+        cursor.execute("COMMIT")
+        return result
+      except BaseException:
+        cursor.execute("ROLLBACK")
+        raise
+
+  # Queue a submission; returns (job id, whether a new job was queued)
+  def push(self, path):
+    path = str(path)
+    input_hash = manifest.file_hash(path)
+
+    def push_job(cursor):
+      latest = cursor.execute("SELECT id, input_hash, status FROM jobs WHERE path = ? ORDER BY id DESC LIMIT 1", (path,)).fetchone()
+      if latest is not None:
+        job_id, latest_hash, status = latest
+        if status == QUEUED:
+          # Grade the newest content when the job is claimed
+          cursor.execute("UPDATE jobs SET input_hash = ?, updated = ? WHERE id = ?", (input_hash, now(), job_id))
+          return job_id, False
+        if latest_hash == input_hash and status in (RUNNING, DONE):
+          return job_id, False
+      cursor.execute("INSERT INTO jobs (path, input_hash, status, submitted, updated) VALUES (?, ?, ?, ?, ?)",
+        (path, input_hash, QUEUED, time.time(), now()))
+      return cursor.lastrowid, True
+
+    return self._write(push_job)
+
+  # Take the oldest queued job, or None
+  def claim(self):
+    def claim_job(cursor):
+      row = cursor.execute("SELECT id, path, input_hash, submitted FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (QUEUED,)).fetchone()
+      if row is None:
+        return None
+      cursor.execute("UPDATE jobs SET status = ?, started = ?, updated = ? WHERE id = ?", (RUNNING, time.time(), now(), row[0]))
+      return Job(*row)
+
+    return self._write(claim_job)
+
+  def finish(self, job, error = None):
+    status = FAILED if error is not None else DONE
+    self._write(lambda cursor: cursor.execute("UPDATE jobs SET status = ?, finished = ?, error = ?, updated = ? WHERE id = ?",
+      (status, time.time(), None if error is None else str(error), now(), job.id)))
+
+  # Jobs left running by a worker that died are queued again
+  def recover(self):
+    return self._write(lambda cursor: cursor.execute("UPDATE jobs SET status = ?, started = NULL, updated = ? WHERE status = ?",
+      (QUEUED, now(), RUNNING)).rowcount)
+
+  # Queue depth, job counts, running jobs and latency percentiles of the last `recent`
+  # finished jobs (queue wait: pushed to started; latency: pushed to finished)
+  def status(self, recent = 100):
+    with self._lock:
+      counts = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+      running = self._db.execute("SELECT id, path, started FROM jobs WHERE status = ? ORDER BY id", (RUNNING,)).fetchall()
+      finished = self._db.execute("""SELECT id, path, status, submitted, started, finished, error FROM jobs
+        WHERE status IN (?, ?) ORDER BY finished DESC LIMIT ?""", (DONE, FAILED, recent)).fetchall()
+    current = time.time()
+    latencies = [row[5] - row[3] for row in finished]
+    waits = [row[4] - row[3] for row in finished]
+    return {
+      'queue_depth': counts.get(QUEUED, 0),
+      'counts': counts,
+      'running': [{'id': job_id, 'path': path, 'elapsed': round(current - started, 1)} for job_id, path, started in running],
+      'latency_p50': round(metrics.percentile(latencies, 50), 2),
+      'latency_p95': round(metrics.percentile(latencies, 95), 2),
+      'queue_wait_p95': round(metrics.percentile(waits, 95), 2),
+      'recent': [{'id': job_id, 'path': path, 'status': status, 'queue_wait': round(started - submitted, 2),
+                  'latency': round(finished_at - submitted, 2), 'error': error}
+                 for job_id, path, status, submitted, started, finished_at, error in finished[:20]],
+    }
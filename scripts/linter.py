@@ -0,0 +1,222 @@
+import functools
+import hashlib
+import os
+import re
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from pydantic import BaseModel
+
+import metrics
+import tracing
+from llm_cache import ResponseCache
+
+# clang-tidy as a separate pipeline stage. Linting only depends on the source
+# file, so the whole cohort is linted up front on a process pool and the raw
+# output is cached, in memory for the run and on disk (under CACHE_DIR/lint)
+# across runs, keyed on the file contents, the clang-tidy version and the flags.
+# The output is parsed locally into ranked, de-duplicated diagnostics.
+
+CLANG_TIDY_FLAGS = ['--', '-Wall', '-std=c11']
+
+# Maximum number of distinct diagnostics passed on to the reviewer
+MAX_DIAGNOSTICS = int(os.getenv('LINT_MAX_DIAGNOSTICS', '15'))
+
+# e.g. wish.c:42:5: warning: Value stored to 'x' is never read [clang-analyzer-deadcode.DeadStores]
+DIAGNOSTIC_RE = re.compile(r'^(?P<file>.+?):(?P<line>\d+):(?P<column>\d+): (?P<severity>error|warning): (?P<message>.*?)(?: \[(?P<check>[^\]]+)\])?$')
+
+SEVERITY_RANK = {'error': 0, 'warning': 1}
+
+# Checks that point at likely bugs are ranked above style checks
+CHECK_PRIORITY = ('clang-diagnostic-error', 'clang-analyzer-', 'bugprone-', 'cert-', 'clang-diagnostic-', 'concurrency-', 'misc-', 'performance-', 'portability-', 'readability-')
+
+_results = {}
+_lock = threading.Lock()
+_disk_cache = None
+
+@functools.lru_cache(maxsize = None)
+def clang_tidy_version():
+  try:
+    return subprocess.run(['clang-tidy', '--version'], capture_output = True, text = True).stdout.strip()
+  except FileNotFoundError:
+    return None
+
+def cache_key(input_filename):
+  with open(input_filename, 'rb') as f:
+    source = f.read()
+  payload = source + b'\0' + str(clang_tidy_version()).encode() + b'\0' + ' '.join(CLANG_TIDY_FLAGS).encode()
+  return hashlib.sha256(payload).hexdigest()
+
+def get_disk_cache():
+  global _disk_cache
+  cache_dir = os.getenv('CACHE_DIR')
+  if not cache_dir:
+    return None
+  with _lock:
+    if _disk_cache is None:
+      max_bytes = int(float(os.getenv('CACHE_MAX_MB', '500')) * 1024 * 1024)
+      max_age_seconds = int(float(os.getenv('CACHE_MAX_AGE_DAYS', '30')) * 24 * 3600)
+      _disk_cache = ResponseCache(Path(cache_dir) / 'lint', max_bytes, max_age_seconds)
+  return _disk_cache
+
+# Run clang-tidy on one file. Returns (True, output) on success and (False, error message)
+# otherwise; only successful runs are cached. Must stay a top-level function so that it
+# can be sent to worker processes.
+def run_clang_tidy(input_filename):
+  with metrics.timed('subprocess', 'clang-tidy', submission = input_filename) as call:
+    ok, output = _run_clang_tidy(input_filename)
+    if not ok:
+      call.update(status = 'error', error = output)
+  return ok, output
+
+# A clang-tidy run with when and in which process it ran, for the timeline (see tracing.py)
+def _timed_clang_tidy(input_filename):
+  start = tracing.now()
+  result = run_clang_tidy(input_filename)
+  return result, start, tracing.now(), os.getpid()
+
+def _run_clang_tidy(input_filename):
+  try:
+    process = subprocess.Popen(['clang-tidy', str(input_filename)] + CLANG_TIDY_FLAGS, stdout = subprocess.PIPE, stderr = subprocess.PIPE, text = True)
+    linter_output, error_output = process.communicate()
+    # clang-tidy also exits non-zero when the file has compiler errors; those are still diagnostics
+    if process.returncode != 0 and not linter_output.strip():
+      return False, f"clang-tidy exited with code {process.returncode}: {error_output}"
+    return True, linter_output
+  except FileNotFoundError:
+    return False, "Error: clang-tidy not found. Please ensure it is installed and in path"
+  except subprocess.SubprocessError as e:
+    return False, f"Subprocess error: {str(e)}"
+  except Exception as e:
+    return False, f"Unexpected error: {str(e)}"
+
+def _lookup(input_filename):
+  key = cache_key(input_filename)
+  with _lock:
+    if key in _results:
+      return key, _results[key]
+  disk_cache = get_disk_cache()
+  entry = disk_cache.get(key) if disk_cache else None
+  if entry is not None:
+    result = (True, entry['output_text'])
+    with _lock:
+      _results[key] = result
+    return key, result
+  return key, None
+
+def _store(key, result):
+  with _lock:
+    _results[key] = result
+  disk_cache = get_disk_cache()
+  if disk_cache and result[0]:
+    disk_cache.put(key, clang_tidy_version(), result[1])
+
+# Lint a single file, using the cache when possible
+def lint(input_filename):
+  key, result = _lookup(input_filename)
+  if result is None:
+    result = run_clang_tidy(input_filename)
+    _store(key, result)
+  return result
+
+# Lint every program of a cohort on a process pool; later lint() calls are served from the cache
+def lint_cohort(programs, workers = None):
+  pending = {}
+  for input_filename in programs:
+    key, result = _lookup(input_filename)
+    if result is None:
+      pending[key] = input_filename
+
+  if not pending:
+    return
+  print(f"Linting {len(pending)} uncached programs out of {len(programs)}")
+  timed = tracing.enabled()
+  with tracing.span('lint_cohort', programs = len(pending)), ProcessPoolExecutor(max_workers = workers) as executor:
+    for (key, input_filename), result in zip(pending.items(), executor.map(_timed_clang_tidy if timed else run_clang_tidy, pending.values())):
+      if timed:
+        result, start, end, pid = result
+        tracing.add_span('clang-tidy', start, end, track = f"clang-tidy {pid}", cat = 'subprocess', submission = input_filename)
+      _store(key, result)
+
+# ===================== DIAGNOSTICS ===============================
+
+class Diagnostic(BaseModel):
+  file: str
+  line: int
+  column: int
+  severity: str
+  check: str
+  message: str
+  # Further lines where the same check reported the same message
+  other_lines: list[int] = []
+
+def _priority(diagnostic):
+  check_rank = len(CHECK_PRIORITY)
+  for rank, prefix in enumerate(CHECK_PRIORITY):
+    if diagnostic.check.startswith(prefix):
+      check_rank = rank
+      break
+  return (SEVERITY_RANK.get(diagnostic.severity, len(SEVERITY_RANK)), check_rank, diagnostic.line)
+
+def _same_file(path, input_filename):
+  if input_filename is None:
+    return True
+  try:
+    return Path(path).resolve() == Path(input_filename).resolve()
+  except OSError:
+    return Path(path).name == Path(input_filename).name
+
+# Parse clang-tidy output into diagnostics for input_filename (headers are ignored).
+# Repeats of the same check and message are folded into one diagnostic, and the
+# result is ranked by severity and check category and capped at MAX_DIAGNOSTICS.
+def parse_diagnostics(linter_output, input_filename = None, limit = MAX_DIAGNOSTICS):
+  diagnostics = {}
+  for line in linter_output.splitlines():
+    match = DIAGNOSTIC_RE.match(line.strip())
+    if match is None or not _same_file(match['file'], input_filename):
+      continue
+    check = match['check'] or 'clang-diagnostic'
+    key = (check, match['message'])
+    if key in diagnostics:
+      diagnostics[key].other_lines.append(int(match['line']))
+      continue
+    diagnostics[key] = Diagnostic(
+      file = match['file'],
+      line = int(match['line']),
+      column = int(match['column']),
+      severity = match['severity'],
+      check = check,
+      message = match['message'],
+    )
+
+  ranked = sorted(diagnostics.values(), key = _priority)
+  return ranked[:limit] if limit else ranked
+
+# Compact text block for the reviewer prompt, one diagnostic per line
+def render_diagnostics(diagnostics):
+  if not diagnostics:
+    return "No clang-tidy diagnostics."
+  lines = []
+  for d in diagnostics:
+    also = ""
+    if d.other_lines:
+      also = f" (also line{'s' if len(d.other_lines) > 1 else ''} {', '.join(str(line) for line in d.other_lines)})"
+    lines.append(f"- line {d.line}{also}: {d.severity} [{d.check}] {d.message}")
+  return "\n".join(lines)
+
+# Map line number -> diagnostics reported on that line, for matching against annotations
+def diagnostics_by_line(diagnostics):
+  by_line = {}
+  for d in diagnostics:
+    for line in [d.line] + d.other_lines:
+      by_line.setdefault(line, []).append(d)
+  return by_line
+
+# Lint input_filename (through the cache) and return its ranked diagnostics, or
+# (None, error message) if clang-tidy could not be run
+def diagnostics(input_filename):
+  ok, linter_output = lint(input_filename)
+  if not ok:
+    return None, linter_output
+  return parse_diagnostics(linter_output, input_filename), None
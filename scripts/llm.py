@@ -0,0 +1,231 @@
+import json
+import os
+import threading
+import time
+from openai import OpenAI
+from openai.types.responses import Response
+
+import metrics
+import streaming
+import tracing
+from llm_cache import ResponseCache, CachedResponse
+from scheduler import RequestScheduler
+
+# Single entry point for all LLM calls made by generate_feedback.py,
+# generate_feedback_repo.py and the batch drivers. Every call goes through the
+# response cache (when CACHE_DIR is configured), the rate-limit scheduler and a
+# shared OpenAI client, and the token usage of each call is accumulated per stage and
+# recorded in the metrics ledger (see metrics.py).
+
+_client = None
+_cache = None
+_scheduler = None
+_lock = threading.Lock()
+
+# stage -> [calls, input tokens, cached input tokens, output tokens]
+_usage = {}
+
+# The openai response models are completed lazily on first use; doing that from several
+# worker threads at once can drop fields from the first responses, so build them up front
+Response.model_rebuild()
+
+# Rough size of the response, added to the prompt estimate when pacing tokens per minute
+EXPECTED_OUTPUT_TOKENS = int(os.getenv('EXPECTED_OUTPUT_TOKENS', '2000'))
+
+# The client is created on first use so that callers can load config.env first.
+# Retries are handled by the scheduler, so the client's own retries are disabled.
+def get_client():
+  global _client
+  with _lock:
+    if _client is None:
+      _client = OpenAI(max_retries = 0)
+  return _client
+
+def get_scheduler():
+  global _scheduler
+  with _lock:
+    if _scheduler is None:
+      _scheduler = RequestScheduler(
+        requests_per_minute = int(os.getenv('RATE_LIMIT_RPM', '0')) or None,
+        tokens_per_minute = int(os.getenv('RATE_LIMIT_TPM', '0')) or None,
+        max_retries = int(os.getenv('MAX_RETRIES', '6')),
+      )
+  return _scheduler
+
+# About four characters per token for English text and C code
+def prompt_tokens(input):
+  return len(json.dumps(input, ensure_ascii = False)) // 4
+
+def estimate_tokens(input):
+  return prompt_tokens(input) + EXPECTED_OUTPUT_TOKENS
+
+def usage_tokens(response):
+  if response.usage is None:
+    return None
+  return response.usage.input_tokens + response.usage.output_tokens
+
+# Returns None when caching is disabled (CACHE_DIR unset or empty)
+def get_cache():
+  global _cache
+  cache_dir = os.getenv('CACHE_DIR')
+  if not cache_dir:
+    return None
+  with _lock:
+    if _cache is None:
+      max_bytes = int(float(os.getenv('CACHE_MAX_MB', '500')) * 1024 * 1024)
+      max_age_seconds = int(float(os.getenv('CACHE_MAX_AGE_DAYS', '30')) * 24 * 3600)
+      _cache = ResponseCache(cache_dir, max_bytes, max_age_seconds)
+  return _cache
+
+# The JSON schema of a pydantic model as structured outputs take it in strict mode:
+# every object closed (additionalProperties false, all properties required) and no
+# $ref with sibling keys (pydantic adds the field's description next to it)
+def strict_schema(node, defs):
+  if isinstance(node, list):
+    return [strict_schema(item, defs) for item in node]
+  if not isinstance(node, dict):
+    return node
+  if '$ref' in node and len(node) > 1:
+    node = {**defs[node['$ref'].rsplit('/', 1)[-1]], **{key: value for key, value in node.items() if key != '$ref'}}
+  node = {key: strict_schema(value, defs) for key, value in node.items()}
+  if node.get('type') == 'object':
+    node['additionalProperties'] = False
+    node['required'] = list(node.get('properties', {}))
+  return node
+
+def text_format_param(text_format):
+  schema = text_format.model_json_schema()
+  return {"format": {
+    "type": "json_schema",
+    "strict": True,
+    "name": text_format.__name__,
+    "schema": strict_schema(schema, schema.get('$defs', {})),
+  }}
+
+def cache_key(model, input, text_format = None):
+  schema = text_format.model_json_schema() if text_format is not None else None
+  return ResponseCache.key(model, input, schema)
+
+# Accumulate the token usage of one API response under its stage name
+def record_usage(stage, response):
+  if stage is None or getattr(response, 'cache_hit', False) or response.usage is None:
+    return
+  usage = response.usage
+  with _lock:
+    totals = _usage.setdefault(stage, [0, 0, 0, 0])
+    totals[0] += 1
+    totals[1] += usage.input_tokens
+    totals[2] += usage.input_tokens_details.cached_tokens
+    totals[3] += usage.output_tokens
+
+# One line per stage with the share of input tokens served from the provider's prompt cache
+def usage_report():
+  lines = []
+  with _lock:
+    for stage, (calls, input_tokens, cached_tokens, output_tokens) in sorted(_usage.items()):
+      ratio = cached_tokens / input_tokens if input_tokens else 0.0
+      lines.append(f"{stage}: {calls} calls, {input_tokens} input tokens ({cached_tokens} cached, {ratio:.0%}), {output_tokens} output tokens")
+  return "\n".join(lines)
+
+# Free-text call; returns the Response (or a CachedResponse on a cache hit).
+# submission is only used to label the call in the metrics ledger.
+def create_response(model, input, text_format = None, stage = None, submission = None):
+  start = time.perf_counter()
+  cache = get_cache()
+  key = cache_key(model, input, text_format) if cache else None
+  if cache:
+    entry = cache.get(key)
+    if entry is not None:
+      response = CachedResponse(entry)
+      metrics.record_llm(stage, model, response, time.perf_counter() - start, submission = submission)
+      return response
+
+  kwargs = {"text": text_format_param(text_format)} if text_format is not None else {}
+  timing = {}
+  try:
+    with tracing.span(stage or 'llm', 'llm', model = model, submission = submission):
+      response = get_scheduler().run(
+        lambda: get_client().responses.create(model = model, input = input, **kwargs),
+        estimate_tokens(input),
+        usage_tokens,
+        timing,
+      )
+  except Exception as e:
+    metrics.record_llm(stage, model, None, time.perf_counter() - start, timing.get('queue_wait', 0.0), submission, error = e)
+    raise
+  record_usage(stage, response)
+  metrics.record_llm(stage, model, response, time.perf_counter() - start, timing['queue_wait'], submission)
+
+  # Never cache a structured response that does not match its schema
+  if text_format is not None:
+    text_format.model_validate_json(response.output_text)
+  if cache:
+    cache.put(key, model, response.output_text)
+  return response
+
+# Streamed structured call: the response is read as it is generated and each complete
+# element of the top-level array `field` of the output (the annotations) is passed to
+# on_item as a dict as soon as it has arrived. Returns (response, parsed output) like
+# parse_response once the stream ends. When an attempt fails midway and is retried, the
+# elements already passed on are not passed again. A cache hit passes all elements at once.
+def stream_response(model, input, text_format, on_item, field = 'annotations', stage = None, submission = None):
+  start = time.perf_counter()
+  cache = get_cache()
+  key = cache_key(model, input, text_format) if cache else None
+  if cache:
+    entry = cache.get(key)
+    if entry is not None:
+      response = CachedResponse(entry)
+      for item in streaming.ArrayItems(field).feed(response.output_text):
+        on_item(item)
+      metrics.record_llm(stage, model, response, time.perf_counter() - start, submission = submission)
+      return response, text_format.model_validate_json(response.output_text)
+
+  emitted = {'count': 0, 'first': None}
+
+  def call():
+    parser = streaming.ArrayItems(field)
+    count = 0
+    response = None
+    stream = get_client().responses.create(model = model, input = input, text = text_format_param(text_format), stream = True)
+    for event in stream:
+      if event.type == 'response.output_text.delta':
+        for item in parser.feed(event.delta):
+          count += 1
+          if count > emitted['count']:
+            emitted['count'] = count
+            if emitted['first'] is None:
+              emitted['first'] = time.perf_counter() - start
+            on_item(item)
+      elif event.type in ('response.completed', 'response.incomplete'):
+        response = event.response
+      elif event.type == 'response.failed':
+        raise RuntimeError(f"Response failed: {event.response.error}")
+      elif event.type == 'error':
+        raise RuntimeError(f"Stream error: {event.message}")
+    if response is None:
+      raise RuntimeError("Stream ended without a response")
+    return response
+
+  timing = {}
+  try:
+    with tracing.span(stage or 'llm', 'llm', model = model, submission = submission, stream = True):
+      response = get_scheduler().run(call, estimate_tokens(input), usage_tokens, timing)
+  except Exception as e:
+    metrics.record_llm(stage, model, None, time.perf_counter() - start, timing.get('queue_wait', 0.0), submission, error = e)
+    raise
+  record_usage(stage, response)
+  metrics.record_llm(stage, model, response, time.perf_counter() - start, timing['queue_wait'], submission, first_item = emitted['first'])
+
+  parsed = text_format.model_validate_json(response.output_text)
+  if cache:
+    cache.put(key, model, response.output_text)
+  return response, parsed
+
+# Structured-output call equivalent to client.responses.parse. parse() builds its generic
+# ParsedResponse wrapper on every call, which is not thread-safe and intermittently drops
+# fields (usage, output_parsed) when submissions are processed concurrently, so we request
+# the same JSON schema through responses.create and validate the output text ourselves.
+def parse_response(model, input, text_format, stage = None, submission = None):
+  response = create_response(model, input, text_format, stage, submission)
+  return response, text_format.model_validate_json(response.output_text)
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+# Content-addressed on-disk cache of LLM responses. Entries are keyed on a hash of
+# everything that determines the response (model, full input messages and output
+# schema), so re-running the pipeline on unchanged inputs costs no API calls.
+# Entries are stored as CACHE_DIR/<2 hex chars>/<sha256>.json; the file mtime is
+# refreshed on every hit and used for least-recently-used eviction.
+
+class CachedResponse:
+  """Stands in for an openai Response when a result is served from the cache."""
+
+  cache_hit = True
+
+  def __init__(self, entry):
+    self.model = entry['model']
+    self.output_text = entry['output_text']
+
+  # No tokens are billed for a cache hit
+  def model_dump(self):
+    return {
+      'model': self.model,
+      'output_text': self.output_text,
+      'usage': {
+        'input_tokens': 0,
+        'input_tokens_details': {'cached_tokens': 0},
+        'output_tokens': 0,
+      },
+    }
+
+class ResponseCache:
+
+  EVICT_EVERY = 100
+
+  def __init__(self, cache_dir, max_bytes, max_age_seconds):
+    self.cache_dir = Path(cache_dir)
+    self.max_bytes = max_bytes
+    self.max_age_seconds = max_age_seconds
+    self.hits = 0
+    self.misses = 0
+    self.writes = 0
+    self.evictions = 0
+    self._lock = threading.Lock()
+    os.makedirs(self.cache_dir, exist_ok = True)
+    self.evict()
+
+  @staticmethod
+  def key(model, input, schema = None):
+    payload = json.dumps({'model': model, 'input': input, 'schema': schema}, sort_keys = True, ensure_ascii = False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+  def _path(self, key):
+    return self.cache_dir / key[:2] / f"{key}.json"
+
+  # Return the cached entry for key, or None on a miss
+  def get(self, key):
+    path = self._path(key)
+    try:
+      with open(path, 'r') as f:
+        entry = json.load(f)
+      os.utime(path)
+    except (FileNotFoundError, json.JSONDecodeError):
+      with self._lock:
+        self.misses += 1
+      return None
+
+    with self._lock:
+      self.hits += 1
+    return entry
+
+  def put(self, key, model, output_text):
+    path = self._path(key)
+    os.makedirs(path.parent, exist_ok = True)
+    entry = {'model': model, 'output_text': output_text, 'created': time.time()}
+
+    # Write to a temporary file first so concurrent readers never see a partial entry.
+    # The cache directory is shared by several processes (per-submission runs, shards on
+    # one host), and thread idents are only unique within a process.
+    tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, 'w') as f:
+      json.dump(entry, f, ensure_ascii = False)
+    os.replace(tmp_path, path)
+
+    with self._lock:
+      self.writes += 1
+      evict = self.writes % self.EVICT_EVERY == 0
+    if evict:
+      self.evict()
+
+  # Drop entries older than max_age_seconds, then least recently used entries
+  # until the cache fits in max_bytes
+  def evict(self):
+    now = time.time()
+    entries = []
+    for path in self.cache_dir.glob('*/*.json'):
+      try:
+        stat = path.stat()
+      except FileNotFoundError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, path))
+
+    removed = 0
+    total = 0
+    kept = []
+    for mtime, size, path in entries:
+      if self.max_age_seconds and now - mtime > self.max_age_seconds:
+        path.unlink(missing_ok = True)
+        removed += 1
+      else:
+        kept.append((mtime, size, path))
+        total += size
+
+    if self.max_bytes:
+      for mtime, size, path in sorted(kept):
+        if total <= self.max_bytes:
+          break
+        path.unlink(missing_ok = True)
+        total -= size
+        removed += 1
+
+    with self._lock:
+      self.evictions += removed
+
+  def stats(self):
+    lookups = self.hits + self.misses
+    hit_ratio = self.hits / lookups if lookups else 0.0
+    return f"LLM cache: {self.hits} hits / {self.misses} misses ({hit_ratio:.0%}), {self.writes} writes, {self.evictions} evicted"
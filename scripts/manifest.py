@@ -0,0 +1,107 @@
+import datetime
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+
+# Run manifest: a small SQLite ledger that remembers, for every submission, the
+# hash of its source file, the fingerprint of the configuration it was graded
+# with (problem statement, rubric, models, prompts) and the last pipeline stage
+# that completed. Later runs skip submissions that are up to date and resume
+# the others from the stage after their last checkpoint.
+
+# Pipeline stages in order, and the artifact each one leaves behind
+STAGES = ('proposer', 'reviewer', 'postprocess')
+DONE = 'done'
+
+def file_hash(path):
+  with open(path, 'rb') as f:
+    return hashlib.sha256(f.read()).hexdigest()
+
+def fingerprint(*parts):
+  digest = hashlib.sha256()
+  for part in parts:
+    digest.update(str(part).encode('utf-8'))
+    digest.update(b'\0')
+  return digest.hexdigest()
+
+class RunManifest:
+
+  def __init__(self, path):
+    Path(path).parent.mkdir(parents = True, exist_ok = True)
+    self._lock = threading.Lock()
+    self._db = sqlite3.connect(str(path), check_same_thread = False)
+    with self._lock, self._db:
+      self._db.execute("""CREATE TABLE IF NOT EXISTS submissions (
+        path TEXT PRIMARY KEY,
+        input_hash TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        stage TEXT,
+        status TEXT NOT NULL,
+        error TEXT,
+        updated TEXT NOT NULL)""")
+
+  def _get(self, path):
+    with self._lock:
+      return self._db.execute("SELECT input_hash, fingerprint, stage, status FROM submissions WHERE path = ?", (str(path),)).fetchone()
+
+  def _put(self, path, input_hash, config_fingerprint, stage, status, error = None):
+    updated = datetime.datetime.now().isoformat(timespec = 'seconds')
+    with self._lock, self._db:
+      self._db.execute("INSERT OR REPLACE INTO submissions VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (str(path), input_hash, config_fingerprint, stage, status, error, updated))
+
+  def checkpoint(self, path, config_fingerprint):
+    return Checkpoint(self, Path(path), file_hash(path), config_fingerprint)
+
+  def counts(self):
+    with self._lock:
+      return dict(self._db.execute("SELECT status, COUNT(*) FROM submissions GROUP BY status").fetchall())
+
+class Checkpoint:
+  """Progress of one submission in the manifest."""
+
+  def __init__(self, manifest, path, input_hash, config_fingerprint):
+    self.manifest = manifest
+    self.path = path
+    self.input_hash = input_hash
+    self.fingerprint = config_fingerprint
+
+  # First stage that still has to run, or DONE. New, changed or re-configured
+  # submissions start from the beginning; failed ones resume after their last
+  # completed stage. artifacts maps a stage to the file it writes: resuming needs
+  # the artifact of the last completed stage, and if it has been deleted the
+  # submission falls back to the latest stage whose artifact still exists.
+  def next_stage(self, artifacts = None):
+    row = self.manifest._get(self.path)
+    if row is None:
+      return STAGES[0]
+    input_hash, config_fingerprint, stage, status = row
+    if input_hash != self.input_hash or config_fingerprint != self.fingerprint or stage is None:
+      return STAGES[0]
+
+    completed = STAGES.index(stage)
+    while artifacts and completed >= 0:
+      artifact = artifacts.get(STAGES[completed])
+      if artifact is None or Path(artifact).exists():
+        break
+      completed -= 1
+    if completed < 0:
+      return STAGES[0]
+    return STAGES[completed + 1] if completed + 1 < len(STAGES) else DONE
+
+  # Forget completed stages so the submission is processed from the start
+  def restart(self):
+    self.manifest._put(self.path, self.input_hash, self.fingerprint, None, 'pending')
+
+  def done(self, stage):
+    status = DONE if stage == STAGES[-1] else 'in_progress'
+    self.manifest._put(self.path, self.input_hash, self.fingerprint, stage, status)
+
+  # Keep the last completed stage so that the next run resumes from there
+  def failed(self, error):
+    row = self.manifest._get(self.path)
+    stage = None
+    if row is not None and row[0] == self.input_hash and row[1] == self.fingerprint:
+      stage = row[2]
+    self.manifest._put(self.path, self.input_hash, self.fingerprint, stage, 'failed', str(error))
@@ -0,0 +1,212 @@
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Append-only ledger of every LLM and subprocess call made while grading. Each call is
+# one JSON line in METRICS_FILE with its wall-clock latency, time spent queued by the
+# rate-limit scheduler, token counts, model, stage, submission and estimated cost.
+# Lines are appended with a single write, so concurrent threads and the linter worker
+# processes can share one file. `python scripts/metrics.py report` aggregates it.
+
+_lock = threading.Lock()
+
+# Set by the drivers so that records from one grading run can be told apart
+_cohort = None
+
+# USD per million tokens: (input, cached input, output). Model names are matched by
+# prefix so that dated snapshots (o4-mini-2025-04-16) use the price of their family.
+PRICES = {
+  'o4-mini': (1.10, 0.275, 4.40),
+  'o3-mini': (1.10, 0.55, 4.40),
+  'o3': (2.00, 0.50, 8.00),
+  'gpt-4.1-nano': (0.10, 0.025, 0.40),
+  'gpt-4.1-mini': (0.40, 0.10, 1.60),
+  'gpt-4.1': (2.00, 0.50, 8.00),
+  'gpt-4o-mini': (0.15, 0.075, 0.60),
+  'gpt-4o': (2.50, 1.25, 10.00),
+}
+
+# The Batch API bills half the synchronous price
+BATCH_DISCOUNT = 0.5
+
+# The ledger path is read at call time so that callers can load config.env first;
+# METRICS_FILE="" turns recording off
+def ledger_path():
+  path = os.getenv('METRICS_FILE')
+  if path is None:
+    path = str(Path(os.getenv('INTER_DIR', 'intermediates')) / 'metrics.jsonl')
+  return path or None
+
+def set_cohort(cohort):
+  global _cohort
+  _cohort = str(cohort)
+
+def price(model):
+  if not model:
+    return None
+  for name in sorted(PRICES, key = len, reverse = True):
+    if model.startswith(name):
+      return PRICES[name]
+  return None
+
+# Estimated cost in USD; None for models without a known price
+def estimate_cost(model, input_tokens, cached_tokens, output_tokens, batch = False):
+  rates = price(model)
+  if rates is None:
+    return None
+  input_rate, cached_rate, output_rate = rates
+  cost = ((input_tokens - cached_tokens) * input_rate + cached_tokens * cached_rate + output_tokens * output_rate) / 1e6
+  return cost * BATCH_DISCOUNT if batch else cost
+
+def record(kind, stage, latency, **fields):
+  path = ledger_path()
+  if path is None:
+    return
+  entry = {
+    'time': round(time.time(), 3),
+    'cohort': _cohort,
+    'kind': kind,
+    'stage': stage,
+    'latency': round(latency, 4),
+  }
+  entry.update({name: str(value) if isinstance(value, Path) else value for name, value in fields.items()})
+  line = json.dumps(entry, ensure_ascii = False) + '\n'
+  with _lock:
+    os.makedirs(Path(path).parent, exist_ok = True)
+    with open(path, 'a') as f:
+      f.write(line)
+
+# Record one LLM call. response is an openai Response or a CachedResponse; first_item is
+# the time until the first annotation of a streamed call arrived
+def record_llm(stage, model, response, latency, queue_wait = 0.0, submission = None, batch = False, error = None, first_item = None):
+  fields = {'model': model, 'submission': submission, 'queue_wait': round(queue_wait, 4), 'batch': batch}
+  if first_item is not None:
+    fields['first_item'] = round(first_item, 4)
+  if error is not None:
+    fields.update(status = 'error', error = str(error))
+  elif getattr(response, 'cache_hit', False):
+    fields.update(status = 'ok', cache_hit = True, input_tokens = 0, cached_tokens = 0, output_tokens = 0, cost = 0.0)
+  elif response.usage is not None:
+    usage = response.usage
+    cached_tokens = usage.input_tokens_details.cached_tokens
+    fields.update(status = 'ok', cache_hit = False, input_tokens = usage.input_tokens, cached_tokens = cached_tokens,
+      output_tokens = usage.output_tokens,
+      cost = estimate_cost(model, usage.input_tokens, cached_tokens, usage.output_tokens, batch))
+  else:
+    fields.update(status = 'ok', cache_hit = False)
+  record('llm', stage, latency, **fields)
+
+# Time a block (e.g. a subprocess) and record it; the block may add fields to the dict
+# it is given, and an exception is recorded as an error and re-raised
+@contextmanager
+def timed(kind, stage, **fields):
+  start = time.perf_counter()
+  try:
+    yield fields
+  except Exception as e:
+    fields.update(status = 'error', error = str(e))
+    raise
+  finally:
+    fields.setdefault('status', 'ok')
+    record(kind, stage, time.perf_counter() - start, **fields)
+
+# ========================= REPORT =================================
+
+def load(path):
+  entries = []
+  with open(path, 'r') as f:
+    for line in f:
+      line = line.strip()
+      if not line:
+        continue
+      try:
+        entries.append(json.loads(line))
+      except json.JSONDecodeError:
+        # A run killed mid-write can leave a partial last line
+        continue
+  return entries
+
+# Nearest-rank percentile
+def percentile(values, p):
+  if not values:
+    return 0.0
+  values = sorted(values)
+  return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+def aggregate(entries, key):
+  groups = {}
+  for entry in entries:
+    groups.setdefault(key(entry), []).append(entry)
+
+  rows = []
+  for name, group in sorted(groups.items(), key = lambda item: str(item[0])):
+    latencies = [entry['latency'] for entry in group if entry.get('status') == 'ok']
+    waits = [entry.get('queue_wait', 0.0) for entry in group]
+    input_tokens = sum(entry.get('input_tokens') or 0 for entry in group)
+    cached_tokens = sum(entry.get('cached_tokens') or 0 for entry in group)
+    costs = [entry['cost'] for entry in group if entry.get('cost') is not None]
+    rows.append({
+      'group': name,
+      'calls': len(group),
+      'errors': sum(1 for entry in group if entry.get('status') != 'ok'),
+      'cache_hits': sum(1 for entry in group if entry.get('cache_hit')),
+      'p50': percentile(latencies, 50),
+      'p95': percentile(latencies, 95),
+      'wait_p95': percentile(waits, 95),
+      'total_time': sum(entry['latency'] for entry in group),
+      'input_tokens': input_tokens,
+      'cached_ratio': cached_tokens / input_tokens if input_tokens else 0.0,
+      'output_tokens': sum(entry.get('output_tokens') or 0 for entry in group),
+      'cost': sum(costs) if costs else None,
+    })
+  return rows
+
+def format_rows(title, rows):
+  header = f"{title:<28} {'calls':>6} {'err':>4} {'hits':>5} {'p50 s':>7} {'p95 s':>7} {'wait95':>7} {'total s':>9} {'input tok':>10} {'cached':>7} {'output tok':>10} {'cost $':>9}"
+  lines = [header, '-' * len(header)]
+  for row in rows:
+    cost = f"{row['cost']:.4f}" if row['cost'] is not None else '-'
+    lines.append(f"{str(row['group'])[:28]:<28} {row['calls']:>6} {row['errors']:>4} {row['cache_hits']:>5} "
+                 f"{row['p50']:>7.2f} {row['p95']:>7.2f} {row['wait_p95']:>7.2f} {row['total_time']:>9.1f} "
+                 f"{row['input_tokens']:>10} {row['cached_ratio']:>7.0%} {row['output_tokens']:>10} {cost:>9}")
+  return '\n'.join(lines)
+
+GROUPINGS = {
+  'stage': lambda entry: f"{entry['kind']}:{entry['stage']}",
+  'model': lambda entry: entry.get('model') or f"({entry['kind']})",
+  'cohort': lambda entry: entry.get('cohort'),
+}
+
+def report(path, by = ('stage', 'model', 'cohort'), cohort = None):
+  entries = load(path)
+  if cohort is not None:
+    entries = [entry for entry in entries if entry.get('cohort') == cohort]
+  if not entries:
+    return f"No calls recorded in {path}"
+  return '\n\n'.join(format_rows(f"by {name}", aggregate(entries, GROUPINGS[name])) for name in by)
+
+def main():
+  parser = argparse.ArgumentParser(description = "Summarize the per-call metrics ledger")
+  subparsers = parser.add_subparsers(dest = "command", required = True)
+  report_parser = subparsers.add_parser("report", help = "p50/p95 latency, tokens and cost per stage, model and cohort")
+  report_parser.add_argument("--file", default = None, help = "Ledger to read (default: METRICS_FILE)")
+  report_parser.add_argument("--by", choices = sorted(GROUPINGS), action = "append", help = "Grouping (repeatable; default: all)")
+  report_parser.add_argument("--cohort", default = None, help = "Only include calls from this cohort")
+  args = parser.parse_args()
+
+  path = args.file or ledger_path()
+  if not path or not os.path.exists(path):
+    print(f"Error: metrics ledger {path} not found")
+    sys.exit(1)
+  print(report(path, args.by or ('stage', 'model', 'cohort'), args.cohort))
+
+if __name__ == "__main__":
+  from dotenv import load_dotenv
+  load_dotenv(dotenv_path = "config.env")
+  main()
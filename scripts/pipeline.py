@@ -0,0 +1,143 @@
+import atexit
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+import tracing
+
+# Small stage-graph engine shared by generate_feedback.py and generate_feedback_repo.py.
+# A pipeline is a list of stages; each stage names the artifacts it needs and the one
+# it produces, and artifacts are handed from stage to stage as in-memory objects.
+# A stage starts as soon as its inputs are available, so independent stages (e.g.
+# linting and the proposer call) overlap. Stages whose products are already known
+# (loaded from a previous run) or not needed are skipped. Intermediate files are
+# only written as audit artifacts, on a background thread (see AuditWriter).
+
+class Stage:
+
+  def __init__(self, name, run, requires = (), produces = None):
+    self.name = name
+    self.run = run
+    self.requires = tuple(requires)
+    self.produces = produces or name
+
+class StageError(Exception):
+
+  def __init__(self, stage, error):
+    super().__init__(f"{stage} failed: {error}")
+    self.stage = stage
+    self.error = error
+
+class Job:
+  """One unit of work (a submission or a file) plus the run-wide inputs shared by all jobs."""
+
+  def __init__(self, input_filename, **shared):
+    self.input_filename = input_filename
+    self.__dict__.update(shared)
+
+class Pipeline:
+
+  # Stages must be listed in an order where every stage comes after the stages it depends on
+  def __init__(self, stages, max_parallel = 2):
+    self.stages = list(stages)
+    self.max_parallel = max_parallel
+    produced = set()
+    for stage in self.stages:
+      missing = [name for name in stage.requires if name not in produced]
+      if missing:
+        raise ValueError(f"Stage {stage.name} requires {missing}, which no earlier stage produces")
+      produced.add(stage.produces)
+
+  # Stages that still have to run to produce the final stage's output from artifacts
+  def needed_stages(self, artifacts):
+    wanted = {self.stages[-1].produces}
+    needed = []
+    for stage in reversed(self.stages):
+      if stage.produces in wanted and stage.produces not in artifacts:
+        needed.append(stage)
+        wanted.update(stage.requires)
+    return list(reversed(needed))
+
+  # Run the pipeline for one job. artifacts holds products already available (e.g.
+  # loaded from a checkpoint); on_done(stage_name) is called after each stage completes.
+  # Returns all artifacts; a failing stage raises StageError.
+  def run(self, job, artifacts = None, on_done = None):
+    artifacts = dict(artifacts or {})
+    pending = self.needed_stages(artifacts)
+    running = {}
+    # Stages run on tracks below the caller's in the timeline
+    track = tracing.current_track()
+
+    with ThreadPoolExecutor(max_workers = self.max_parallel, thread_name_prefix = "stage") as executor:
+      while pending or running:
+        for stage in list(pending):
+          if all(name in artifacts for name in stage.requires):
+            pending.remove(stage)
+            inputs = {name: artifacts[name] for name in stage.requires}
+            running[executor.submit(tracing.on_track, track, self.run_stage, stage, job, inputs)] = stage
+
+        done, _ = wait(running, return_when = FIRST_COMPLETED)
+        for future in done:
+          stage = running.pop(future)
+          try:
+            artifacts[stage.produces] = future.result()
+          except Exception as e:
+            for other in running:
+              other.cancel()
+            raise StageError(stage.name, e) from e
+          if on_done:
+            on_done(stage.name)
+
+    return artifacts
+
+  def run_stage(self, stage, job, inputs):
+    with tracing.span(stage.name, 'pipeline'):
+      return stage.run(job, **inputs)
+
+class AuditWriter:
+  """Writes intermediate JSON files on a background thread so that stages never wait on disk."""
+
+  def __init__(self):
+    self._queue = queue.Queue()
+    self._thread = None
+    self._lock = threading.Lock()
+
+  def _start(self):
+    with self._lock:
+      if self._thread is None:
+        self._thread = threading.Thread(target = self._work, name = "audit-writer", daemon = True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+  def _work(self):
+    while True:
+      path, data = self._queue.get()
+      try:
+        # Written to a temporary file and renamed, so that a run killed mid-write never
+        # leaves a truncated file for the next run to resume from
+        with tracing.span('write_json', 'io', path = path):
+          os.makedirs(Path(path).parent, exist_ok = True)
+          tmp = Path(f"{path}.{os.getpid()}.tmp")
+          with open(tmp, 'w') as f:
+            json.dump(data, f, indent = 4, ensure_ascii=False)
+          os.replace(tmp, path)
+      except OSError as e:
+        print(f"Error: could not write {path}: {e}")
+      finally:
+        self._queue.task_done()
+
+  # Intermediate files are written unless WRITE_INTERMEDIATES=0
+  def write_json(self, path, data):
+    if os.getenv('WRITE_INTERMEDIATES', '1') == '0':
+      return
+    self._start()
+    self._queue.put((path, data))
+
+  # Block until every queued file has been written
+  def flush(self):
+    self._queue.join()
+
+audit = AuditWriter()
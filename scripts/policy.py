@@ -0,0 +1,83 @@
+import os
+
+import metrics
+
+# Review policy, applied between the proposer and the reviewer. The default mode
+# 'always' reviews every submission; with REVIEW_POLICY=adaptive, cheap signals (the
+# proposal's annotations and severities, linter findings, file size and, in repo mode,
+# the number of modified lines) decide whether the reviewer pass is needed: a small,
+# lint-clean submission with a few non-critical proposed annotations keeps the proposal
+# as its final feedback. A submission whose linter run failed is always reviewed. With
+# a CASCADE_MODEL, small submissions are also proposed on that cheaper model first; the
+# reviewer on the full model is the escalation step, and a cascaded proposal whose call
+# fails is retried on the full model (a weak but successful proposal is not).
+#
+# Every decision is recorded in the metrics ledger (kind 'policy', stage 'review' or
+# 'skip_review', 'cascade' or 'escalate') with the signals it was based on, so the
+# trade-off can be measured with `python scripts/metrics.py report --by stage`.
+
+class Policy:
+  """Thresholds of the review policy; mode 'always' (the default) reviews every submission."""
+
+  def __init__(self, mode = 'always', max_annotations = 3, max_diagnostics = 0, max_lines = 150,
+               max_changed_lines = 40, cascade_model = None, cascade_max_lines = 300):
+    self.mode = mode
+    self.max_annotations = max_annotations
+    self.max_diagnostics = max_diagnostics
+    self.max_lines = max_lines
+    self.max_changed_lines = max_changed_lines
+    self.cascade_model = cascade_model
+    self.cascade_max_lines = cascade_max_lines
+
+  # Read after the caller has loaded its config file
+  @classmethod
+  def from_env(cls):
+    return cls(
+      mode = os.getenv('REVIEW_POLICY', 'always'),
+      max_annotations = int(os.getenv('SKIP_REVIEW_MAX_ANNOTATIONS', '3')),
+      max_diagnostics = int(os.getenv('SKIP_REVIEW_MAX_DIAGNOSTICS', '0')),
+      max_lines = int(os.getenv('SKIP_REVIEW_MAX_LINES', '150')),
+      max_changed_lines = int(os.getenv('SKIP_REVIEW_MAX_CHANGED_LINES', '40')),
+      cascade_model = os.getenv('CASCADE_MODEL') or None,
+      cascade_max_lines = int(os.getenv('CASCADE_MAX_LINES', '300')),
+    )
+
+  # Whether a submission of this size is proposed on the cascade model
+  def cascades(self, lines, changed_lines = None):
+    size = changed_lines if changed_lines is not None else lines
+    return self.mode != 'always' and bool(self.cascade_model) and size <= self.cascade_max_lines
+
+  # Model for the proposer: the cascade model for small submissions, else model
+  def proposer_model(self, model, lines, changed_lines = None, submission = None):
+    if not self.cascades(lines, changed_lines):
+      return model
+    record('cascade', submission, proposer_model = self.cascade_model, lines = lines, changed_lines = changed_lines)
+    return self.cascade_model
+
+  # Whether the proposal needs the reviewer pass, and why. diagnostics is None when the
+  # linter was not run (repo mode) and changed_lines None outside repo mode; lint_error
+  # is the error of a linter run that failed, which gives no signal and requires review.
+  def review(self, annotations, lines, diagnostics = None, changed_lines = None, submission = None, lint_error = None):
+    critical = sum(1 for annotation in annotations if annotation.severity == 'critical')
+    if self.mode == 'always':
+      reason = "policy is 'always'"
+    elif lint_error:
+      reason = "linter failed"
+    elif critical:
+      reason = f"{critical} critical annotations"
+    elif len(annotations) > self.max_annotations:
+      reason = f"{len(annotations)} annotations"
+    elif diagnostics is not None and diagnostics > self.max_diagnostics:
+      reason = f"{diagnostics} linter findings"
+    elif lines > self.max_lines:
+      reason = f"{lines} lines"
+    elif changed_lines is not None and changed_lines > self.max_changed_lines:
+      reason = f"{changed_lines} changed lines"
+    else:
+      reason = None
+    record('review' if reason else 'skip_review', submission, reason = reason or "trivial proposal",
+           annotations = len(annotations), critical = critical, diagnostics = diagnostics, lines = lines, changed_lines = changed_lines)
+    return reason is not None
+
+def record(decision, submission, **signals):
+  metrics.record('policy', decision, 0.0, submission = submission, status = 'ok', **signals)
@@ -0,0 +1,141 @@
+import heapq
+import os
+
+import metrics
+
+# Preflight of a cohort run (run_tool.py), made before any API call. Every submission's
+# LLM calls are estimated from the prompts the pipeline will send (see
+# generate_feedback.estimate_calls): input tokens from the numbered program and the
+# shared prompt parts, output tokens and latency from the calls of earlier runs in the
+# metrics ledger. From that the run is
+#   - checked: a submission with a prompt over MAX_PROMPT_TOKENS is failed up front
+#     instead of after a round-trip (large programs are already split by chunking.py,
+#     so this catches e.g. a huge file with chunking off or no functions to split on);
+#   - ordered longest-first, so that a large submission started last does not stretch
+#     the run after the other workers have gone idle;
+#   - predicted: calls, tokens, cost and duration on the worker pool, printed and
+#     recorded in the ledger (kind 'preflight') to compare with the actual run.
+# Reviews the policy would skip are counted, so the prediction is an upper bound.
+
+# Largest prompt sent in one call; above this a submission is not sent
+MAX_PROMPT_TOKENS = int(os.getenv('MAX_PROMPT_TOKENS', '100000'))
+
+# Latency of a call when the ledger has no history for its stage
+DEFAULT_CALL_SECONDS = float(os.getenv('DEFAULT_CALL_SECONDS', '30'))
+
+class Call:
+  """One estimated LLM call; calls of a submission with the same step run concurrently."""
+
+  def __init__(self, step, stage, model, input_tokens):
+    self.step = step
+    self.stage = stage
+    self.model = model
+    self.input_tokens = input_tokens
+
+class Estimate:
+  """The estimated calls of one submission, and why it is too large to send (or None)."""
+
+  def __init__(self, submission, calls, chunks = 0):
+    self.submission = submission
+    self.calls = calls
+    self.chunks = chunks
+    largest = max((call.input_tokens for call in calls), default = 0)
+    self.oversize = f"prompt of ~{largest} tokens is over MAX_PROMPT_TOKENS ({MAX_PROMPT_TOKENS})" if largest > MAX_PROMPT_TOKENS else None
+
+  @property
+  def input_tokens(self):
+    return sum(call.input_tokens for call in self.calls)
+
+class History:
+  """Latency (linear in input tokens) and output tokens per stage, from the ledger's past calls."""
+
+  def __init__(self, entries = ()):
+    samples = {}
+    for entry in entries:
+      if (entry.get('kind') == 'llm' and entry.get('status') == 'ok' and not entry.get('cache_hit')
+          and not entry.get('batch') and entry.get('input_tokens')):
+        samples.setdefault(entry['stage'], []).append((entry['input_tokens'], entry['latency'], entry.get('output_tokens') or 0))
+    self.fits = {stage: fit([(tokens, latency) for tokens, latency, _ in points]) for stage, points in samples.items()}
+    self.outputs = {stage: sum(output for _, _, output in points) / len(points) for stage, points in samples.items()}
+
+  @classmethod
+  def from_ledger(cls):
+    path = metrics.ledger_path()
+    if not path or not os.path.exists(path):
+      return cls()
+    return cls(metrics.load(path))
+
+  def seconds(self, call):
+    if call.stage not in self.fits:
+      return DEFAULT_CALL_SECONDS
+    intercept, slope = self.fits[call.stage]
+    return intercept + slope * call.input_tokens
+
+  def output_tokens(self, call, default):
+    return self.outputs.get(call.stage, default)
+
+  # Duration of a submission: its steps one after the other, the calls of a step at once
+  def duration(self, estimate):
+    steps = {}
+    for call in estimate.calls:
+      steps[call.step] = max(steps.get(call.step, 0.0), self.seconds(call))
+    return sum(steps.values())
+
+# Least-squares line through (tokens, seconds); a flat line at the median when the
+# points do not spread, and never a negative slope
+def fit(points):
+  latencies = [latency for _, latency in points]
+  median = metrics.percentile(latencies, 50)
+  n = len(points)
+  mean_x = sum(x for x, _ in points) / n
+  mean_y = sum(latencies) / n
+  spread = sum((x - mean_x) ** 2 for x, _ in points)
+  if n < 5 or spread == 0:
+    return median, 0.0
+  slope = max(0.0, sum((x - mean_x) * (y - mean_y) for x, y in points) / spread)
+  return max(0.0, mean_y - slope * mean_x), slope
+
+def longest_first(estimates, history):
+  return sorted(estimates, key = lambda estimate: -history.duration(estimate))
+
+# Makespan of jobs (seconds) started longest-first on workers
+def makespan(durations, workers):
+  loads = [0.0] * max(1, workers)
+  for duration in sorted(durations, reverse = True):
+    heapq.heappush(loads, heapq.heappop(loads) + duration)
+  return max(loads)
+
+def predict(estimates, history, workers, default_output_tokens, batch = False):
+  calls = [call for estimate in estimates for call in estimate.calls]
+  input_tokens = sum(call.input_tokens for call in calls)
+  output_tokens = sum(history.output_tokens(call, default_output_tokens) for call in calls)
+  costs = [metrics.estimate_cost(call.model, call.input_tokens, 0, history.output_tokens(call, default_output_tokens), batch) for call in calls]
+  durations = [history.duration(estimate) for estimate in estimates]
+  seconds = makespan(durations, workers)
+  # The rate limits may bound the run more than the workers do
+  rpm = int(os.getenv('RATE_LIMIT_RPM', '0'))
+  tpm = int(os.getenv('RATE_LIMIT_TPM', '0'))
+  if rpm:
+    seconds = max(seconds, len(calls) / rpm * 60)
+  if tpm:
+    seconds = max(seconds, (input_tokens + output_tokens) / tpm * 60)
+  return {
+    'submissions': len(estimates),
+    'calls': len(calls),
+    'input_tokens': input_tokens,
+    'output_tokens': round(output_tokens),
+    'cost': sum(costs) if calls and None not in costs else None,
+    'seconds': round(seconds, 1),
+    'longest_seconds': round(max(durations, default = 0.0), 1),
+  }
+
+def report(prediction, workers, batch = False):
+  cost = f"${prediction['cost']:.2f}" if prediction['cost'] is not None else "unknown cost"
+  print(f"Preflight: {prediction['submissions']} submissions, at most {prediction['calls']} calls, "
+        f"~{prediction['input_tokens']} input and ~{prediction['output_tokens']} output tokens, {cost}")
+  if not batch:
+    print(f"Predicted duration ~{prediction['seconds']:.0f}s with {workers} workers "
+          f"(longest submission ~{prediction['longest_seconds']:.0f}s)")
+  # Prefixed so that the report's token and cost totals only count actual calls
+  metrics.record('preflight', 'cohort', 0.0, status = 'ok', workers = workers, batch = batch,
+                 **{f"predicted_{name}": value for name, value in prediction.items()})
@@ -0,0 +1,33 @@
+# Prompt assembly shared by generate_feedback.py and generate_feedback_repo.py.
+#
+# The provider caches the longest previously seen prefix of a request (once it is
+# longer than 1024 tokens), and only an exact byte-for-byte match counts. All
+# content that is the same for every submission in a cohort -- system prompt,
+# problem statement, rubric and the task instructions -- therefore goes first,
+# in a fixed order and format, and everything specific to one submission
+# (the numbered program, linter output, proposed feedback) comes after it.
+
+def shared_prefix(intro, problem_statement, rubric, instructions):
+  return f"""{intro}
+
+<problem_statement>
+{problem_statement}
+</problem_statement>
+
+<rubric>
+{rubric}
+</rubric>
+
+{instructions}"""
+
+def section(tag, content):
+  return f"<{tag}>\n{content}\n</{tag}>"
+
+# Build the model input: the cohort-invariant messages first, then one user
+# message holding the per-submission sections
+def assemble(system_prompt, prefix, *sections):
+  return [
+    {"role": "system", "content": system_prompt},
+    {"role": "user", "content": prefix},
+    {"role": "user", "content": "\n\n".join(sections)},
+  ]
@@ -0,0 +1,242 @@
+import argparse
+import difflib
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import tracing
+
+# In-process replacement for `diff -r -u base student` + unidiff.PatchSet in repo mode.
+# Every student in a cohort forks the same base tree, so the base tree is indexed once
+# per assignment (a content hash and the line array of every source file) and the
+# index is persisted next to the intermediates. A student repo is compared against it
+# by hashing (on a thread pool; hashing and file reads release the GIL). Only files whose
+# hash differs are diffed, in-process, on a process pool when there is enough of them.
+# The hunks are those of `diff -u` (3 lines of context); where an insertion could be
+# aligned in more than one way, the chosen alignment may differ by a line from GNU diff.
+
+# Only these files are compared (repo mode gives feedback on C sources)
+DIFF_SUFFIXES = ('.c',)
+
+CONTEXT_LINES = 3
+
+SKIP_DIRS = {'.git'}
+
+HASH_THREADS = 8
+
+# Below this many lines to diff, worker processes cost more than they save
+PARALLEL_MIN_LINES = 20000
+
+def source_files(root):
+  root = Path(root)
+  files = []
+  for directory, dirnames, filenames in os.walk(root):
+    dirnames[:] = sorted(name for name in dirnames if name not in SKIP_DIRS)
+    for name in sorted(filenames):
+      if name.endswith(DIFF_SUFFIXES):
+        files.append((Path(directory) / name).relative_to(root).as_posix())
+  return files
+
+def content_hash(data):
+  return hashlib.sha256(data).hexdigest()
+
+# Lines as open(path, 'r').readlines() would return them (universal newlines)
+def split_lines(data):
+  return io.StringIO(data.decode('utf-8', errors = 'replace'), newline = None).readlines()
+
+def read_file(path):
+  with open(path, 'rb') as f:
+    return f.read()
+
+# Cheap fingerprint of the tree (names, sizes and modification times) used to tell
+# whether a persisted index is still valid without reading the files
+def tree_signature(root, files):
+  digest = hashlib.sha256()
+  for name in files:
+    stat = (Path(root) / name).stat()
+    digest.update(f"{name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+  return digest.hexdigest()
+
+class BaseIndex:
+  """Content hash and lines of every source file of the base tree."""
+
+  def __init__(self, root, signature, files):
+    self.root = str(root)
+    self.signature = signature
+    self.files = files
+
+  @classmethod
+  def build(cls, root):
+    names = source_files(root)
+    files = {}
+    for name in names:
+      data = read_file(Path(root) / name)
+      files[name] = {'hash': content_hash(data), 'lines': split_lines(data)}
+    return cls(root, tree_signature(root, names), files)
+
+  def save(self, path):
+    os.makedirs(Path(path).parent, exist_ok = True)
+    tmp = Path(f"{path}.{os.getpid()}.tmp")
+    with open(tmp, 'w') as f:
+      json.dump({'root': self.root, 'signature': self.signature, 'files': self.files}, f)
+    os.replace(tmp, path)
+
+  @classmethod
+  def load(cls, path):
+    with open(path, 'r') as f:
+      data = json.load(f)
+    return cls(data['root'], data['signature'], data['files'])
+
+def index_path(base_root, index_dir):
+  key = hashlib.sha256(str(Path(base_root).resolve()).encode()).hexdigest()[:16]
+  return Path(index_dir) / f"base_index_{key}.json"
+
+# Load the persisted index of the base tree, rebuilding it if the tree has changed
+@tracing.traced
+def load_index(base_root, index_dir):
+  path = index_path(base_root, index_dir)
+  if path.exists():
+    try:
+      index = BaseIndex.load(path)
+      if index.signature == tree_signature(base_root, source_files(base_root)):
+        return index
+    except (OSError, ValueError, KeyError):
+      pass
+  index = BaseIndex.build(base_root)
+  index.save(path)
+  return index
+
+class FileDiff:
+  """A changed file of the student repo: its lines, the target lines covered by a hunk and the diff text."""
+
+  def __init__(self, name, lines, hunk_lines, text):
+    self.name = name
+    self.lines = lines
+    self.hunk_lines = hunk_lines
+    self.text = text
+
+# Unified diff of one file. hunk_lines holds the 1-based target line numbers covered by
+# a hunk (changed lines and their context), as `target_start + i` did with PatchSet.
+def diff_lines(name, base_lines, target_lines, base_label, target_label):
+  hunk_lines = set()
+  text = [f"--- {base_label}/{name}\n", f"+++ {target_label}/{name}\n"]
+  for group in grouped_opcodes(base_lines, target_lines):
+    i1, i2, j1, j2 = group[0][1], group[-1][2], group[0][3], group[-1][4]
+    hunk_lines.update(range(j1 + 1, j2 + 1))
+    text.append(f"@@ -{i1 + 1 if i2 > i1 else i1},{i2 - i1} +{j1 + 1 if j2 > j1 else j1},{j2 - j1} @@\n")
+    for tag, a1, a2, b1, b2 in group:
+      if tag == 'equal':
+        text.extend(' ' + line for line in base_lines[a1:a2])
+        continue
+      text.extend('-' + line for line in base_lines[a1:a2])
+      text.extend('+' + line for line in target_lines[b1:b2])
+  return hunk_lines, ''.join(line if line.endswith('\n') else line + '\n\\ No newline at end of file\n' for line in text)
+
+# difflib's grouped opcodes, computed only over the region between the common prefix
+# and suffix of the two files. Student changes are usually a few local edits, and
+# SequenceMatcher is quadratic in the worst case, so this is most of the speed-up.
+def grouped_opcodes(base_lines, target_lines):
+  prefix = 0
+  limit = min(len(base_lines), len(target_lines))
+  while prefix < limit and base_lines[prefix] == target_lines[prefix]:
+    prefix += 1
+  suffix = 0
+  while suffix < limit - prefix and base_lines[-1 - suffix] == target_lines[-1 - suffix]:
+    suffix += 1
+
+  matcher = difflib.SequenceMatcher(None, base_lines[prefix:len(base_lines) - suffix], target_lines[prefix:len(target_lines) - suffix], autojunk = False)
+  opcodes = [(tag, i1 + prefix, i2 + prefix, j1 + prefix, j2 + prefix) for tag, i1, i2, j1, j2 in matcher.get_opcodes()]
+  if prefix:
+    opcodes.insert(0, ('equal', 0, prefix, 0, prefix))
+  if suffix:
+    opcodes.append(('equal', len(base_lines) - suffix, len(base_lines), len(target_lines) - suffix, len(target_lines)))
+
+  return group_opcodes(opcodes, CONTEXT_LINES)
+
+# Hunks of opcodes with n lines of context, as SequenceMatcher.get_grouped_opcodes
+def group_opcodes(opcodes, n):
+  codes = []
+  for opcode in opcodes:
+    if codes and codes[-1][0] == opcode[0] == 'equal':
+      codes[-1] = ('equal', codes[-1][1], opcode[2], codes[-1][3], opcode[4])
+    elif opcode[1] != opcode[2] or opcode[3] != opcode[4]:
+      codes.append(opcode)
+  if not codes:
+    return []
+  if codes[0][0] == 'equal':
+    tag, i1, i2, j1, j2 = codes[0]
+    codes[0] = (tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2)
+  if codes[-1][0] == 'equal':
+    tag, i1, i2, j1, j2 = codes[-1]
+    codes[-1] = (tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n))
+
+  groups = []
+  group = []
+  for tag, i1, i2, j1, j2 in codes:
+    # Split the hunk at unchanged runs longer than twice the context
+    if tag == 'equal' and i2 - i1 > 2 * n:
+      group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+      groups.append(group)
+      group = []
+      i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+    group.append((tag, i1, i2, j1, j2))
+  if group and not (len(group) == 1 and group[0][0] == 'equal'):
+    groups.append(group)
+  return groups
+
+def _diff_task(args):
+  name, base_lines, data, base_label, target_label = args
+  target_lines = split_lines(data)
+  hunk_lines, text = diff_lines(name, base_lines, target_lines, base_label, target_label)
+  return FileDiff(name, target_lines, hunk_lines, text)
+
+# Files present in both trees whose contents differ from the base, diffed in parallel.
+# Files that exist only in the student repo are skipped, as `diff -r` reports them
+# without a patch.
+@tracing.traced
+def diff_repo(index, student_root, workers = None):
+  student_root = Path(student_root)
+  names = [name for name in source_files(student_root) if name in index.files]
+
+  def changed(name):
+    data = read_file(student_root / name)
+    return None if content_hash(data) == index.files[name]['hash'] else data
+
+  with ThreadPoolExecutor(max_workers = HASH_THREADS) as executor:
+    tasks = [(name, index.files[name]['lines'], data, index.root, str(student_root))
+             for name, data in zip(names, executor.map(changed, names)) if data is not None]
+
+  if len(tasks) <= 1 or sum(len(task[1]) for task in tasks) < PARALLEL_MIN_LINES:
+    return [_diff_task(task) for task in tasks]
+  workers = workers or min(len(tasks), os.cpu_count() or 1)
+  with ProcessPoolExecutor(max_workers = workers) as executor:
+    return list(executor.map(_diff_task, tasks))
+
+# Total size in bytes of the files of the student repo that differ from the base, a
+# cheap estimate of the work of grading it
+def changed_bytes(index, student_root):
+  student_root = Path(student_root)
+  names = [name for name in source_files(student_root) if name in index.files]
+
+  def size(name):
+    data = read_file(student_root / name)
+    return 0 if content_hash(data) == index.files[name]['hash'] else len(data)
+
+  with ThreadPoolExecutor(max_workers = HASH_THREADS) as executor:
+    return sum(executor.map(size, names))
+
+def main():
+  parser = argparse.ArgumentParser(description = "Build the base-tree index used by repo mode")
+  parser.add_argument("base_repo_path", help = "Path of the original (base) repo")
+  parser.add_argument("--index-dir", default = os.getenv('INTER_DIR', 'intermediates'), help = "Directory for the persisted index")
+  args = parser.parse_args()
+  index = load_index(args.base_repo_path, args.index_dir)
+  print(f"Indexed {len(index.files)} files of {args.base_repo_path} in {index_path(args.base_repo_path, args.index_dir)}")
+
+if __name__ == "__main__":
+  from dotenv import load_dotenv
+  load_dotenv(dotenv_path = "config_repo.env")
+  main()
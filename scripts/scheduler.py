@@ -0,0 +1,167 @@
+import random
+import threading
+import time
+import openai
+
+import tracing
+
+# Paces all LLM requests against the account's requests-per-minute and
+# tokens-per-minute budgets and retries transient failures. Each budget is a
+# token bucket that refills continuously at limit/60 per second; a request waits
+# until both buckets can cover it. Token cost is estimated from the prompt size
+# before the call and corrected with the reported usage afterwards. A 429 with a
+# retry-after header pauses every request, not just the one that was rejected,
+# so that a burst of parallel workers backs off together.
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+class TokenBucket:
+
+  def __init__(self, per_minute):
+    self.capacity = per_minute
+    self.tokens = per_minute
+    self.rate = per_minute / 60
+    self.updated = time.monotonic()
+
+  def _refill(self, now):
+    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+    self.updated = now
+
+  # Seconds until amount can be taken (requests larger than the bucket wait for a full bucket)
+  def wait_time(self, amount, now):
+    self._refill(now)
+    amount = min(amount, self.capacity)
+    return max(0.0, (amount - self.tokens) / self.rate)
+
+  # The balance may go negative when a request turns out larger than estimated
+  def take(self, amount):
+    self.tokens -= amount
+
+class RequestScheduler:
+
+  def __init__(self, requests_per_minute = None, tokens_per_minute = None, max_retries = 6, base_delay = 1.0, max_delay = 60.0):
+    self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+    self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+    self.max_retries = max_retries
+    self.base_delay = base_delay
+    self.max_delay = max_delay
+    self.paused_until = 0.0
+    self._cond = threading.Condition()
+
+    # Stats
+    self.waiting = 0
+    self.max_waiting = 0
+    self.calls = 0
+    self.retries = 0
+    self.failures = 0
+    self.total_wait = 0.0
+    self.max_wait = 0.0
+
+  # Block until the request fits in both budgets; returns the time spent waiting
+  def acquire(self, estimated_tokens):
+    start = time.monotonic()
+    with self._cond:
+      self.waiting += 1
+      self.max_waiting = max(self.max_waiting, self.waiting)
+      while True:
+        now = time.monotonic()
+        wait = self.paused_until - now
+        if self.request_bucket:
+          wait = max(wait, self.request_bucket.wait_time(1, now))
+        if self.token_bucket:
+          wait = max(wait, self.token_bucket.wait_time(estimated_tokens, now))
+        if wait <= 0:
+          break
+        self._cond.wait(wait)
+
+      if self.request_bucket:
+        self.request_bucket.take(1)
+      if self.token_bucket:
+        self.token_bucket.take(estimated_tokens)
+      self.waiting -= 1
+      waited = time.monotonic() - start
+      self.total_wait += waited
+      self.max_wait = max(self.max_wait, waited)
+    return waited
+
+  # Charge the difference between the estimated and the actual token count
+  def settle(self, estimated_tokens, actual_tokens):
+    if self.token_bucket is None:
+      return
+    with self._cond:
+      self.token_bucket.take(actual_tokens - estimated_tokens)
+      self._cond.notify_all()
+
+  def pause(self, seconds):
+    with self._cond:
+      self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+      # Waiting threads recompute their deadline with the new pause
+      self._cond.notify_all()
+
+  # Full-jitter exponential backoff, unless the server told us how long to wait
+  def retry_delay(self, error, attempt):
+    retry_after = retry_after_seconds(error)
+    if retry_after is not None:
+      return retry_after
+    return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+  # Run call() once the budgets allow it, retrying transient errors. usage_tokens(result)
+  # returns the tokens the call actually consumed (or None if unknown). If a timing dict
+  # is given, the time spent queued or backing off and the number of attempts are added to it.
+  def run(self, call, estimated_tokens, usage_tokens = None, timing = None):
+    timing = timing if timing is not None else {}
+    timing.setdefault('queue_wait', 0.0)
+    attempt = 0
+    while True:
+      with tracing.span('queue', 'scheduler'):
+        timing['queue_wait'] += self.acquire(estimated_tokens)
+      timing['attempts'] = attempt + 1
+      try:
+        with tracing.span('request', 'api', attempt = attempt + 1):
+          result = call()
+      except RETRYABLE_ERRORS as e:
+        with self._cond:
+          self.retries += 1
+          give_up = attempt >= self.max_retries
+          if give_up:
+            self.failures += 1
+        if give_up:
+          raise
+        delay = self.retry_delay(e, attempt)
+        if isinstance(e, openai.RateLimitError):
+          self.pause(delay)
+        else:
+          with tracing.span('backoff', 'scheduler', error = type(e).__name__):
+            time.sleep(delay)
+          timing['queue_wait'] += delay
+        attempt += 1
+        continue
+
+      with self._cond:
+        self.calls += 1
+      if usage_tokens is not None:
+        actual_tokens = usage_tokens(result)
+        if actual_tokens is not None:
+          self.settle(estimated_tokens, actual_tokens)
+      return result
+
+  def stats(self):
+    with self._cond:
+      average_wait = self.total_wait / (self.calls + self.retries) if self.calls + self.retries else 0.0
+      return (f"Scheduler: {self.calls} calls, {self.retries} retries, {self.failures} failed, "
+              f"queue depth {self.waiting} (max {self.max_waiting}), "
+              f"wait {average_wait:.2f}s avg / {self.max_wait:.2f}s max")
+
+def retry_after_seconds(error):
+  response = getattr(error, 'response', None)
+  if response is None:
+    return None
+  headers = response.headers
+  try:
+    if headers.get('retry-after-ms') is not None:
+      return float(headers['retry-after-ms']) / 1000
+    if headers.get('retry-after') is not None:
+      return float(headers['retry-after'])
+  except ValueError:
+    pass
+  return None
@@ -0,0 +1,278 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+from pathlib import Path
+
+# Splitting a cohort across machines. `run_tool.py --shard i/N` and
+# `generate_feedback_repo.py --shard i/N` grade only the i-th of N shards (1-based) of
+# the submissions they find. Every machine computes the same partition from the same
+# input tree: submissions are ordered by estimated size (ties broken by a stable hash
+# of their name, e.g. their path relative to the submissions directory) and each goes
+# to the shard with the least estimated work so far, so shards finish at about the
+# same time. Each shard writes a plan (INTER_DIR/shard.json)
+# with the whole cohort, its own share and, at the end, what failed.
+#
+# `python scripts/sharding.py merge --into DIR SHARD_DIR...` then combines the output/
+# and intermediates/ trees, run manifests, metrics ledgers and --profile timelines of
+# the shard workspaces into one, and checks that every submission of the cohort was assigned to exactly one
+# shard and graded, and that no two shards wrote the same file with different content.
+# DIR must not hold the results of an earlier merge, which would otherwise mix with
+# (and hide missing files of) the re-run shards.
+
+PLAN_FILE = 'shard.json'
+
+# Files that are combined rather than copied
+LEDGER_FILE = 'metrics.jsonl'
+MANIFEST_FILE = 'manifest.sqlite'
+TRACE_FILE = 'trace.json'
+SKIPPED_FILES = {PLAN_FILE, LEDGER_FILE, MANIFEST_FILE, TRACE_FILE, 'jobs.sqlite', 'worker_status.json'}
+
+# Per-shard state that is not a result: Batch API request files and batch ids, and
+# the persisted repo-mode index of the base tree (rebuilt on demand)
+SKIPPED_DIRS = {'batches'}
+SKIPPED_PREFIXES = ('base_index_',)
+
+# "i/N" -> (i, N)
+def parse_shard(text):
+  try:
+    index, count = (int(part) for part in text.split('/'))
+  except ValueError:
+    raise argparse.ArgumentTypeError(f"expected i/N, e.g. 1/4, not {text!r}")
+  if not 1 <= index <= count:
+    raise argparse.ArgumentTypeError(f"shard index must be between 1 and {count}")
+  return index, count
+
+def stable_hash(item):
+  return hashlib.sha256(str(item).encode('utf-8')).hexdigest()
+
+# About four characters per token, as llm.estimate_tokens
+def file_tokens(path):
+  return max(1, os.path.getsize(path) // 4)
+
+# Partition items into count shards of about equal total weight; returns a list of
+# lists, each in the original order of items
+def partition(items, count, weight, name = str):
+  loads = [0] * count
+  assignment = {}
+  for item in sorted(items, key = lambda item: (-weight(item), stable_hash(name(item)))):
+    shard = min(range(count), key = lambda shard: (loads[shard], shard))
+    loads[shard] += weight(item)
+    assignment[item] = shard
+  return [[item for item in items if assignment[item] == shard] for shard in range(count)]
+
+def cohort_fingerprint(items):
+  return stable_hash('\n'.join(sorted(str(item) for item in items)))
+
+# The items of shard (index, count), recording the plan in inter_dir. name(item) must be
+# the same on every machine (not an absolute path that differs between them).
+def select(items, shard, weight, inter_dir, name = str):
+  index, count = shard
+  shards = partition(list(items), count, weight, name)
+  assigned = shards[index - 1]
+  plan = {
+    'shard': index,
+    'count': count,
+    'cohort': cohort_fingerprint(name(item) for item in items),
+    'cohort_size': len(items),
+    'items': [name(item) for item in assigned],
+    'estimated_tokens': sum(weight(item) for item in assigned),
+    'failed': None,
+  }
+  write_plan(Path(inter_dir) / PLAN_FILE, plan)
+  print(f"Shard {index}/{count}: {len(assigned)} of {len(items)} submissions, ~{plan['estimated_tokens']} tokens")
+  return assigned
+
+def write_plan(path, plan):
+  os.makedirs(Path(path).parent, exist_ok = True)
+  tmp = Path(f"{path}.{os.getpid()}.tmp")
+  with open(tmp, 'w') as f:
+    json.dump(plan, f, indent = 2)
+  os.replace(tmp, path)
+
+# Record the end of the shard's run with the names of the items that failed
+def record_result(inter_dir, failed):
+  path = Path(inter_dir) / PLAN_FILE
+  if not path.exists():
+    return
+  with open(path, 'r') as f:
+    plan = json.load(f)
+  plan['failed'] = sorted(str(item) for item in failed)
+  write_plan(path, plan)
+
+# ========================= MERGE ==================================
+
+class MergeError(Exception):
+  pass
+
+def load_plans(shard_dirs, inter_dir):
+  plans = []
+  for shard_dir in shard_dirs:
+    path = Path(shard_dir) / inter_dir / PLAN_FILE
+    if not path.exists():
+      raise MergeError(f"{shard_dir}: no {inter_dir}/{PLAN_FILE}; was it run with --shard?")
+    with open(path, 'r') as f:
+      plans.append(json.load(f))
+  return plans
+
+# Problems with the plans: shards missing or repeated, different cohorts, submissions
+# assigned twice, unfinished runs and failed submissions
+def check_plans(shard_dirs, plans):
+  problems = []
+  counts = {plan['count'] for plan in plans}
+  cohorts = {plan['cohort'] for plan in plans}
+  if len(counts) > 1 or len(cohorts) > 1:
+    problems.append("shards come from different cohorts or shard counts")
+  count = max(counts)
+  indexes = [plan['shard'] for plan in plans]
+  missing = sorted(set(range(1, count + 1)) - set(indexes))
+  if missing:
+    problems.append(f"missing shards {missing} of {count}")
+  repeated = sorted({index for index in indexes if indexes.count(index) > 1})
+  if repeated:
+    problems.append(f"shards {repeated} given more than once")
+
+  owners = {}
+  for shard_dir, plan in zip(shard_dirs, plans):
+    for item in plan['items']:
+      owners.setdefault(item, []).append(str(shard_dir))
+    if plan['failed'] is None:
+      problems.append(f"{shard_dir}: shard {plan['shard']} did not finish")
+    else:
+      problems.extend(f"{shard_dir}: {item} failed" for item in plan['failed'])
+  for item, dirs in sorted(owners.items()):
+    if len(dirs) > 1:
+      problems.append(f"{item} graded by several shards: {', '.join(dirs)}")
+  if not missing and plans and len(owners) != plans[0]['cohort_size']:
+    problems.append(f"{len(owners)} submissions assigned, cohort has {plans[0]['cohort_size']}")
+  return problems, sorted(owners)
+
+# Copy the files of src into dest; a file already there with other content is a conflict
+def copy_tree(src, dest, conflicts, copied):
+  for directory, dirnames, filenames in os.walk(src):
+    dirnames[:] = [name for name in dirnames if name not in SKIPPED_DIRS]
+    for name in filenames:
+      # (SQLite databases come with -wal and -shm files)
+      if name.startswith(tuple(SKIPPED_FILES) + SKIPPED_PREFIXES) or name.endswith('.tmp'):
+        continue
+      source = Path(directory) / name
+      target = Path(dest) / source.relative_to(src)
+      if target.exists():
+        if not same_content(source, target):
+          conflicts.append(f"{target} written by {copied[str(target)]} and {source}")
+        continue
+      os.makedirs(target.parent, exist_ok = True)
+      shutil.copy2(source, target)
+      copied[str(target)] = str(source)
+
+def same_content(a, b):
+  with open(a, 'rb') as fa, open(b, 'rb') as fb:
+    return fa.read() == fb.read()
+
+# One ledger with every shard's calls, each labelled with its shard
+def merge_ledgers(shard_dirs, plans, inter_dir, dest):
+  os.makedirs(dest.parent, exist_ok = True)
+  with open(dest, 'w') as out:
+    for shard_dir, plan in zip(shard_dirs, plans):
+      path = Path(shard_dir) / inter_dir / LEDGER_FILE
+      if not path.exists():
+        continue
+      with open(path, 'r') as f:
+        for line in f:
+          try:
+            entry = json.loads(line)
+          except json.JSONDecodeError:
+            continue
+          entry['shard'] = plan['shard']
+          out.write(json.dumps(entry, ensure_ascii = False) + '\n')
+
+# One run manifest with every shard's rows, so that a later unsharded run resumes
+def merge_manifests(shard_dirs, inter_dir, dest):
+  sources = [Path(shard_dir) / inter_dir / MANIFEST_FILE for shard_dir in shard_dirs]
+  sources = [source for source in sources if source.exists()]
+  if not sources:
+    return
+  if dest.exists():
+    dest.unlink()
+  db = sqlite3.connect(str(dest))
+  # The backup API also picks up rows still in the source's write-ahead log
+  first = sqlite3.connect(str(sources[0]))
+  first.backup(db)
+  first.close()
+  for source in sources[1:]:
+    db.execute("ATTACH DATABASE ? AS shard", (str(source),))
+    with db:
+      db.execute("INSERT OR REPLACE INTO submissions SELECT * FROM shard.submissions")
+    db.execute("DETACH DATABASE shard")
+  db.close()
+
+# One timeline with each shard's --profile trace as its own process (pid = shard
+# index); every shard's clock starts at 0, since the machines' clocks need not agree
+def merge_traces(shard_dirs, plans, inter_dir, dest):
+  events = []
+  for shard_dir, plan in zip(shard_dirs, plans):
+    path = Path(shard_dir) / inter_dir / TRACE_FILE
+    if not path.exists():
+      continue
+    with open(path, 'r') as f:
+      trace = json.load(f)
+    for event in trace['traceEvents']:
+      event['pid'] = plan['shard']
+      if event['name'] == 'process_name':
+        event['args'] = {'name': f"shard {plan['shard']}/{plan['count']} ({shard_dir})"}
+      events.append(event)
+  if not events:
+    return
+  os.makedirs(dest.parent, exist_ok = True)
+  with open(dest, 'w') as f:
+    json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+def merge(shard_dirs, into, inter_dir, output_dir):
+  plans = load_plans(shard_dirs, inter_dir)
+  problems, items = check_plans(shard_dirs, plans)
+
+  into = Path(into)
+  for tree in (output_dir, inter_dir):
+    if (into / tree).is_dir() and any((into / tree).iterdir()):
+      raise MergeError(f"{into / tree} is not empty; merge into a new directory")
+  conflicts = []
+  copied = {}
+  for shard_dir in shard_dirs:
+    for tree in (output_dir, inter_dir):
+      if (Path(shard_dir) / tree).is_dir():
+        copy_tree(Path(shard_dir) / tree, into / tree, conflicts, copied)
+  problems.extend(conflicts)
+  merge_ledgers(shard_dirs, plans, inter_dir, into / inter_dir / LEDGER_FILE)
+  merge_manifests(shard_dirs, inter_dir, into / inter_dir / MANIFEST_FILE)
+  merge_traces(shard_dirs, plans, inter_dir, into / inter_dir / TRACE_FILE)
+
+  print(f"Merged {len(plans)} shards ({len(items)} submissions, {len(copied)} files) into {into}")
+  return problems
+
+def main():
+  parser = argparse.ArgumentParser(description = "Combine the workspaces of a sharded run")
+  subparsers = parser.add_subparsers(dest = "command", required = True)
+  merge_parser = subparsers.add_parser("merge", help = "Merge shard workspaces into one result tree and check it")
+  merge_parser.add_argument("shard_dirs", nargs = "+", help = "Workspace of each shard (containing output/ and intermediates/)")
+  merge_parser.add_argument("--into", required = True, help = "Directory of the merged workspace")
+  merge_parser.add_argument("--inter-dir", default = "intermediates", help = "Intermediates directory inside each workspace")
+  merge_parser.add_argument("--output-dir", default = "output", help = "Output directory inside each workspace")
+  args = parser.parse_args()
+
+  try:
+    problems = merge(args.shard_dirs, args.into, args.inter_dir, args.output_dir)
+  except MergeError as e:
+    print(f"Error: {e}")
+    sys.exit(1)
+  for problem in problems:
+    print(f"  problem: {problem}")
+  if problems:
+    print(f"{len(problems)} problems found")
+    sys.exit(1)
+  print("All submissions graded exactly once")
+
+if __name__ == "__main__":
+  main()
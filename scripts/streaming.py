@@ -0,0 +1,62 @@
+import json
+
+# Incremental parsing of a streamed structured response. The proposer and reviewer
+# answer with a FeedbackResponse object whose `annotations` array is generated first;
+# with STREAM=1 the response text arrives in small deltas, and every annotation is
+# handed on as soon as its closing brace has been generated instead of when the whole
+# response (often tens of seconds with reasoning models) is complete.
+
+class ArrayItems:
+  """Parser fed with the deltas of a JSON object; returns each complete object element of one top-level array field."""
+
+  def __init__(self, field):
+    self.field = field
+    self.text = ''
+    self.depth = 0
+    self.in_string = False
+    self.escape = False
+    self.string_start = 0
+    # Last string seen at the top level, and the key whose value is being read
+    self.last_string = None
+    self.key = None
+    self.in_array = False
+    self.item_start = None
+
+  # Parse the delta and return the elements completed by it (as dicts)
+  def feed(self, delta):
+    items = []
+    start = len(self.text)
+    self.text += delta
+    text = self.text
+    for i in range(start, len(text)):
+      ch = text[i]
+      if self.in_string:
+        if self.escape:
+          self.escape = False
+        elif ch == '\\':
+          self.escape = True
+        elif ch == '"':
+          self.in_string = False
+          if self.depth == 1:
+            self.last_string = text[self.string_start + 1:i]
+      elif ch == '"':
+        self.in_string = True
+        self.string_start = i
+      elif ch == ':' and self.depth == 1:
+        self.key = self.last_string
+      elif ch == ',' and self.depth == 1:
+        self.key = None
+      elif ch in '{[':
+        self.depth += 1
+        if ch == '[' and self.depth == 2 and self.key == self.field:
+          self.in_array = True
+        elif ch == '{' and self.depth == 3 and self.in_array:
+          self.item_start = i
+      elif ch in '}]':
+        if ch == '}' and self.depth == 3 and self.item_start is not None:
+          items.append(json.loads(text[self.item_start:i + 1]))
+          self.item_start = None
+        elif ch == ']' and self.depth == 2:
+          self.in_array = False
+        self.depth -= 1
+    return items
@@ -0,0 +1,102 @@
+import json
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+import batch_api
+import generate_feedback as gf
+import llm
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'benchmark'))
+import mock_server
+
+PROGRAM = "#include <stdio.h>\n\nint main(void)\n{\n  printf(\"hello\\n\");\n  return 0;\n}\n"
+
+# The mock server on a free port; its state shows which batches were created
+@pytest.fixture
+def server(monkeypatch):
+  mock_server.Handler.state = mock_server.MockState(mock_server.parse_args(['--batch-delay', '0', '--batch-fail', 'broken']))
+  httpd = mock_server.MockServer(('127.0.0.1', 0), mock_server.Handler)
+  httpd.daemon_threads = True
+  thread = threading.Thread(target = httpd.serve_forever, daemon = True)
+  thread.start()
+  monkeypatch.setenv('OPENAI_BASE_URL', f"http://127.0.0.1:{httpd.server_address[1]}/v1")
+  monkeypatch.setattr(llm, '_client', None)
+  yield mock_server.Handler.state
+  httpd.shutdown()
+  httpd.server_close()
+
+# A workspace with the pipeline's relative input/, output/ and intermediates/ trees
+# and a response cache
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  monkeypatch.setenv('CACHE_DIR', str(tmp_path / 'cache'))
+  monkeypatch.setattr(llm, '_cache', None)
+  monkeypatch.setattr(batch_api, 'POLL_INTERVAL', 0)
+  monkeypatch.setattr(gf, 'SUMMARY_MODE', 'local')
+  return tmp_path
+
+def submission(name, program = PROGRAM):
+  path = Path('input') / 'all_submissions' / name / 'shell' / 'wish.c'
+  path.parent.mkdir(parents = True, exist_ok = True)
+  path.write_text(program)
+  return path
+
+def batch_sizes(state):
+  return [batch['total'] for batch in state.batches.values()]
+
+def test_run_batch_writes_feedback(server, workspace):
+  programs = [submission('alice'), submission('bob')]
+  assert batch_api.run_batch(programs, "Problem", "Rubric") == set()
+  for program in programs:
+    assert gf.intermediate_file(program, "_final.json").exists()
+    assert gf.feedback_file(program).exists()
+  assert batch_sizes(server) == [2, 2]
+  assert not list(Path('intermediates').rglob('*.tmp'))
+  # The stages were fanned out, so a later run submits fresh batches
+  assert not list(batch_api.BATCH_DIR.glob('*_batch.json'))
+
+def test_cached_requests_are_left_out_of_the_batch(server, workspace):
+  alice = submission('alice')
+  batch_api.run_batch([alice], "Problem", "Rubric")
+  bob = submission('bob', PROGRAM.replace("hello", "bye"))
+  assert batch_api.run_batch([alice, bob], "Problem", "Rubric") == set()
+  # alice is answered from the cache in both stages; only bob is sent
+  assert batch_sizes(server) == [1, 1, 1, 1]
+  assert gf.feedback_file(bob).exists()
+
+def test_failed_line_fails_only_its_submission(server, workspace):
+  alice, broken = submission('alice'), submission('broken')
+  assert batch_api.run_batch([alice, broken], "Problem", "Rubric") == {broken}
+  assert gf.feedback_file(alice).exists()
+  assert not gf.intermediate_file(broken, "_intermediate.json").exists()
+  # The reviewer batch only carries the submission that got through the proposer
+  assert batch_sizes(server) == [2, 1]
+
+def requests_for(*custom_ids):
+  return {custom_id: batch_api.batch_request(custom_id, 'mock-model', [{"role": "user", "content": custom_id}])
+          for custom_id in custom_ids}
+
+def test_resumes_the_saved_batch_of_the_same_requests(server, workspace):
+  requests = requests_for('a', 'b')
+  batch_id = batch_api.submit_batch('proposer', batch_api.write_batch_file('proposer', [request for request, _ in requests.values()]))
+  answered = {}
+  failed = batch_api.run_stage('proposer', requests, lambda custom_id, response: answered.update({str(custom_id): response.output_text}))
+  assert failed == set()
+  assert sorted(answered) == ['a', 'b']
+  assert list(server.batches) == [batch_id]
+
+def test_does_not_resume_a_saved_batch_of_other_requests(server, workspace):
+  old = requests_for('a')
+  batch_api.submit_batch('proposer', batch_api.write_batch_file('proposer', [request for request, _ in old.values()]))
+  # b was added after the crash
+  answered = []
+  failed = batch_api.run_stage('proposer', requests_for('a', 'b'), lambda custom_id, response: answered.append(str(custom_id)))
+  assert failed == set()
+  assert sorted(answered) == ['a', 'b']
+  assert batch_sizes(server) == [1, 2]
+  with open(batch_api.BATCH_DIR / 'proposer.jsonl') as f:
+    assert [json.loads(line)['custom_id'] for line in f] == ['a', 'b']
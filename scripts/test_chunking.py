@@ -0,0 +1,112 @@
+import chunking
+import dedup
+import excerpt
+from generate_feedback import Annotation
+
+HEADER = ["#include <stdio.h>\n", "\n", "int count;\n", "\n"]
+
+# A C file of n functions of body_lines lines each, after HEADER
+def program(n, body_lines):
+  lines = list(HEADER)
+  for i in range(n):
+    lines += [f"int f{i}(int x)\n", "{\n"] + [f"  x += {j};\n" for j in range(body_lines)] + ["  return x;\n", "}\n", "\n"]
+  return lines
+
+def budget(lines):
+  return sum(chunking.line_sizes(lines, {})) // chunking.CHARS_PER_TOKEN
+
+# The dedup.Function of f<i> in lines (1-based lines, as dedup.analyze finds them)
+def function(lines, i):
+  start, body, end = excerpt.functions(lines)[i]
+  name = f"f{i}"
+  return dedup.Function(name, name, start + 1, body + 1, end + 1, [])
+
+def test_small_or_unsplittable_submissions_are_not_chunked():
+  lines = program(4, 10)
+  assert chunking.split(lines, budget(lines)) is None
+  assert chunking.split(lines, 0) is None
+  one = program(1, 200)
+  assert chunking.split(one, 10) is None
+
+def test_chunks_cover_the_file_within_the_budget():
+  lines = program(6, 20)
+  max_tokens = budget(lines) // 3
+  chunks = chunking.split(lines, max_tokens)
+  assert len(chunks) > 1
+  assert chunks[0].start == len(HEADER) + 1
+  assert chunks[-1].end == len(lines)
+  for previous, chunk in zip(chunks, chunks[1:]):
+    assert chunk.start == previous.end + 1
+  for chunk in chunks:
+    assert (chunk.index, chunk.count) == (chunks.index(chunk), len(chunks))
+    assert budget(lines[chunk.start - 1:chunk.end]) <= max_tokens
+    # Every chunk shows the shared header with the real line numbers
+    assert "1 | #include <stdio.h>\n" in chunk.text
+    assert f"{chunk.start} | " in chunk.text and f"{chunk.end} | " in chunk.text
+
+def test_a_function_over_the_budget_is_a_chunk_of_its_own():
+  lines = program(2, 10) + program(1, 200)[len(HEADER):] + program(2, 10)[len(HEADER):]
+  chunks = chunking.split(lines, budget(program(2, 10)))
+  assert any(budget(lines[chunk.start - 1:chunk.end]) > budget(program(2, 10)) for chunk in chunks)
+
+def test_header_annotations_belong_to_the_first_chunk():
+  lines = program(6, 20)
+  chunks = chunking.split(lines, budget(lines) // 3)
+  assert chunks[0].owns(1) and not chunks[1].owns(1)
+  assert chunks[1].owns(chunks[1].start) and not chunks[0].owns(chunks[1].start)
+
+def test_elided_bodies_are_left_out_of_chunks_and_budget():
+  lines = program(6, 20)
+  elided = [function(lines, i) for i in range(4)]
+  bodies = dedup.bodies(elided)
+  max_tokens = budget(lines) // 2
+  # Over the budget in full, but not without the four shared bodies
+  assert chunking.split(lines, max_tokens) is not None
+  assert chunking.split(lines, max_tokens, bodies) is None
+
+  chunks = chunking.split(lines, budget(lines) // 5, bodies)
+  text = ''.join(chunk.text for chunk in chunks)
+  assert "body of f0, shared starter code reviewed separately" in text
+  for first, (last, _) in bodies.items():
+    assert f"\n{first} | " not in text and f"\n{last} | " not in text
+  # The functions that are not shared are still shown in full
+  assert f"{elided[-1].end + 4} |   x += 0;" in text
+
+def annotation(line_number, category, comment, severity):
+  return Annotation(line_number = line_number, category = category, comment = comment, severity = severity)
+
+def test_merge_keeps_the_most_severe_of_a_line_and_category():
+  merged = chunking.merge_annotations([
+    [annotation(5, 'pointers_memory', "Leaks the buffer.", 'suggestion')],
+    [annotation(5, 'pointers_memory', "Frees twice.", 'critical'), annotation(2, 'program_design', "Split this.", 'issue')],
+  ])
+  assert [(a.line_number, a.comment) for a in merged] == [(2, "Split this."), (5, "Frees twice.")]
+
+def test_merge_drops_the_same_comment_under_another_category():
+  merged = chunking.merge_annotations([
+    [annotation(5, 'pointers_memory', "Leaks  the buffer.", 'issue')],
+    [annotation(5, 'program_design', "leaks the buffer.", 'suggestion')],
+  ])
+  assert [(a.category, a.severity) for a in merged] == [('pointers_memory', 'issue')]
+
+def test_merge_keeps_the_more_severe_comment_duplicate():
+  merged = chunking.merge_annotations([
+    [annotation(5, 'pointers_memory', "Leaks the buffer.", 'suggestion')],
+    [annotation(5, 'program_design', "Leaks the buffer.", 'critical')],
+  ])
+  assert [(a.category, a.severity) for a in merged] == [('program_design', 'critical')]
+
+def test_merge_tracks_the_comment_of_a_replacing_annotation():
+  merged = chunking.merge_annotations([
+    [annotation(5, 'pointers_memory', "Leaks the buffer.", 'suggestion')],
+    [annotation(5, 'pointers_memory', "Frees twice.", 'critical')],
+    [annotation(5, 'program_design', "Frees twice.", 'issue')],
+  ])
+  assert [(a.category, a.comment) for a in merged] == [('pointers_memory', "Frees twice.")]
+
+def test_merge_keeps_other_lines_and_comments():
+  merged = chunking.merge_annotations([
+    [annotation(5, 'pointers_memory', "Leaks the buffer.", 'issue'), annotation(6, 'pointers_memory', "Leaks the buffer.", 'issue')],
+    [annotation(5, 'program_design', "Split this.", 'issue')],
+  ])
+  assert [(a.line_number, a.category) for a in merged] == [(5, 'pointers_memory'), (5, 'program_design'), (6, 'pointers_memory')]
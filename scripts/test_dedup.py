@@ -0,0 +1,97 @@
+import dedup
+from generate_feedback import Annotation
+
+STARTER = """\
+int parse(char *line, char **args)
+{
+  int n = 0;
+  char *token = strtok(line, " ");
+  while (token != NULL) {
+    args[n++] = token;
+    token = strtok(NULL, " ");
+  }
+  args[n] = NULL;
+  return n;
+}
+"""
+
+def write(tmp_path, name, text):
+  path = tmp_path / name
+  path.write_text(text)
+  return path
+
+def annotation(line_number):
+  return Annotation(line_number = line_number, category = 'program_design', comment = "Check this.", severity = 'issue')
+
+def test_strip_comments_keeps_newlines_and_strings():
+  text = 'a = "// not a comment"; /* one\ntwo */ b = \'"\'; // end\nc = "/* nor this */";\n'
+  assert dedup.strip_comments(text) == 'a = "// not a comment"; \n b = \'"\'; \nc = "/* nor this */";\n'
+
+def test_strip_comments_handles_escaped_quotes():
+  text = 'puts("say \\"hi\\" // there"); // gone\n'
+  assert dedup.strip_comments(text) == 'puts("say \\"hi\\" // there"); \n'
+
+def test_normalize_collapses_whitespace_and_keeps_line_numbers():
+  lines = ["int  main(void)\n", "\n", "{  // entry\n", "\t/* nothing */\n", "  return   0;\n", "}\n"]
+  assert dedup.normalize(lines) == [(1, "int main(void)"), (3, "{"), (5, "return 0;"), (6, "}")]
+
+def test_copies_that_differ_in_comments_and_layout_are_duplicates(tmp_path):
+  original = write(tmp_path, 'a.c', "int main(void)\n{\n  return 0;\n}\n")
+  reformatted = write(tmp_path, 'b.c', "// copied\nint main(void)\n{\n\n    return 0;   /* done */\n}\n")
+  changed = write(tmp_path, 'c.c', "int main(void)\n{\n  return 1;\n}\n")
+  cohort = dedup.analyze([original, reformatted, changed])
+  assert cohort.leader == {reformatted: original}
+  assert cohort.followers(original) == [reformatted]
+  assert cohort.followers(changed) == []
+
+def test_annotations_are_remapped_to_the_copy(tmp_path):
+  original = write(tmp_path, 'a.c', "int main(void)\n{\n  int x = 1;\n  return x;\n}\n")
+  copy = write(tmp_path, 'b.c', "/* header\n   comment */\nint main(void)\n{\n\n  int x = 1;\n\n  return x;\n}\n")
+  cohort = dedup.analyze([original, copy])
+  remapped = cohort.submissions[copy].remap_from(cohort.submissions[original], [annotation(3), annotation(4), annotation(5)])
+  assert [a.line_number for a in remapped] == [6, 8, 9]
+
+def test_remap_line_of_a_line_without_code():
+  # Line 3 is blank in the source: it goes with the next line that has code
+  assert dedup.remap_line(3, [1, 2, 4], [10, 11, 12]) == 12
+  assert dedup.remap_line(9, [1, 2, 4], [10, 11, 12]) == 12
+  assert dedup.remap_line(5, [], [1]) == 5
+
+def test_functions_in_enough_submissions_are_shared(tmp_path):
+  paths = [write(tmp_path, f"{i}.c", f"// student {i}\n" + "\n" * (i + 1) + STARTER + f"\nint main(void)\n{{\n  return {i};\n}}\n")
+           for i in range(4)]
+  cohort = dedup.analyze(paths, min_shared = 3)
+  assert cohort.leader == {}
+  [shared] = cohort.shared.values()
+  assert (shared.function.name, shared.count) == ('parse', 4)
+  # main differs everywhere, and is too short to be shared anyway
+  [(found, function)] = cohort.shared_in(paths[2])
+  assert found is shared
+  assert (function.start, function.end) == (5, 15)
+  assert shared.text().startswith("3 | int parse(char *line, char **args)\n")
+  # The shared review's annotations move to each copy's lines
+  assert [a.line_number for a in shared.remap_to(function, [annotation(4), annotation(12)])] == [6, 14]
+
+def test_functions_below_the_thresholds_are_not_shared(tmp_path):
+  paths = [write(tmp_path, f"{i}.c", STARTER + f"int f(void)\n{{\n  return {i};\n}}\n") for i in range(2)]
+  assert dedup.analyze(paths, min_shared = 3).shared == {}
+  assert dedup.analyze(paths, min_shared = 0).shared == {}
+  assert dedup.analyze(paths, min_shared = 2, min_lines = 20).shared == {}
+  assert len(dedup.analyze(paths, min_shared = 2).shared) == 1
+
+def test_duplicates_count_once_towards_sharing(tmp_path):
+  paths = [write(tmp_path, f"{i}.c", STARTER) for i in range(3)]
+  cohort = dedup.analyze(paths, min_shared = 2)
+  assert len(cohort.leader) == 2
+  assert cohort.shared == {}
+
+def test_elide_keeps_signature_and_closing_brace(tmp_path):
+  paths = [write(tmp_path, f"{i}.c", f"int g = {i};\n" + STARTER) for i in range(3)]
+  cohort = dedup.analyze(paths)
+  [(_, function)] = cohort.shared_in(paths[0])
+  text = dedup.elide(cohort.submissions[paths[0]].lines, [function])
+  assert text == ("1 | int g = 0;\n"
+                  "2 | int parse(char *line, char **args)\n"
+                  "3 | {\n"
+                  "... (lines 4-11: body of parse, shared starter code reviewed separately)\n"
+                  "12 | }\n")
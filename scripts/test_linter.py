@@ -0,0 +1,71 @@
+import linter
+
+OUTPUT = """\
+2 warnings and 1 error generated.
+wish.c:40:3: warning: Value stored to 'n' is never read [clang-analyzer-deadcode.DeadStores]
+   40 |   n = read(fd, buf, sizeof(buf));
+      |   ^   ~~~~~~~~~~~~~~~~~~~~~~~~~~
+wish.c:12:9: warning: variable 'i' is not initialized [cppcoreguidelines-init-variables]
+wish.c:30:5: error: use of undeclared identifier 'fd' [clang-diagnostic-error]
+wish.c:12:9: note: initialize the variable 'i' to silence this warning
+/usr/include/stdio.h:3:1: warning: declaration shadows a local variable [clang-diagnostic-shadow]
+wish.c:55:1: warning: variable 'i' is not initialized [cppcoreguidelines-init-variables]
+wish.c:60:2: warning: implicit declaration of function 'waitpid'
+Suppressed 120 warnings (120 in non-user code).
+"""
+
+def test_parses_diagnostics_of_the_file():
+  diagnostics = linter.parse_diagnostics(OUTPUT, limit = 0)
+  assert {(d.line, d.check) for d in diagnostics} == {
+    (40, 'clang-analyzer-deadcode.DeadStores'),
+    (12, 'cppcoreguidelines-init-variables'),
+    (30, 'clang-diagnostic-error'),
+    (3, 'clang-diagnostic-shadow'),
+    (60, 'clang-diagnostic'),
+  }
+  dead_store = [d for d in diagnostics if d.line == 40][0]
+  assert (dead_store.file, dead_store.column, dead_store.severity) == ('wish.c', 3, 'warning')
+  assert dead_store.message == "Value stored to 'n' is never read"
+
+def test_ignores_diagnostics_in_other_files(tmp_path):
+  program = tmp_path / 'wish.c'
+  program.write_text("int main(void) { return 0; }\n")
+  output = OUTPUT.replace('wish.c:', f"{program}:")
+  diagnostics = linter.parse_diagnostics(output, program, limit = 0)
+  assert all(d.file == str(program) for d in diagnostics)
+  assert 3 not in {d.line for d in diagnostics}
+
+def test_folds_repeats_of_a_check_and_message():
+  diagnostics = linter.parse_diagnostics(OUTPUT, limit = 0)
+  uninitialized = [d for d in diagnostics if d.check == 'cppcoreguidelines-init-variables']
+  assert len(uninitialized) == 1
+  assert (uninitialized[0].line, uninitialized[0].other_lines) == (12, [55])
+
+def test_same_check_with_another_message_is_kept():
+  output = ("wish.c:1:1: warning: variable 'i' is not initialized [cppcoreguidelines-init-variables]\n"
+            "wish.c:2:1: warning: variable 'j' is not initialized [cppcoreguidelines-init-variables]\n")
+  assert [d.line for d in linter.parse_diagnostics(output)] == [1, 2]
+
+def test_ranks_by_severity_then_check_then_line():
+  diagnostics = linter.parse_diagnostics(OUTPUT, limit = 0)
+  # Checks outside CHECK_PRIORITY (and warnings without a check) come last, by line
+  assert [d.line for d in diagnostics] == [30, 40, 3, 12, 60]
+
+def test_caps_the_number_of_diagnostics():
+  assert [d.line for d in linter.parse_diagnostics(OUTPUT, limit = 2)] == [30, 40]
+  assert len(linter.parse_diagnostics(OUTPUT, limit = 0)) == 5
+
+def test_brackets_inside_the_message():
+  output = "wish.c:7:10: warning: array index 3 is past the end of the array (that has type 'char[3]') [clang-diagnostic-array-bounds]\n"
+  [diagnostic] = linter.parse_diagnostics(output)
+  assert diagnostic.message == "array index 3 is past the end of the array (that has type 'char[3]')"
+  assert diagnostic.check == 'clang-diagnostic-array-bounds'
+
+def test_render_and_lookup_by_line():
+  diagnostics = linter.parse_diagnostics(OUTPUT, limit = 0)
+  rendered = linter.render_diagnostics(diagnostics).splitlines()
+  assert rendered[0] == "- line 30: error [clang-diagnostic-error] use of undeclared identifier 'fd'"
+  assert rendered[3] == "- line 12 (also line 55): warning [cppcoreguidelines-init-variables] variable 'i' is not initialized"
+  by_line = linter.diagnostics_by_line(diagnostics)
+  assert by_line[55] == by_line[12]
+  assert linter.render_diagnostics([]) == "No clang-tidy diagnostics."
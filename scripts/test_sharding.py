@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+import sharding
+
+# Workspaces of a cohort of four submissions graded in two shards
+@pytest.fixture
+def shards(tmp_path):
+  items = [f"s{i}/shell/wish.c" for i in range(4)]
+  dirs = []
+  for index in (1, 2):
+    shard_dir = tmp_path / f"shard{index}"
+    assigned = sharding.select(items, (index, 2), lambda item: 1, shard_dir / 'intermediates')
+    for item in assigned:
+      feedback = shard_dir / 'output' / item.replace('wish.c', 'wish_feedback.c')
+      feedback.parent.mkdir(parents = True)
+      feedback.write_text(f"/* feedback on {item} */\n")
+    sharding.record_result(shard_dir / 'intermediates', [])
+    dirs.append(shard_dir)
+  return dirs
+
+def merge(shard_dirs, into):
+  return sharding.merge(shard_dirs, into, 'intermediates', 'output')
+
+def test_merge_combines_the_shards(shards, tmp_path):
+  assert merge(shards, tmp_path / 'merged') == []
+  assert len(list((tmp_path / 'merged' / 'output').rglob('*_feedback.c'))) == 4
+  # The plans of the shards are not copied
+  assert not (tmp_path / 'merged' / 'intermediates' / sharding.PLAN_FILE).exists()
+
+def test_merge_reports_files_the_shards_wrote_differently(shards, tmp_path):
+  clash = shards[0] / 'output' / 'extra.txt'
+  clash.write_text("one\n")
+  (shards[1] / 'output' / 'extra.txt').write_text("two\n")
+  [problem] = merge(shards, tmp_path / 'merged')
+  assert problem.startswith(f"{tmp_path / 'merged' / 'output' / 'extra.txt'} written by {clash}")
+
+def test_merge_refuses_the_results_of_an_earlier_merge(shards, tmp_path):
+  merge(shards, tmp_path / 'merged')
+  # Re-running a shard must not leave the earlier merge's outputs in place
+  with pytest.raises(sharding.MergeError, match = "not empty"):
+    merge(shards, tmp_path / 'merged')
+  (tmp_path / 'empty' / 'output').mkdir(parents = True)
+  assert merge(shards, tmp_path / 'empty') == []
+
+def test_merge_reports_missing_and_failed_shards(shards, tmp_path):
+  plan_file = shards[1] / 'intermediates' / sharding.PLAN_FILE
+  plan = json.loads(plan_file.read_text())
+  plan['failed'] = [plan['items'][0]]
+  plan_file.write_text(json.dumps(plan))
+  problems = merge(shards, tmp_path / 'merged')
+  assert problems == [f"{shards[1]}: {plan['items'][0]} failed"]
+  assert "missing shards [2] of 2" in merge(shards[:1], tmp_path / 'alone')
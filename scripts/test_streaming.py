@@ -0,0 +1,61 @@
+import json
+
+import streaming
+
+RESPONSE = json.dumps({
+  "annotations": [
+    {"line_number": 3, "category": "pointers_memory", "comment": "Escaped \"quotes\", a backslash \\ and {braces} [brackets]", "severity": "issue"},
+    {"line_number": 7, "category": "program_design", "comment": "Nested {\"not\": [\"an item\"]} text}", "severity": "suggestion"},
+    {"line_number": 9, "category": "code_readability", "comment": "Unicode é中 and a trailing backslash \\", "severity": "critical"},
+  ],
+  "summary": {"strengths": "Clear {structure}", "areas_for_improvement": "[none]", "overall_assessment": "ok"},
+})
+
+EXPECTED = json.loads(RESPONSE)["annotations"]
+
+# Feed text in the given deltas; returns the items each delta completed
+def feed(deltas, field = "annotations"):
+  parser = streaming.ArrayItems(field)
+  return [parser.feed(delta) for delta in deltas]
+
+def flatten(batches):
+  return [item for batch in batches for item in batch]
+
+def test_whole_response_at_once():
+  assert feed([RESPONSE]) == [EXPECTED]
+
+def test_one_character_at_a_time():
+  batches = feed(list(RESPONSE))
+  assert flatten(batches) == EXPECTED
+  # Each item is handed on by the delta with its closing brace, not at the end
+  closing = [i for i, batch in enumerate(batches) if batch]
+  assert len(closing) == len(EXPECTED)
+  assert closing[-1] < RESPONSE.index('"summary"')
+
+def test_every_split_point():
+  for i in range(len(RESPONSE) + 1):
+    assert flatten(feed([RESPONSE[:i], RESPONSE[i:]])) == EXPECTED, i
+
+def test_escapes_split_across_deltas():
+  quote = RESPONSE.index('\\"quotes')
+  backslash = RESPONSE.index('\\\\ and {braces}')
+  deltas = [RESPONSE[:quote + 1], RESPONSE[quote + 1:backslash + 1], RESPONSE[backslash + 1:]]
+  assert flatten(feed(deltas)) == EXPECTED
+
+def test_only_the_given_field_is_read():
+  text = json.dumps({
+    "note": "annotations",
+    "other": [{"line_number": 1}],
+    "summary": {"annotations": [{"line_number": 2}]},
+    "annotations": [{"line_number": 3, "extra": {"nested": [{"line_number": 4}]}}],
+  })
+  assert flatten(feed(list(text))) == [{"line_number": 3, "extra": {"nested": [{"line_number": 4}]}}]
+  assert flatten(feed(list(text), field = "other")) == [{"line_number": 1}]
+
+def test_empty_and_unfinished_arrays():
+  assert flatten(feed(['{"annotations": [], "summary": {}}'])) == []
+  assert flatten(feed(['{"annotations": [{"line_number": 1}, {"line_', 'number": 2'])) == [{"line_number": 1}]
+
+def test_whitespace_between_tokens():
+  text = '{\n  "annotations" :\n  [\n    { "line_number" : 1 } ,\n    {"line_number":2}\n  ]\n}'
+  assert flatten(feed(list(text))) == [{"line_number": 1}, {"line_number": 2}]
@@ -0,0 +1,115 @@
+import functools
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Opt-in timeline of a run (--profile), written as a Chrome trace that opens in
+# https://ui.perfetto.dev or chrome://tracing. Every span is a "complete" event on the
+# track of the thread that ran it: one track per worker of the driver's pool, with the
+# pipeline stages a worker runs concurrently (e.g. linting next to the proposer) on
+# tracks of their own just below it ("worker_3 / 1"). LLM calls show the time queued
+# by the rate-limit scheduler and each request to the API; clang-tidy runs show up
+# on one track per linter process.
+#
+# When tracing is off, span() and traced functions cost one check.
+
+_events = None
+_lock = threading.Lock()
+_local = threading.local()
+
+def enable():
+  global _events
+  with _lock:
+    if _events is None:
+      _events = []
+
+def enabled():
+  return _events is not None
+
+def now():
+  return time.time()
+
+# The track of the calling thread: set by on_track(), else the thread's name
+def current_track():
+  return getattr(_local, 'track', None) or threading.current_thread().name
+
+# Record a span timed elsewhere (e.g. in another process); start and end from now()
+def add_span(name, start, end, track = None, cat = 'stage', **args):
+  if _events is None:
+    return
+  event = (name, cat, start, end, track or current_track(), args)
+  with _lock:
+    _events.append(event)
+
+# Time a block as a span; the block may add args to the dict it is given
+@contextmanager
+def span(name, cat = 'stage', **args):
+  if _events is None:
+    yield args
+    return
+  start = now()
+  try:
+    yield args
+  except Exception as e:
+    args['error'] = str(e)
+    raise
+  finally:
+    add_span(name, start, now(), cat = cat, **args)
+
+# Decorator: every call of the function is a span named after it
+def traced(function = None, cat = 'stage'):
+  def decorate(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+      if _events is None:
+        return function(*args, **kwargs)
+      with span(function.__name__, cat):
+        return function(*args, **kwargs)
+    return wrapper
+  return decorate(function) if function is not None else decorate
+
+# Run fn on a track below parent, numbered after the calling pool thread, so that the
+# concurrent stages of one worker sit next to its track
+def on_track(parent, fn, *args, **kwargs):
+  if _events is None:
+    return fn(*args, **kwargs)
+  previous = getattr(_local, 'track', None)
+  _local.track = f"{parent} / {threading.current_thread().name.rsplit('_', 1)[-1]}"
+  try:
+    return fn(*args, **kwargs)
+  finally:
+    _local.track = previous
+
+# Tracks sort by name with numbers compared as numbers (worker_2 before worker_10)
+def _sort_key(track):
+  return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', track)]
+
+def write(path):
+  with _lock:
+    events = list(_events or [])
+  if not events:
+    return
+  origin = min(start for _, _, start, _, _, _ in events)
+  tracks = sorted({track for _, _, _, _, track, _ in events}, key = _sort_key)
+  tids = {track: tid for tid, track in enumerate(tracks, start = 1)}
+  pid = os.getpid()
+
+  trace = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'feedback run'}}]
+  for track, tid in tids.items():
+    trace.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': track}})
+    trace.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'sort_index': tid}})
+  for name, cat, start, end, track, args in events:
+    trace.append({'name': name, 'cat': cat, 'ph': 'X', 'pid': pid, 'tid': tids[track],
+                  'ts': round((start - origin) * 1e6), 'dur': round((end - start) * 1e6),
+                  'args': {key: str(value) if isinstance(value, Path) else value for key, value in args.items()}})
+
+  os.makedirs(Path(path).parent, exist_ok = True)
+  tmp = Path(f"{path}.{os.getpid()}.tmp")
+  with open(tmp, 'w') as f:
+    json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+  os.replace(tmp, path)
+  print(f"Timeline of {len(events)} spans written to {path} (open in https://ui.perfetto.dev)")
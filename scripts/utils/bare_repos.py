@@ -0,0 +1,17 @@
+import subprocess
+
+# Helpers for the tests of the git tools: local bare repos standing in for the students'
+# GitHub repos (the fixtures are in conftest.py)
+
+def run_git(args, cwd):
+    return subprocess.run(["git"] + args, cwd = cwd, capture_output = True, text = True, check = True).stdout.strip()
+
+# Commit a file in a working clone and push it to its origin
+def push_file(work, name, text, message = "update"):
+    path = work / name
+    path.parent.mkdir(parents = True, exist_ok = True)
+    path.write_text(text)
+    run_git(["add", name], work)
+    run_git(["commit", "--quiet", "-m", message], work)
+    run_git(["push", "--quiet", "origin", "HEAD"], work)
+    return run_git(["rev-parse", "HEAD"], work)
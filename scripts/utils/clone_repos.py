@@ -1,8 +1,134 @@
+import argparse
+import shutil
 import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 
-with open('usernames.txt', 'r') as f:
-    for line in f: 
-        username = line.strip()
-        ssh_link = "git@github.com:Plaksha-Uni/shell-" + username + ".git"
-        subprocess.run(["git", "clone", ssh_link], check = True)
-        print(f"{ssh_link} cloned")
\ No newline at end of file
+# Clone or refresh the repo of every student listed in usernames.txt, several at a time.
+# A repo that is already cloned is fetched and fast-forwarded to its upstream branch
+# (unless it has local commits or uncommitted changes, which are left alone);
+# a new one is cloned blobless (history without file contents until checkout) or
+# shallow. A failed clone or fetch is retried with backoff without stopping the others,
+# and the time taken by each repo is reported at the end.
+#
+# Usage: python clone_repos.py [--usernames usernames.txt] [--dest .] [--workers 16]
+#        [--url "git@github.com:Plaksha-Uni/shell-{username}.git"] [--clone-mode blobless|shallow|full]
+
+URL_TEMPLATE = "git@github.com:Plaksha-Uni/shell-{username}.git"
+
+CLONE_FLAGS = {
+    'blobless': ['--filter=blob:none'],
+    'shallow': ['--depth', '1'],
+    'full': [],
+}
+
+class CloneResult:
+    """Outcome of one repo: 'cloned', 'updated', 'up to date', 'diverged', 'dirty' or 'failed'."""
+
+    def __init__(self, username, path, status, seconds, attempts, error = None):
+        self.username = username
+        self.path = path
+        self.status = status
+        self.seconds = seconds
+        self.attempts = attempts
+        self.error = error
+
+def git(args, cwd = None, timeout = None):
+    return subprocess.run(["git"] + args, cwd = cwd, capture_output = True, text = True, timeout = timeout, check = True)
+
+def head(path):
+    return git(["rev-parse", "HEAD"], cwd = path).stdout.strip()
+
+def clone(url, path, mode, timeout):
+    try:
+        git(["clone", "--quiet"] + CLONE_FLAGS[mode] + [url, str(path)], timeout = timeout)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        # Do not leave a partial clone behind for the retry
+        shutil.rmtree(path, ignore_errors = True)
+        raise
+    return 'cloned'
+
+# Fetch the upstream branch and fast-forward to it; a shallow clone stays shallow.
+# Local commits that are not upstream (e.g. pushed feedback) and uncommitted changes
+# to tracked files are left alone.
+def update(path, timeout):
+    before = head(path)
+    depth = ["--depth", "1"] if (path / ".git" / "shallow").exists() else []
+    git(["fetch", "--quiet", "--prune"] + depth + ["origin"], cwd = path, timeout = timeout)
+    if git(["status", "--porcelain", "--untracked-files=no"], cwd = path).stdout.strip():
+        return 'dirty'
+    try:
+        git(["merge", "--quiet", "--ff-only", "@{upstream}"], cwd = path)
+    except subprocess.CalledProcessError:
+        return 'diverged'
+    return 'updated' if head(path) != before else 'up to date'
+
+def sync_repo(username, url, path, mode, retries, timeout):
+    start = time.perf_counter()
+    error = None
+    for attempt in range(1, retries + 2):
+        try:
+            if (path / ".git").exists():
+                status = update(path, timeout)
+            else:
+                status = clone(url, path, mode, timeout)
+            return CloneResult(username, path, status, time.perf_counter() - start, attempt)
+        except subprocess.CalledProcessError as e:
+            lines = (e.stderr or '').strip().splitlines()
+            error = ([line for line in lines if line.startswith('fatal:')] or lines or [str(e)])[0]
+        except subprocess.TimeoutExpired:
+            error = f"timed out after {timeout}s"
+        if attempt <= retries:
+            time.sleep(min(30, 2 ** (attempt - 1)))
+    return CloneResult(username, path, 'failed', time.perf_counter() - start, retries + 1, error)
+
+def read_usernames(filename):
+    with open(filename, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def repo_name(url):
+    name = url.rstrip('/').rsplit('/', 1)[-1].rsplit(':', 1)[-1]
+    return name[:-4] if name.endswith('.git') else name
+
+def main():
+    parser = argparse.ArgumentParser(description = "Clone or update the repo of every student, in parallel")
+    parser.add_argument("--usernames", default = "usernames.txt", help = "File with one GitHub username per line")
+    parser.add_argument("--url", default = URL_TEMPLATE, help = "Repo URL template with {username} (a local bare repo path works too)")
+    parser.add_argument("--dest", default = ".", help = "Directory the repos are cloned into")
+    parser.add_argument("--workers", type = int, default = 16, help = "Repos cloned or fetched concurrently")
+    parser.add_argument("--clone-mode", choices = sorted(CLONE_FLAGS), default = "blobless", help = "How new repos are cloned")
+    parser.add_argument("--retries", type = int, default = 3, help = "Retries of a failed clone or fetch")
+    parser.add_argument("--timeout", type = int, default = 300, help = "Seconds before a single git command is abandoned")
+    args = parser.parse_args()
+
+    dest = Path(args.dest)
+    dest.mkdir(parents = True, exist_ok = True)
+    usernames = read_usernames(args.usernames)
+    start = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers = args.workers) as executor:
+        futures = []
+        for username in usernames:
+            url = args.url.format(username = username)
+            futures.append(executor.submit(sync_repo, username, url, dest / repo_name(url), args.clone_mode, args.retries, args.timeout))
+        for done, future in enumerate(as_completed(futures), start = 1):
+            result = future.result()
+            results.append(result)
+            detail = f": {result.error}" if result.error else ""
+            print(f"[{done}/{len(usernames)}] {result.status}: {result.path} ({result.seconds:.1f}s, {result.attempts} attempts){detail}", flush = True)
+
+    print(f"\n{'repo':<40} {'status':<11} {'seconds':>8} {'attempts':>8}")
+    for result in sorted(results, key = lambda result: result.seconds, reverse = True):
+        print(f"{str(result.path):<40} {result.status:<11} {result.seconds:>8.1f} {result.attempts:>8}")
+    counts = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+    summary = ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+    print(f"\n{len(results)} repos in {time.perf_counter() - start:.1f}s: {summary}")
+    if counts.get('failed'):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
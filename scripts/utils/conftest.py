@@ -0,0 +1,26 @@
+import pytest
+
+from bare_repos import push_file, run_git
+
+# Commits with a fixed identity, and no user or system git config
+@pytest.fixture(autouse = True)
+def git_env(monkeypatch, tmp_path):
+    for role in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{role}_NAME", "Test")
+        monkeypatch.setenv(f"GIT_{role}_EMAIL", "test@example.com")
+    monkeypatch.setenv("GIT_CONFIG_GLOBAL", str(tmp_path / "gitconfig"))
+    monkeypatch.setenv("GIT_CONFIG_NOSYSTEM", "1")
+
+# make_remote(name) creates remotes/<name>.git with a first commit on main and returns
+# (bare repo, working clone used to push further commits upstream)
+@pytest.fixture
+def make_remote(tmp_path):
+    def make(name):
+        bare = tmp_path / "remotes" / f"{name}.git"
+        run_git(["init", "--quiet", "--bare", "-b", "main", str(bare)], tmp_path)
+        work = tmp_path / "upstream" / name
+        run_git(["clone", "--quiet", str(bare), str(work)], tmp_path)
+        run_git(["checkout", "--quiet", "-b", "main"], work)
+        push_file(work, "shell/wish.c", "int main(void) { return 0; }\n", "starter code")
+        return bare, work
+    return make
@@ -0,0 +1,177 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Return the feedback files to the students' repos, several repos at a time. Each
+# OUTPUT_DIR/<username>_feedback_wish.c is committed as shell/<username>_feedback_wish.c
+# on the `feedback` branch of SUBMISSIONS_DIR/shell-<username> and pushed to origin.
+#
+# The commit is built with plumbing commands (hash-object, a temporary index, write-tree,
+# commit-tree), so the checked-out branch of the clone is never touched, nor its working
+# tree unless --copy also puts the file there. An existing `feedback` branch (on origin
+# or local) gets a new commit on top; the one on origin is preferred, so that the push
+# is a fast-forward even after an earlier --no-push run committed locally. If the file
+# is already there with the same content nothing is committed, so running the tool
+# again is harmless. Fetches and pushes are retried per repo, and every repo reports
+# its status.
+#
+# Usage: python scripts/utils/distribute_feedback.py [--workers 16] [--no-push] [--copy]
+# (OUTPUT_DIR and SUBMISSIONS_DIR are read from config.env)
+
+BRANCH = "feedback"
+MESSAGE = "feedback on your shell assignment"
+FEEDBACK_SUFFIX = "_feedback_wish.c"
+
+class DistributeResult:
+    """Outcome of one repo: 'pushed', 'committed', 'unchanged', 'skipped' or 'failed'."""
+
+    def __init__(self, username, repo, status, seconds, attempts = 1, detail = None):
+        self.username = username
+        self.repo = repo
+        self.status = status
+        self.seconds = seconds
+        self.attempts = attempts
+        self.detail = detail
+
+def git(args, repo, env = None):
+    return subprocess.run(["git"] + args, cwd = repo, capture_output = True, text = True, check = True,
+                          env = dict(os.environ, **env) if env else None).stdout.strip()
+
+def ref_exists(repo, ref):
+    try:
+        git(["rev-parse", "--verify", "--quiet", ref + "^{commit}"], repo)
+        return True
+    except subprocess.CalledProcessError:
+        return False
+
+def default_branch(repo):
+    try:
+        return git(["symbolic-ref", "--short", "refs/remotes/origin/HEAD"], repo).split('/', 1)[1]
+    except subprocess.CalledProcessError:
+        return "main"
+
+# Commit to build on: the feedback branch on origin, else the local one, else the tip of
+# the default branch
+def parent_commit(repo):
+    for ref in (f"refs/remotes/origin/{BRANCH}", f"refs/heads/{BRANCH}", f"refs/remotes/origin/{default_branch(repo)}", "HEAD"):
+        if ref_exists(repo, ref):
+            return git(["rev-parse", ref], repo)
+    raise RuntimeError("repo has no commits")
+
+# Commit feedback_file as path_in_repo on top of the parent, without a checkout; returns
+# the new commit, or None when the parent already has the same content
+def commit_feedback(repo, feedback_file, path_in_repo):
+    parent = parent_commit(repo)
+    blob = git(["hash-object", "-w", str(Path(feedback_file).resolve())], repo)
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {"GIT_INDEX_FILE": str(Path(tmp) / "index")}
+        git(["read-tree", parent], repo, env)
+        git(["update-index", "--add", "--cacheinfo", f"100644,{blob},{path_in_repo}"], repo, env)
+        tree = git(["write-tree"], repo, env)
+    if tree == git(["rev-parse", f"{parent}^{{tree}}"], repo):
+        # A local branch with the same content on another commit (e.g. from a --no-push
+        # run before origin got the feedback) would not fast-forward; move it to the parent
+        if ref_exists(repo, f"refs/heads/{BRANCH}"):
+            git(["update-ref", f"refs/heads/{BRANCH}", parent], repo)
+        return None
+    commit = git(["commit-tree", tree, "-p", parent, "-m", MESSAGE], repo)
+    git(["update-ref", f"refs/heads/{BRANCH}", commit], repo)
+    return commit
+
+# Put the feedback file into the clone's working tree as well (shell/<name>)
+def copy_feedback(repo, feedback_file):
+    dest_dir = repo / "shell"
+    os.makedirs(dest_dir, exist_ok = True)
+    shutil.copy2(feedback_file, dest_dir / Path(feedback_file).name)
+
+# Run step, retrying a failing git command with backoff; returns (result, attempts)
+def with_retries(step, retries):
+    for attempt in range(1, retries + 2):
+        try:
+            return step(), attempt
+        except subprocess.CalledProcessError:
+            if attempt > retries:
+                raise
+            time.sleep(min(30, 2 ** (attempt - 1)))
+
+def distribute(username, repo, feedback_file, push, retries, copy = False):
+    start = time.perf_counter()
+    attempts = 0
+    try:
+        if not (repo / ".git").exists():
+            return DistributeResult(username, repo, 'skipped', time.perf_counter() - start, 0, "repository not found")
+        if push:
+            _, attempts = with_retries(lambda: git(["fetch", "--quiet", "origin"], repo), retries)
+        commit = commit_feedback(repo, feedback_file, f"shell/{Path(feedback_file).name}")
+        if copy:
+            copy_feedback(repo, feedback_file)
+        if push:
+            # The branch may also be unchanged here but not yet on origin (an earlier push failed)
+            local = git(["rev-parse", f"refs/heads/{BRANCH}"], repo) if ref_exists(repo, f"refs/heads/{BRANCH}") else None
+            remote = git(["rev-parse", f"refs/remotes/origin/{BRANCH}"], repo) if ref_exists(repo, f"refs/remotes/origin/{BRANCH}") else None
+            if local and local != remote:
+                _, pushed = with_retries(lambda: git(["push", "--quiet", "origin", f"refs/heads/{BRANCH}:refs/heads/{BRANCH}"], repo), retries)
+                attempts = max(attempts, pushed)
+                return DistributeResult(username, repo, 'pushed', time.perf_counter() - start, attempts)
+        status = 'committed' if commit else 'unchanged'
+        return DistributeResult(username, repo, status, time.perf_counter() - start, max(attempts, 1))
+    except (subprocess.CalledProcessError, RuntimeError, OSError) as e:
+        lines = (getattr(e, 'stderr', None) or '').strip().splitlines()
+        detail = ([line for line in lines if line.startswith(('fatal:', 'error:'))] or lines or [str(e)])[0]
+        return DistributeResult(username, repo, 'failed', time.perf_counter() - start, max(attempts, 1), detail)
+
+# (username, feedback file) of every feedback file in output_dir
+def feedback_files(output_dir):
+    return [(path.name.split('_')[0], path) for path in sorted(Path(output_dir).glob(f"*{FEEDBACK_SUFFIX}"))]
+
+def main():
+    load_dotenv(dotenv_path = "config.env")
+    parser = argparse.ArgumentParser(description = "Commit the feedback files to the students' repos and push them, in parallel")
+    parser.add_argument("--output-dir", default = os.getenv('OUTPUT_DIR'), help = "Directory of the <username>_feedback_wish.c files (default: OUTPUT_DIR)")
+    parser.add_argument("--submissions-dir", default = os.getenv('SUBMISSIONS_DIR'), help = "Directory of the shell-<username> clones (default: SUBMISSIONS_DIR)")
+    parser.add_argument("--workers", type = int, default = 16, help = "Repos processed concurrently")
+    parser.add_argument("--retries", type = int, default = 3, help = "Retries of a failed fetch or push")
+    parser.add_argument("--no-push", action = "store_true", help = "Only commit to the local feedback branch")
+    parser.add_argument("--copy", action = "store_true", help = "Also copy each file into the shell/ directory of the clone's working tree")
+    args = parser.parse_args()
+
+    for name, directory in (("Output", args.output_dir), ("Submissions", args.submissions_dir)):
+        if not directory or not Path(directory).is_dir():
+            print(f"Error: {name} directory '{directory}' does not exist.")
+            sys.exit(1)
+    files = feedback_files(args.output_dir)
+    if not files:
+        print(f"No feedback files found in {args.output_dir}.")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers = args.workers) as executor:
+        futures = [executor.submit(distribute, username, Path(args.submissions_dir) / f"shell-{username}", path, not args.no_push, args.retries, args.copy)
+                   for username, path in files]
+        for done, future in enumerate(as_completed(futures), start = 1):
+            result = future.result()
+            results.append(result)
+            detail = f": {result.detail}" if result.detail else ""
+            print(f"[{done}/{len(files)}] {result.status}: {result.username} ({result.seconds:.1f}s, {result.attempts} attempts){detail}", flush = True)
+
+    counts = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+    summary = ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+    print(f"\n{len(results)} repos in {time.perf_counter() - start:.1f}s: {summary}")
+    for result in sorted(results, key = lambda result: result.username):
+        if result.status in ('failed', 'skipped'):
+            print(f"  {result.status}: {result.username} ({result.repo}): {result.detail}")
+    if counts.get('failed'):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
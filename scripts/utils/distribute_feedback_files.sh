@@ -1,59 +1,5 @@
 #!/bin/bash
 
-source config.env
-
-# Check if the source directory exists
-if [ ! -d "$OUTPUT_DIR" ]; then
-    echo "Error: Source directory '$OUTPUT_DIR' does not exist."
-    exit 1
-fi
-
-# Check if the submissions directory exists
-if [ ! -d "$SUBMISSIONS_DIR" ]; then
-    echo "Error: Submissions directory '$SUBMISSIONS_DIR' does not exist."
-    exit 1
-fi
-
-# Process each feedback file
-for feedback_file in "$OUTPUT_DIR"/*_feedback_wish.c; do
-    # Check if files exist
-    if [ ! -f "$feedback_file" ]; then
-        echo "No feedback files found in $OUTPUT_DIR."
-        exit 1
-    fi
-    
-    # Extract the GitHub username from the filename
-    filename=$(basename "$feedback_file")
-    github_username=$(echo "$filename" | cut -d'_' -f1)
-    
-    # Construct the destination path
-    repo_dir="$SUBMISSIONS_DIR/shell-$github_username"
-    dest_dir="$repo_dir/shell"
-    
-    echo "Processing $filename for user $github_username"
-    
-    # Check if the repository directory exists
-    if [ ! -d "$repo_dir" ]; then
-        echo "Warning: Repository directory '$repo_dir' does not exist. Skipping..."
-        continue
-    fi
-    
-    # Create the shell subdirectory if it doesn't exist
-    if [ ! -d "$dest_dir" ]; then
-        echo "Creating directory: $dest_dir"
-        mkdir -p "$dest_dir"
-    fi
-    
-    # Copy the feedback file to the destination
-    echo "Copying $feedback_file to $dest_dir/"
-    cp "$feedback_file" "$dest_dir/"
-    
-    # Verify the copy operation
-    if [ $? -eq 0 ]; then
-        echo "Successfully copied $filename to $dest_dir/"
-    else
-        echo "Error: Failed to copy $filename to $dest_dir/"
-    fi
-done
-
-echo "Process completed."
\ No newline at end of file
+# Copy each feedback file into the shell/ directory of its student's repo and commit it
+# to the local `feedback` branch, without pushing (see distribute_feedback.py)
+python3 "$(dirname "$0")/distribute_feedback.py" --no-push --copy "$@"
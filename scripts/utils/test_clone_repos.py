@@ -0,0 +1,77 @@
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import clone_repos
+from bare_repos import push_file, run_git
+
+def sync(bare, dest, mode = "blobless", retries = 0):
+    return clone_repos.sync_repo("alice", str(bare), dest / "shell-alice", mode, retries, 60)
+
+@pytest.mark.parametrize("mode", sorted(clone_repos.CLONE_FLAGS))
+def test_fresh_clone(make_remote, tmp_path, mode):
+    bare, work = make_remote("shell-alice")
+    result = sync(bare, tmp_path / "clones", mode)
+    assert (result.status, result.attempts, result.error) == ("cloned", 1, None)
+    clone = tmp_path / "clones" / "shell-alice"
+    assert (clone / "shell" / "wish.c").read_text() == "int main(void) { return 0; }\n"
+    assert clone_repos.head(clone) == run_git(["rev-parse", "HEAD"], work)
+
+@pytest.mark.parametrize("mode", ["blobless", "shallow"])
+def test_fast_forward_then_up_to_date(make_remote, tmp_path, mode):
+    bare, work = make_remote("shell-alice")
+    sync(bare, tmp_path / "clones", mode)
+    upstream = push_file(work, "shell/wish.c", "int main(void) { return 1; }\n")
+    clone = tmp_path / "clones" / "shell-alice"
+    assert sync(bare, tmp_path / "clones", mode).status == "updated"
+    assert clone_repos.head(clone) == upstream
+    assert (clone / "shell" / "wish.c").read_text() == "int main(void) { return 1; }\n"
+    assert sync(bare, tmp_path / "clones", mode).status == "up to date"
+
+def test_diverged_clone_is_left_alone(make_remote, tmp_path):
+    bare, work = make_remote("shell-alice")
+    sync(bare, tmp_path / "clones")
+    clone = tmp_path / "clones" / "shell-alice"
+    (clone / "notes.txt").write_text("local\n")
+    run_git(["add", "notes.txt"], clone)
+    run_git(["commit", "--quiet", "-m", "local work"], clone)
+    local = clone_repos.head(clone)
+    push_file(work, "shell/wish.c", "int main(void) { return 1; }\n")
+    assert sync(bare, tmp_path / "clones").status == "diverged"
+    assert clone_repos.head(clone) == local
+
+def test_dirty_clone_is_left_alone(make_remote, tmp_path):
+    bare, work = make_remote("shell-alice")
+    sync(bare, tmp_path / "clones")
+    clone = tmp_path / "clones" / "shell-alice"
+    before = clone_repos.head(clone)
+    (clone / "shell" / "wish.c").write_text("int main(void) { return 2; }\n")
+    # Upstream changes another file, so a merge would not even conflict
+    push_file(work, "README.md", "Shell assignment\n")
+    assert sync(bare, tmp_path / "clones").status == "dirty"
+    assert clone_repos.head(clone) == before
+    assert (clone / "shell" / "wish.c").read_text() == "int main(void) { return 2; }\n"
+    assert not (clone / "README.md").exists()
+
+def test_missing_remote_retries_and_fails_without_stopping_the_others(make_remote, tmp_path, monkeypatch, capsys):
+    make_remote("shell-alice")
+    make_remote("shell-carol")
+    usernames = tmp_path / "usernames.txt"
+    usernames.write_text("alice\nghost\ncarol\n")
+    delays = []
+    monkeypatch.setattr(clone_repos, "time", SimpleNamespace(perf_counter = time.perf_counter, sleep = delays.append))
+    monkeypatch.setattr(sys, "argv", ["clone_repos.py", "--usernames", str(usernames), "--dest", str(tmp_path / "clones"),
+                                      "--url", str(tmp_path / "remotes" / "shell-{username}.git"), "--retries", "2", "--workers", "2"])
+    with pytest.raises(SystemExit) as exit:
+        clone_repos.main()
+    assert exit.value.code == 1
+    assert delays == [1, 2]
+    out = capsys.readouterr().out
+    assert "failed: " in out and "shell-ghost" in out and "3 attempts" in out
+    assert "2 cloned, 1 failed" in out
+    assert (tmp_path / "clones" / "shell-alice" / "shell" / "wish.c").exists()
+    assert (tmp_path / "clones" / "shell-carol" / "shell" / "wish.c").exists()
+    # The failed clone leaves nothing behind for the next run
+    assert not (tmp_path / "clones" / "shell-ghost").exists()
@@ -0,0 +1,102 @@
+import sys
+
+import pytest
+
+import distribute_feedback
+from bare_repos import run_git
+
+FEEDBACK_PATH = "shell/alice_feedback_wish.c"
+
+@pytest.fixture
+def feedback(tmp_path):
+    path = tmp_path / "output" / "alice_feedback_wish.c"
+    path.parent.mkdir()
+    path.write_text("/* feedback v1 */\n")
+    return path
+
+def clone(bare, tmp_path, name = "submissions"):
+    path = tmp_path / name / "shell-alice"
+    run_git(["clone", "--quiet", str(bare), str(path)], tmp_path)
+    return path
+
+def distribute(repo, feedback, push = True):
+    return distribute_feedback.distribute("alice", repo, feedback, push, 0)
+
+def remote_feedback(bare):
+    return run_git(["rev-parse", "refs/heads/feedback"], bare)
+
+def remote_file(bare):
+    return run_git(["show", f"feedback:{FEEDBACK_PATH}"], bare)
+
+def test_first_push(make_remote, tmp_path, feedback):
+    bare, _ = make_remote("shell-alice")
+    repo = clone(bare, tmp_path)
+    head = run_git(["rev-parse", "HEAD"], repo)
+    result = distribute(repo, feedback)
+    assert (result.status, result.detail) == ("pushed", None)
+    assert remote_file(bare) == "/* feedback v1 */"
+    # The new branch starts from the default branch; the checkout is untouched
+    assert run_git(["rev-parse", "feedback^"], bare) == head
+    assert run_git(["rev-parse", "HEAD"], repo) == head
+    assert not (repo / FEEDBACK_PATH).exists()
+
+def test_rerun_commits_nothing(make_remote, tmp_path, feedback):
+    bare, _ = make_remote("shell-alice")
+    repo = clone(bare, tmp_path)
+    distribute(repo, feedback)
+    pushed = remote_feedback(bare)
+    assert distribute(repo, feedback).status == "unchanged"
+    assert distribute(repo, feedback, push = False).status == "unchanged"
+    assert remote_feedback(bare) == pushed
+
+def test_builds_on_the_feedback_branch_of_origin(make_remote, tmp_path, feedback):
+    bare, _ = make_remote("shell-alice")
+    # Another machine pushed earlier feedback
+    distribute(clone(bare, tmp_path, "elsewhere"), feedback)
+    earlier = remote_feedback(bare)
+    repo = clone(bare, tmp_path)
+    feedback.write_text("/* feedback v2 */\n")
+    assert distribute(repo, feedback).status == "pushed"
+    assert run_git(["rev-parse", "feedback^"], bare) == earlier
+    assert remote_file(bare) == "/* feedback v2 */"
+
+def test_push_after_no_push(make_remote, tmp_path, feedback):
+    bare, _ = make_remote("shell-alice")
+    repo = clone(bare, tmp_path)
+    assert distribute(repo, feedback, push = False).status == "committed"
+    local = run_git(["rev-parse", "feedback"], repo)
+    assert distribute(repo, feedback).status == "pushed"
+    assert remote_feedback(bare) == local
+
+def test_push_after_no_push_when_origin_has_the_same_content(make_remote, tmp_path, feedback, monkeypatch):
+    bare, _ = make_remote("shell-alice")
+    repo = clone(bare, tmp_path)
+    assert distribute(repo, feedback, push = False).status == "committed"
+    # The same feedback reaches origin from elsewhere as another commit
+    monkeypatch.setenv("GIT_COMMITTER_DATE", "2020-01-01T00:00:00")
+    distribute(clone(bare, tmp_path, "elsewhere"), feedback)
+    assert run_git(["rev-parse", "feedback"], repo) != remote_feedback(bare)
+
+    result = distribute(repo, feedback)
+    assert (result.status, result.detail) == ("unchanged", None)
+    assert run_git(["rev-parse", "feedback"], repo) == remote_feedback(bare)
+    # and new feedback after that is a fast-forward
+    feedback.write_text("/* feedback v2 */\n")
+    assert distribute(repo, feedback).status == "pushed"
+    assert remote_file(bare) == "/* feedback v2 */"
+
+def test_missing_repo_is_skipped(tmp_path, feedback):
+    result = distribute(tmp_path / "submissions" / "shell-alice", feedback)
+    assert (result.status, result.detail) == ("skipped", "repository not found")
+
+def test_no_push_with_copy_from_the_command_line(make_remote, tmp_path, feedback, monkeypatch, capsys):
+    bare, _ = make_remote("shell-alice")
+    repo = clone(bare, tmp_path)
+    monkeypatch.setattr(sys, "argv", ["distribute_feedback.py", "--output-dir", str(feedback.parent),
+                                      "--submissions-dir", str(tmp_path / "submissions"), "--no-push", "--copy"])
+    distribute_feedback.main()
+    assert "1 committed" in capsys.readouterr().out
+    assert (repo / FEEDBACK_PATH).read_text() == "/* feedback v1 */\n"
+    assert run_git(["show", f"feedback:{FEEDBACK_PATH}"], repo) == "/* feedback v1 */"
+    with pytest.raises(Exception):
+        remote_feedback(bare)